@@ -0,0 +1,81 @@
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Float baht columns replaced by integer satang columns, per table
+AMOUNT_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "orders": [("amount", "amount_satang")],
+    "transactions": [("amount", "amount_satang")],
+    "slip_verifications": [
+        ("qr_amount", "qr_amount_satang"),
+        ("ocr_amount", "ocr_amount_satang"),
+        ("amount_difference", "amount_difference_satang"),
+        ("order_amount", "order_amount_satang"),
+    ],
+}
+# Columns the models declare NOT NULL (enforced after the backfill; PostgreSQL only,
+# SQLite cannot add a constraint to an existing column)
+NOT_NULL = {("orders", "amount_satang"), ("transactions", "amount_satang")}
+
+
+def migrate_amounts_to_satang(engine: Engine, batch_size: int = 10000) -> int:
+    """
+    Move float baht amounts to integer satang columns in place
+
+    For each table still holding a float column: add its satang column,
+    backfill it with ROUND(amount * 100) in batches of batch_size rows
+    (one short transaction each, so a large table is not locked for the
+    whole backfill), then drop the float column. Applied as migration
+    0002_amounts_to_satang by migrations.run_migrations.
+
+    Safe to run on every startup: tables already migrated (or created with
+    satang columns) are skipped. Returns the number of values backfilled.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    postgres = engine.dialect.name == "postgresql"
+    backfilled = 0
+
+    for table, pairs in AMOUNT_COLUMNS.items():
+        if table not in tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        pending = [(old, new) for old, new in pairs if old in columns]
+        if not pending:
+            continue
+
+        with engine.begin() as connection:
+            for old, new in pending:
+                if new not in columns:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} BIGINT"))
+
+        for old, new in pending:
+            while True:
+                with engine.begin() as connection:
+                    rows = connection.execute(text(
+                        f"UPDATE {table} SET {new} = CAST(ROUND({old} * 100) AS BIGINT) "
+                        f"WHERE id IN (SELECT id FROM {table} WHERE {new} IS NULL AND {old} IS NOT NULL LIMIT :batch)"
+                    ), {"batch": batch_size}).rowcount
+                if not rows:
+                    break
+                backfilled += rows
+                logger.info(f"Backfilled {rows} {table}.{new} values")
+
+        with engine.begin() as connection:
+            for old, new in pending:
+                if postgres and (table, new) in NOT_NULL:
+                    connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {new} SET NOT NULL"))
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+        logger.info(f"✓ {table}: {', '.join(old for old, _ in pending)} moved to satang")
+    return backfilled
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Backfilled {migrate_amounts_to_satang(engine)} amounts")
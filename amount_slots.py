@@ -0,0 +1,218 @@
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import AmountSlot, Order, OrderStatus
+from money import format_baht
+from order_expiry import expire_due
+
+logger = logging.getLogger(__name__)
+
+CENT_SLOTS = range(1, 100)  # .01 - .99; the base amount itself is never issued
+
+
+class AmountSlotsExhausted(ValueError):
+    """Raised when every slot of a base amount and its spill-over bands is pending"""
+
+
+class AmountSlotAllocator:
+    """
+    Collision-free unique amounts for pending orders
+
+    The amount_slots table is the source of truth: its primary key is the
+    amount in satang, so two workers can never both hold one. Each process
+    keeps a shuffled free list per band (the 99 slots above a base amount)
+    as a hint, loaded from the table with one range query when the band is
+    first used or runs dry. Allocating pops a hint and inserts it with ON
+    CONFLICT DO NOTHING; a slot another worker took meanwhile just comes
+    back missing, the band's hints are reloaded and the order draws again.
+    Freeing deletes the row.
+
+    When a band is full, stale pending orders are expired first, then the
+    allocation spills over to the same cents one baht higher, up to
+    spill_baht bands.
+    """
+
+    def __init__(self, spill_baht: int = 5, expire_batch: int = 500, refresh_interval: float = 1.0):
+        self.spill_baht = spill_baht
+        self.expire_batch = expire_batch
+        self.refresh_interval = refresh_interval  # min seconds between reloads of a dry band
+        self._free: Dict[int, List[int]] = {}
+        self._refreshed_at: Dict[int, float] = {}
+        self.allocations = 0
+        self.conflicts = 0
+        self.refreshes = 0
+        self.spills = 0
+        self.released = 0
+        self.expired = 0
+
+    @classmethod
+    def from_settings(cls) -> "AmountSlotAllocator":
+        return cls(
+            spill_baht=settings.AMOUNT_SLOT_SPILL_BAHT,
+            expire_batch=settings.ORDER_EXPIRY_BATCH_SIZE,
+        )
+
+    def _refresh(self, db: Session, start: int, drawn: Set[int]) -> List[int]:
+        """Reload the free slots of the band above start from the table, less those drawn but not yet inserted"""
+        taken = {
+            amount for (amount,) in db.query(AmountSlot.amount_satang).filter(
+                AmountSlot.amount_satang > start,
+                AmountSlot.amount_satang < start + 100
+            )
+        }
+        taken |= drawn
+        free = [start + cents for cents in CENT_SLOTS if start + cents not in taken]
+        random.shuffle(free)
+        self._free[start] = free
+        self._refreshed_at[start] = time.monotonic()
+        self.refreshes += 1
+        return free
+
+    def _draw(self, db: Session, base: int, refreshed: Set[int], drawn: Set[int]) -> Optional[Tuple[int, int]]:
+        """(band start, slot) free as far as this process knows, or None when all bands are full"""
+        for band in range(self.spill_baht + 1):
+            start = base + band * 100
+            free = self._free.get(start)
+            # A full band is re-read at most every refresh_interval; slots other
+            # workers free in between are only seen then
+            if not free and start not in refreshed and \
+                    time.monotonic() - self._refreshed_at.get(start, float("-inf")) >= self.refresh_interval:
+                free = self._refresh(db, start, drawn)
+                refreshed.add(start)
+            if free:
+                if band:
+                    self.spills += 1
+                slot = free.pop()
+                drawn.add(slot)
+                return start, slot
+        return None
+
+    def reserve(self, db: Session, order_id: str, amount_satang: int) -> int:
+        """Reserve a unique amount for one order; see reserve_many"""
+        return self.reserve_many(db, [(order_id, amount_satang)])[order_id]
+
+    def reserve_many(self, db: Session, orders: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+        """
+        Reserve a unique amount in satang (base amount + random cents) for each order
+
+        Slots are inserted in the caller's transaction, so they are released
+        on rollback and become visible to other workers on commit. One
+        multi-row insert per round; rounds repeat only for lost races.
+
+        Args:
+            orders: (order_id, base amount in satang) pairs with distinct order_ids
+
+        Raises:
+            AmountSlotsExhausted: a base amount and all its spill bands are full
+        """
+        pending = dict(orders)
+        reserved = {}
+        refreshed: Set[int] = set()
+        drawn: Set[int] = set()
+        reclaimed = False
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+
+        while pending:
+            picks = {}
+            for order_id, base in pending.items():
+                pick = self._draw(db, base, refreshed, drawn)
+                if pick is None and not reclaimed:
+                    reclaimed = True
+                    if self.expire_stale(db):
+                        refreshed.clear()
+                        self._refreshed_at.clear()
+                        pick = self._draw(db, base, refreshed, drawn)
+                if pick is None:
+                    raise AmountSlotsExhausted(
+                        f"No free amount slot for {format_baht(base)} "
+                        f"(or up to {self.spill_baht} baht above it)"
+                    )
+                picks[order_id] = pick
+
+            now = datetime.utcnow()
+            statement = dialect.insert(AmountSlot).values([
+                {"amount_satang": slot, "order_id": order_id, "created_at": now}
+                for order_id, (_, slot) in picks.items()
+            ]).on_conflict_do_nothing(
+                index_elements=[AmountSlot.amount_satang]
+            ).returning(AmountSlot.amount_satang, AmountSlot.order_id)
+            won = dict(db.execute(statement).all())
+
+            for order_id, (start, slot) in picks.items():
+                if won.get(slot) == order_id:
+                    reserved[order_id] = slot
+                    del pending[order_id]
+                else:
+                    # Another worker has been allocating from this band; reload it
+                    self._free.pop(start, None)
+                    self._refreshed_at.pop(start, None)
+                    refreshed.discard(start)
+            self.allocations += len(won)
+            self.conflicts += len(picks) - len(won)
+
+        return reserved
+
+    def release(self, db: Session, order_ids: Iterable[str]):
+        """
+        Free the slots of orders that left pending (completed, failed, expired); the caller commits
+
+        Freed slots go back to the end of this process's free list for
+        their band (a whole-baht base amount), so they are reissued last:
+        a late slip for the old order is unlikely to meet a new one.
+        """
+        order_ids = list(order_ids)
+        if not order_ids:
+            return
+        freed = db.execute(
+            delete(AmountSlot).where(AmountSlot.order_id.in_(order_ids)).returning(AmountSlot.amount_satang)
+        ).scalars().all()
+        for slot in freed:
+            free = self._free.get(slot - slot % 100)
+            if free is not None and slot % 100 and slot not in free:
+                free.insert(0, slot)
+        self.released += len(freed)
+
+    def expire_stale(self, db: Session) -> int:
+        """
+        Expire pending orders past their expires_at and free their slots
+
+        Runs when a band is full, so abandoned checkouts do not push new
+        orders into higher bands before the next background sweep
+        (order_expiry.py) gets to them. One batch of up to expire_batch
+        orders. Returns the number of orders expired.
+        """
+        stale = [order_id for _, order_id in expire_due(db, self.expire_batch)]
+        if not stale:
+            return 0
+        self.release(db, stale)
+        self.expired += len(stale)
+        logger.info(f"Expired {len(stale)} pending orders past their expiry")
+        return len(stale)
+
+    def match(self, db: Session, amount_satang: int) -> Optional[Order]:
+        """The pending order holding this exact amount, if any"""
+        return db.query(Order).join(
+            AmountSlot, AmountSlot.order_id == Order.order_id
+        ).filter(
+            AmountSlot.amount_satang == amount_satang,
+            Order.status == OrderStatus.pending
+        ).first()
+
+    def stats(self) -> Dict:
+        return {
+            "bands_cached": len(self._free),
+            "allocations": self.allocations,
+            "conflicts": self.conflicts,
+            "refreshes": self.refreshes,
+            "spills": self.spills,
+            "released": self.released,
+            "expired": self.expired,
+        }
@@ -0,0 +1,69 @@
+from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Index, Integer, MetaData, String, Table
+from sqlalchemy.engine import Engine
+
+# The schema as first deployed, before versioned migrations. Migration 0001 creates it and
+# every later change is a migration of its own. Frozen: change models.py and add a migration,
+# or databases created before and after the edit would differ
+metadata = MetaData()
+
+ORDER_STATUSES = Enum("pending", "completed", "failed", "expired", name="orderstatus")
+TRANSACTION_STATUSES = Enum("pending_slip", "matched", "verified", "failed", name="transactionstatus")
+VERIFICATION_STATUSES = Enum(
+    "pending", "verified", "rejected", "manual_review", "approved_by_admin", name="verificationstatus"
+)
+
+orders = Table(
+    "orders", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", String(100), unique=True, index=True, nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("status", ORDER_STATUSES, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime),
+    Index("idx_order_id_status", "order_id", "status"),
+)
+
+transactions = Table(
+    "transactions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("ref_id", String(255), unique=True, index=True, nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("bank_id", String(50), nullable=True),
+    Column("status", TRANSACTION_STATUSES, nullable=False),
+    Column("matched_order_id", Integer, ForeignKey("orders.id"), nullable=True, index=True),
+    Column("notification_text", String(500), nullable=True),
+    Column("slip_image_path", String(255), nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime),
+    Index("idx_ref_id_status", "ref_id", "status"),
+)
+
+slip_verifications = Table(
+    "slip_verifications", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("transaction_id", Integer, ForeignKey("transactions.id"), unique=True, nullable=False, index=True),
+    Column("qr_found", Boolean),
+    Column("qr_data", String(500), nullable=True),
+    Column("qr_amount", Float, nullable=True),
+    Column("qr_ref_id", String(255), nullable=True),
+    Column("ocr_text", String(2000), nullable=True),
+    Column("ocr_amount", Float, nullable=True),
+    Column("ocr_ref_id", String(255), nullable=True),
+    Column("amounts_match", Boolean),
+    Column("amount_difference", Float, nullable=True),
+    Column("order_amount", Float, nullable=True),
+    Column("status", VERIFICATION_STATUSES, nullable=False),
+    Column("confidence", String(20), nullable=True),
+    Column("rejection_reason", String(255), nullable=True),
+    Column("approved_by", String(100), nullable=True),
+    Column("admin_notes", String(500), nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("verified_at", DateTime, nullable=True),
+    Column("updated_at", DateTime),
+    Index("idx_status_created", "status", "created_at"),
+)
+
+
+def create_baseline(engine: Engine):
+    """The baseline tables that do not exist yet (migration 0001)"""
+    metadata.create_all(bind=engine)
@@ -0,0 +1,120 @@
+"""
+Synthetic slip images for benchmarks
+
+Renders a phone-photo sized slip (text block + PromptPay QR) so the
+benchmarks can run without a real slip corpus.
+"""
+
+import random
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+import qrcode
+
+from money import to_satang
+from payment_service import PromptPayQRGenerator
+
+
+def render_qr(payload: str, box_size: int = 10) -> np.ndarray:
+    """Render payload as a grayscale QR image"""
+    qr = qrcode.QRCode(box_size=box_size, border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return np.array(qr.make_image(fill_color="black", back_color="white").convert("L"))
+
+
+def render_slip(
+    width: int = 4000,
+    height: int = 3000,
+    amount: float = 1500.50,
+    qr_fraction: float = 0.25,
+    rotation: float = 0.0,
+    blur: int = 0,
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, str, Tuple[int, int, int, int]]:
+    """
+    Render a synthetic slip
+
+    Args:
+        width, height: Output size in pixels (4000x3000 = 12 MP)
+        amount: Amount encoded in the QR payload
+        qr_fraction: QR side length as a fraction of the shorter image side
+        rotation: Whole-photo rotation in degrees
+        blur: Gaussian blur kernel size (0 = sharp)
+        seed: Random seed for QR placement and background noise
+
+    Returns:
+        (BGR image, QR payload, QR box (x, y, w, h) before rotation)
+    """
+    rng = random.Random(seed)
+    canvas = np.full((height, width, 3), 235, dtype=np.uint8)
+    noise = np.random.default_rng(seed).integers(0, 20, size=(height, width, 1), dtype=np.uint8)
+    canvas -= noise
+
+    scale = max(width, height) / 1000.0
+    lines = ["Transfer successful", f"Amount {amount:,.2f} THB", "Ref 004999012726757", "12 Oct 2024 12:00"]
+    for i, line in enumerate(lines):
+        cv2.putText(
+            canvas, line, (int(60 * scale), int((80 + 60 * i) * scale)),
+            cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale / 2, (30, 30, 30), max(1, int(scale)), cv2.LINE_AA,
+        )
+
+    payload = PromptPayQRGenerator.generate_qr_payload("0812345678", to_satang(amount))
+    qr = render_qr(payload)
+    side = int(min(width, height) * qr_fraction)
+    qr = cv2.resize(qr, (side, side), interpolation=cv2.INTER_NEAREST)
+    x = rng.randint(width // 2, width - side - 1)
+    y = rng.randint(height // 3, height - side - 1)
+    canvas[y:y + side, x:x + side] = qr[:, :, None]
+
+    if rotation:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1.0)
+        canvas = cv2.warpAffine(canvas, matrix, (width, height), borderValue=(235, 235, 235))
+    if blur:
+        canvas = cv2.GaussianBlur(canvas, (blur | 1, blur | 1), 0)
+
+    return canvas, payload, (x, y, side, side)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return encoded.tobytes()
+
+
+def make_slip(
+    width: int = 4000,
+    height: int = 3000,
+    amount: float = 1500.50,
+    qr_fraction: float = 0.25,
+    seed: Optional[int] = None,
+    quality: int = 90,
+) -> bytes:
+    """JPEG-encoded synthetic slip (see render_slip)"""
+    image, _, _ = render_slip(width, height, amount, qr_fraction, seed=seed)
+    return encode_jpeg(image, quality)
+
+
+def make_corpus(count: int, seed: int = 0) -> Iterator[Tuple[bytes, str]]:
+    """
+    Varied synthetic slips: phone-photo sizes, QR scale, tilt, blur, compression
+
+    Yields:
+        (JPEG bytes, expected QR payload)
+    """
+    rng = random.Random(seed)
+    sizes = [(4000, 3000), (3000, 4000), (4032, 3024), (1920, 1080), (1080, 2340)]
+    for i in range(count):
+        width, height = rng.choice(sizes)
+        image, payload, _ = render_slip(
+            width,
+            height,
+            amount=round(rng.uniform(10, 50000), 2),
+            qr_fraction=rng.uniform(0.12, 0.35),
+            rotation=rng.choice([0, 0, rng.uniform(-8, 8)]),
+            blur=rng.choice([0, 0, 3, 5]),
+            seed=seed * 100000 + i,
+        )
+        yield encode_jpeg(image, rng.choice([70, 85, 95])), payload
@@ -0,0 +1,124 @@
+"""
+Slip -> pending order lookup: float amount column vs indexed integer satang
+
+Run from the repository root (DATABASE_URL picks the database; defaults
+to a throwaway SQLite file):
+    python -m benchmarks.bench_amount_match [--orders N] [--pending P] [--lookups L]
+
+Fills two order tables with the same N orders, P of them pending:
+
+1. legacy_orders: the schema before satang, a Float amount column with
+   only the (order_id, status) index, queried the way verify_slip did
+   (status = pending AND amount = <QR amount parsed with float()>).
+2. orders: amount_satang BIGINT with the pending-only (amount_satang,
+   created_at) index, queried with the QR amount parsed to satang by
+   money.parse_satang.
+
+Reports lookups per second and checks both find the same orders. Also
+times parsing the QR amount string (float() vs parse_satang).
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_amount_match.db"
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table, insert, select  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import PENDING_ORDER, Order, OrderStatus  # noqa: E402
+from money import format_baht, parse_satang  # noqa: E402
+
+legacy_metadata = MetaData()
+legacy_orders = Table(
+    "legacy_orders", legacy_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("order_id", String(100), unique=True, index=True, nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("status", String(9), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Index("idx_legacy_order_id_status", "order_id", "status"),
+)
+
+
+def fill(count: int, pending: int, seed: int = 0):
+    """Same orders in both tables; returns the QR amount strings of the pending ones"""
+    legacy_metadata.drop_all(bind=engine)
+    Base.metadata.drop_all(bind=engine, tables=[Order.__table__])
+    legacy_metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=engine, tables=[Order.__table__])
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    pending_ids = set(rng.sample(range(count), pending))
+    amounts = rng.sample(range(100, 10_000_000), count)
+    rows = [
+        (f"O{i}", amounts[i], OrderStatus.pending if i in pending_ids else OrderStatus.completed)
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        for start in range(0, count, 5000):
+            batch = rows[start:start + 5000]
+            connection.execute(insert(legacy_orders), [
+                {"order_id": order_id, "amount": satang / 100, "status": status.value, "created_at": now}
+                for order_id, satang, status in batch
+            ])
+            connection.execute(insert(Order), [
+                {"order_id": order_id, "amount_satang": satang, "status": status, "created_at": now}
+                for order_id, satang, status in batch
+            ])
+    return [format_baht(satang) for _, satang, status in rows if status == OrderStatus.pending]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--pending", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    qr_amounts = fill(args.orders, args.pending)
+    rng = random.Random(1)
+    lookups = [rng.choice(qr_amounts) for _ in range(args.lookups)]
+    print(f"{args.orders:,} orders ({args.pending} pending), {args.lookups} lookups, {engine.dialect.name}")
+
+    db = SessionLocal()
+    try:
+        legacy_query = select(legacy_orders.c.order_id).where(legacy_orders.c.status == OrderStatus.pending.value)
+        start = time.perf_counter()
+        legacy_found = [
+            db.execute(legacy_query.where(legacy_orders.c.amount == float(text)).limit(1)).scalar()
+            for text in lookups
+        ]
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        satang_found = [
+            db.query(Order.order_id).filter(
+                Order.status == PENDING_ORDER, Order.amount_satang == parse_satang(text)
+            ).limit(1).scalar()
+            for text in lookups
+        ]
+        satang_seconds = time.perf_counter() - start
+    finally:
+        db.close()
+
+    assert satang_found == legacy_found and None not in satang_found, "lookups disagree"
+    print(f"  float amount, unindexed   {args.lookups / legacy_seconds:>10,.0f} lookups/s")
+    print(f"  satang, indexed           {args.lookups / satang_seconds:>10,.0f} lookups/s")
+
+    for label, parse in (("float()", float), ("parse_satang", parse_satang)):
+        start = time.perf_counter()
+        for _ in range(20):
+            for text in lookups:
+                parse(text)
+        print(f"  parse {label:<19} {(time.perf_counter() - start) / (20 * len(lookups)) * 1e9:>10,.0f} ns/amount")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Unique order amounts: add_micro_transaction vs AmountSlotAllocator under load
+
+Run from the repository root (DATABASE_URL picks the database; defaults
+to a throwaway SQLite file):
+    python -m benchmarks.bench_amount_slots [--orders N] [--rate PER_MIN] [--workers W]
+
+Simulates a shop taking orders at a steady rate, priced from a handful of
+popular price points. Most customers pay a few minutes after checkout and
+their order completes; the rest abandon it and it expires after the TTL.
+The same order stream is replayed against:
+
+1. add_micro_transaction: counts orders whose amount was already held by
+   another pending order, i.e. slips the strict matcher can pin on the
+   wrong order.
+2. AmountSlotAllocator against the database, with W allocator instances
+   standing in for W worker processes (each with its own stale free-list
+   hints, sharing the amount_slots table). Every pending amount must stay
+   unique; allocation rate, lost races, refreshes and spills are reported.
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_amount_slots.db"
+
+from amount_slots import AmountSlotAllocator  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import AmountSlot, Order, OrderStatus  # noqa: E402
+from payment_service import PromptPayQRGenerator  # noqa: E402
+
+# (price, weight): a few best sellers dominate, as in a typical catalogue
+PRICE_POINTS = [(99, 30), (199, 20), (299, 12), (100, 10), (150, 8), (499, 8), (59, 6), (999, 6)]
+PAY_PROBABILITY = 0.85
+MEAN_PAY_MINUTES = 4.0
+TTL_MINUTES = 60.0
+
+
+def order_stream(count: int, rate_per_minute: float, seed: int = 0):
+    """(arrival minute, order_id, price, minutes until it leaves pending)"""
+    rng = random.Random(seed)
+    prices, weights = zip(*PRICE_POINTS)
+    now = 0.0
+    for i in range(count):
+        now += rng.expovariate(rate_per_minute)
+        price = rng.choices(prices, weights)[0]
+        if rng.random() < PAY_PROBABILITY:
+            lifetime = min(rng.expovariate(1 / MEAN_PAY_MINUTES), TTL_MINUTES)
+        else:
+            lifetime = TTL_MINUTES
+        yield now, f"O{i}", price, lifetime
+
+
+def replay(stream, on_create, on_leave):
+    """Feed arrivals and departures to the callbacks in time order"""
+    departures = []
+    for arrival, order_id, price, lifetime in stream:
+        while departures and departures[0][0] <= arrival:
+            _, leaving = heapq.heappop(departures)
+            on_leave(leaving)
+        on_create(order_id, price)
+        heapq.heappush(departures, (arrival + lifetime, order_id))
+    while departures:
+        on_leave(heapq.heappop(departures)[1])
+
+
+def legacy(stream):
+    pending = {}
+    held = Counter()
+    stats = {"ambiguous": 0, "peak_pending": 0}
+
+    def create(order_id, price):
+        amount = PromptPayQRGenerator.add_micro_transaction(price)
+        if held[amount]:
+            stats["ambiguous"] += 1
+        held[amount] += 1
+        pending[order_id] = amount
+        stats["peak_pending"] = max(stats["peak_pending"], len(pending))
+
+    def leave(order_id):
+        held[pending.pop(order_id)] -= 1
+
+    replay(stream, create, leave)
+    return stats
+
+
+def allocated(stream, workers: int):
+    Base.metadata.drop_all(bind=engine, tables=[AmountSlot.__table__, Order.__table__])
+    Base.metadata.create_all(bind=engine)
+    allocators = [AmountSlotAllocator(spill_baht=5) for _ in range(workers)]
+    rng = random.Random(1)
+    db = SessionLocal()
+    stats = {"allocate_seconds": 0.0, "allocations": 0, "peak_pending": 0, "checks": 0}
+    pending = set()
+
+    def check_unique():
+        amounts = [amount for (amount,) in db.query(Order.amount_satang).filter(Order.status == OrderStatus.pending)]
+        assert len(amounts) == len(set(amounts)), "duplicate pending amount"
+        stats["checks"] += 1
+
+    def create(order_id, price):
+        allocator = rng.choice(allocators)
+        start = time.perf_counter()
+        amount = allocator.reserve(db, order_id, price * 100)
+        db.add(Order(order_id=order_id, amount_satang=amount, status=OrderStatus.pending, created_at=datetime.utcnow()))
+        db.commit()
+        stats["allocate_seconds"] += time.perf_counter() - start
+        stats["allocations"] += 1
+        pending.add(order_id)
+        stats["peak_pending"] = max(stats["peak_pending"], len(pending))
+        if stats["allocations"] % 1000 == 0:
+            check_unique()
+
+    def leave(order_id):
+        db.query(Order).filter(Order.order_id == order_id).update({Order.status: OrderStatus.completed})
+        rng.choice(allocators).release(db, [order_id])
+        db.commit()
+        pending.discard(order_id)
+
+    try:
+        replay(stream, create, leave)
+        check_unique()
+    finally:
+        db.close()
+
+    totals = Counter()
+    for allocator in allocators:
+        totals.update(allocator.stats())
+    stats.update(totals)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=60.0, help="orders per minute")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    def stream():
+        return order_stream(args.orders, args.rate)
+
+    print(f"{args.orders} orders at {args.rate:g}/min over {len(PRICE_POINTS)} price points, "
+          f"{PAY_PROBABILITY:.0%} paid after ~{MEAN_PAY_MINUTES:g} min, rest expire at {TTL_MINUTES:g} min")
+
+    before = legacy(stream())
+    print(f"\nadd_micro_transaction (peak {before['peak_pending']} pending)")
+    print(f"  ambiguous orders  {before['ambiguous']:>8,}  ({before['ambiguous'] / args.orders:.1%})")
+
+    after = allocated(stream(), args.workers)
+    print(f"\nAmountSlotAllocator, {args.workers} workers, {engine.dialect.name} (peak {after['peak_pending']} pending)")
+    print(f"  ambiguous orders  {0:>8,}  (unique amounts checked {after['checks']} times)")
+    print(f"  reserve + commit  {after['allocations'] / after['allocate_seconds']:>8,.0f}/s")
+    print(f"  lost races        {after['conflicts']:>8,}")
+    print(f"  band refreshes    {after['refreshes']:>8,}  ({after['refreshes'] / after['allocations']:.3f} per order)")
+    print(f"  spilled a baht    {after['spills']:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Order creation: looping /api/payment/generate-qr vs the bulk endpoint
+
+Run from the repository root (DATABASE_URL picks the database; defaults
+to a throwaway SQLite file):
+    python -m benchmarks.bench_bulk_orders [--orders N]
+
+Both paths go through the FastAPI app in-process with TestClient, so the
+numbers include request handling, payload generation and the database
+round trips each endpoint makes.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_bulk_orders.db"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app, engine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=2000)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        run = int(time.time())
+        single = [{"order_id": f"S-{run}-{i}", "amount": 100 + i % 500} for i in range(args.orders)]
+        bulk = [{"order_id": f"B-{run}-{i}", "amount": 100 + i % 500} for i in range(args.orders)]
+
+        start = time.perf_counter()
+        for order in single:
+            assert client.post("/api/payment/generate-qr", json=order).status_code == 200
+        single_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post("/api/payment/generate-qr/bulk", json={"orders": bulk})
+        bulk_elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        assert response.json()["created"] == args.orders
+
+        start = time.perf_counter()
+        repeat = client.post("/api/payment/generate-qr/bulk", json={"orders": bulk})
+        repeat_elapsed = time.perf_counter() - start
+        assert repeat.json()["existing"] == args.orders
+
+    print(f"{args.orders} orders on {engine.dialect.name}")
+    print(f"  single endpoint loop  {single_elapsed:7.2f} s  {args.orders / single_elapsed:>9,.0f} orders/s")
+    print(f"  bulk endpoint         {bulk_elapsed:7.2f} s  {args.orders / bulk_elapsed:>9,.0f} orders/s"
+          f"  (x{single_elapsed / bulk_elapsed:.0f})")
+    print(f"  bulk, all existing    {repeat_elapsed:7.2f} s  {args.orders / repeat_elapsed:>9,.0f} orders/s")
+
+
+if __name__ == "__main__":
+    main()
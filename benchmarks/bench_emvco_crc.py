@@ -0,0 +1,68 @@
+"""
+EMVCo CRC-16: legacy bit-by-bit loop vs emvco (binascii.crc_hqx)
+
+Run from the repository root:
+    python -m benchmarks.bench_emvco_crc [--payloads N]
+
+Times checksum generation (the CRC step of generate_qr_payload) and
+validation (the check parse_promptpay_qr now runs before anything else)
+over N PromptPay payloads with varied accounts and amounts.
+"""
+
+import argparse
+import random
+import time
+
+import emvco
+from payment_service import PromptPayQRGenerator
+
+
+def legacy_crc(data: str) -> str:
+    crc = 0xFFFF
+    for char in data:
+        crc ^= ord(char) << 8
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x10000:
+                crc ^= 0x1021
+            crc &= 0xFFFF
+    return f"{crc:04X}"
+
+
+def legacy_verify(payload: str) -> bool:
+    return payload[-8:-4] == "6304" and payload[-4:] == legacy_crc(payload[:-4])
+
+
+def throughput(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--payloads", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    payloads = [
+        PromptPayQRGenerator.generate_qr_payload(f"08{rng.randrange(10 ** 8):08d}", rng.randrange(100, 5000001))
+        for _ in range(args.payloads)
+    ]
+    bodies = [payload[:-4] for payload in payloads]
+    assert all(legacy_crc(body) == emvco.format_crc(emvco.crc16(body)) for body in bodies[:1000])
+    print(f"{args.payloads} payloads, {sum(map(len, payloads)) / len(payloads):.0f} chars on average")
+
+    rows = [
+        ("generate", lambda body: legacy_crc(body), lambda body: emvco.format_crc(emvco.crc16(body)), bodies),
+        ("validate", legacy_verify, emvco.verify_crc, payloads),
+    ]
+    for label, legacy, current, items in rows:
+        before = throughput(legacy, items)
+        after = throughput(current, items)
+        print(f"  {label:<9} legacy {before:>11,.0f}/s   emvco {after:>11,.0f}/s   x{after / before:.0f}")
+
+
+if __name__ == "__main__":
+    main()
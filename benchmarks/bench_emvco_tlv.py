@@ -0,0 +1,65 @@
+"""
+EMVCo TLV parsing: legacy slicing loop vs emvco.parse_spans / parse_many
+
+Run from the repository root:
+    python -m benchmarks.bench_emvco_tlv [--payloads N]
+
+Throughput of the old top-level loop, parse_payload, parse_many (with CRC
+checks) and the full SlipQRReader.parse_promptpay_qr over the PromptPay and
+bank slip-verification corpus of tests/test_emvco.py, where the round-trip,
+CRC, truncation, length-field and fuzz checks on it live.
+"""
+
+import argparse
+import logging
+import time
+
+import emvco
+from qr_reader import SlipQRReader
+from tests.test_emvco import make_corpus
+
+
+def legacy_parse(qr_data: str):
+    fields = {}
+    i = 0
+    while i < len(qr_data) - 4:
+        tag = qr_data[i:i + 2]
+        length = int(qr_data[i + 2:i + 4])
+        fields.setdefault(tag, qr_data[i + 4:i + 4 + length])
+        i += 4 + length
+    return fields
+
+
+def throughput(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--payloads", type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    corpus = make_corpus(args.payloads)
+    print(f"{args.payloads} payloads, {sum(map(len, corpus)) / len(corpus):.0f} chars on average")
+    rows = [
+        ("legacy top-level loop", lambda payload: legacy_parse(payload)),
+        ("emvco.parse_payload", emvco.parse_payload),
+        ("parse_payload + tag 29 sub-tag 01", lambda payload: emvco.parse_payload(payload).find("29", "01")),
+        ("parse_promptpay_qr (CRC + fields)", SlipQRReader.parse_promptpay_qr),
+    ]
+    for label, fn in rows:
+        print(f"  {label:<34} {throughput(fn, corpus):>10,.0f}/s")
+
+    start = time.perf_counter()
+    emvco.parse_many(corpus)
+    elapsed = time.perf_counter() - start
+    print(f"  {'emvco.parse_many (CRC + top level)':<34} {len(corpus) / elapsed:>10,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Bank notification parsing: last-number regex vs NotificationTemplateRegistry
+
+Run from the repository root:
+    python -m benchmarks.bench_notification_parser [--notifications N]
+
+Builds N notifications in the wordings of the default templates (LINE BK
+Thai / English, K PLUS, SCB EASY, Krungthai NEXT, Bualuang) with random
+amounts, accounts, dates, times and references, plus ~2% texts in no
+known format. Reports how often each parser gets the amount right and
+sustained parses per second.
+"""
+
+import argparse
+import logging
+import random
+import re
+import time
+
+from notification_parser import NotificationTemplateRegistry
+
+
+def legacy_amount(text: str):
+    matches = re.findall(r"(\d+[.,]\d+|\d+)", text)
+    if matches:
+        try:
+            return float(matches[-1].replace(",", "."))
+        except ValueError:
+            return None
+    return None
+
+
+def make_corpus(count: int, seed: int = 0):
+    """[(text, expected amount or None)]"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        amount = round(rng.choice([rng.uniform(1, 999), rng.uniform(1000, 250000)]), 2)
+        shown = f"{amount:,.2f}" if rng.random() < 0.8 else f"{amount:.2f}"
+        clock = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+        day = f"{rng.randrange(1, 29)}/{rng.randrange(1, 13)}"
+        account = f"x{rng.randrange(10000):04d}"
+        reference = f"{rng.randrange(10 ** 12):012d}{rng.choice('ABCDEF')}"
+        balance = f"{amount + rng.uniform(0, 90000):,.2f}"
+        kind = rng.randrange(50)
+        if kind == 0:
+            corpus.append((f"ยอดคงเหลือ {balance} บาท ณ {clock}", None))
+            continue
+        texts = [
+            f"เงินเข้า {shown} บาท เวลา {clock}",
+            f"เงินเข้า {shown} บาท เข้าบัญชี {account} เวลา {clock}",
+            f"Money in THB {shown} to a/c {account} at {clock} Ref. {reference}",
+            f"รับเงิน {shown} บาท จาก นาย ก เข้าบัญชี xxx-x-{account}-x วันที่ {day}/69 {clock} น. Ref {reference}",
+            f"เงินเข้าบัญชี x{account} จำนวน {shown} บาท วันที่ {day} @{clock} Ref {reference}",
+            f"บัญชี XXX-X-XX{account[1:]} เงินเข้า +{shown} บาท คงเหลือ {balance} บาท {day.replace('/', '-')}-69@{clock}",
+            f"ฝาก/โอนเข้า {shown} บาท บ/ช X{account[1:]} {day}/26 {clock}",
+        ]
+        corpus.append((rng.choice(texts), amount))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--notifications", type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    corpus = make_corpus(args.notifications)
+    texts = [text for text, _ in corpus]
+    known = sum(expected is not None for _, expected in corpus)
+    correctness = NotificationTemplateRegistry()
+    registry = NotificationTemplateRegistry()
+
+    print(f"{args.notifications} notifications, {known} in known formats")
+    for label, check, parse in [
+        ("last number (legacy)", legacy_amount, legacy_amount),
+        ("template registry", lambda text: getattr(correctness.parse(text), "amount", None), registry.parse),
+    ]:
+        correct = sum(
+            expected is not None and check(text) == expected for text, expected in corpus
+        )
+        start = time.perf_counter()
+        for text in texts:
+            parse(text)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<22} amount right {correct / known:7.1%}   {len(texts) / elapsed:>9,.0f}/s")
+
+    stats = registry.stats()
+    print(f"\nunknown: {stats['unknown']} texts, {len(stats['unknown_samples'])} shapes sampled")
+    for template in stats["templates"]:
+        print(f"  {template['name']:<15} {template['hits']:>8,}")
+
+
+if __name__ == "__main__":
+    main()
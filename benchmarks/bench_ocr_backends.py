@@ -0,0 +1,83 @@
+"""
+OCR throughput: pytesseract (process per call) vs pooled tesserocr engines
+
+Run from the repository root (needs tesseract + tha traineddata, and the
+tesserocr package for the pooled backend):
+    python -m benchmarks.bench_ocr_backends [--runs N] [--pool-size P] [--threads T]
+
+Each backend OCRs the same prepared slip image (SlipImage.ocr_binary) N
+times. The pooled backend is also driven from T threads to show how a
+pool of P engines scales within one process.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._slips import make_slip
+from qr_reader import (
+    OCR_LANG,
+    TESSEROCR_AVAILABLE,
+    TESSERACT_AVAILABLE,
+    PytesseractBackend,
+    SlipImage,
+    TesserocrBackend,
+)
+
+
+def run_serial(backend, image, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.image_to_string(image)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_threaded(backend, image, runs, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda _: backend.image_to_string(image), range(runs)))
+    return runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=2)
+    args = parser.parse_args()
+
+    image = SlipImage(make_slip(1080, 2340, seed=3)).ocr_binary
+    print(f"OCR input: {image.shape[1]}x{image.shape[0]}, {args.runs} runs")
+    print(f"{'backend':<24}{'init ms':>10}{'median ms':>12}{'slips/s':>10}")
+
+    if TESSERACT_AVAILABLE:
+        try:
+            backend = PytesseractBackend(OCR_LANG)
+            timings = run_serial(backend, image, args.runs)
+            print(f"{'pytesseract':<24}{0:>10.0f}{statistics.median(timings) * 1000:>12.1f}{1 / statistics.mean(timings):>10.2f}")
+        except Exception as e:
+            print(f"pytesseract: unusable ({e})")
+    else:
+        print("pytesseract: not installed")
+
+    if TESSEROCR_AVAILABLE:
+        try:
+            start = time.perf_counter()
+            backend = TesserocrBackend(OCR_LANG, args.pool_size)
+            init = time.perf_counter() - start
+            timings = run_serial(backend, image, args.runs)
+            print(f"{'tesserocr':<24}{init * 1000:>10.0f}{statistics.median(timings) * 1000:>12.1f}{1 / statistics.mean(timings):>10.2f}")
+            throughput = run_threaded(backend, image, args.runs, args.threads)
+            label = f"tesserocr x{args.pool_size} ({args.threads} thr)"
+            print(f"{label:<24}{'':>10}{'':>12}{throughput:>10.2f}")
+            backend.close()
+        except Exception as e:
+            print(f"tesserocr: unusable ({e})")
+    else:
+        print("tesserocr: not installed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+OCR field extraction: per-field re.search chains vs slip_text.scan_slip_text
+
+Run from the repository root:
+    python -m benchmarks.bench_ocr_fields [--slips N]
+
+Builds N synthetic OCR texts in the layouts of common Thai banking apps
+(Thai and English labels, the amount label on its own line, fee and
+balance lines, thousands separators, prose that starts with "Ref") with
+known amount and reference, then reports how often each extractor gets
+them right and the CPU time per slip for amount + reference.
+"""
+
+import argparse
+import random
+import re
+import time
+
+from money import to_baht
+from slip_text import scan_slip_text
+
+
+def legacy_amount(text):
+    for pattern in (r'เงินเข้า\s*(\d+[.,]\d+)\s*บาท', r'จำนวน\s*(\d+[.,]\d+)\s*บาท',
+                    r'(\d+[.,]\d+)\s*บาท', r'ยอดเงิน\s*(\d+[.,]\d+)'):
+        match = re.search(pattern, text)
+        if match:
+            return float(match.group(1).replace(',', '.'))
+    return None
+
+
+def legacy_ref(text):
+    match = re.search(r'Ref[erence]*\s*:?\s*([A-Za-z0-9]+)', text)
+    if match:
+        return match.group(1).strip()
+    match = re.search(r'เลขอ้างอิง\s*([A-Za-z0-9]+)', text)
+    if match:
+        return match.group(1).strip()
+    match = re.search(r'(?:Transaction|Transfer)\s*(?:ID|Ref)\s*:?\s*([A-Za-z0-9]+)', text, re.IGNORECASE)
+    if match:
+        return match.group(1).strip()
+    return None
+
+
+def make_slip(rng: random.Random):
+    amount = round(rng.choice([rng.uniform(1, 999), rng.uniform(1000, 90000)]), 2)
+    shown = f"{amount:,.2f}"
+    reference = f"{rng.randrange(10 ** 12):012d}{rng.choice(['ATF', 'BPM', 'CTX'])}{rng.randrange(10 ** 5):05d}"
+    fee = f"{rng.choice([0, 0, 5, 10]):.2f}"
+    balance = f"{amount + rng.uniform(100, 90000):,.2f}"
+    sender = f"xxx-x-x{rng.randrange(10000):04d}-x"
+    receiver = f"xxx-x-x{rng.randrange(10000):04d}-x"
+    layout = rng.randrange(4)
+    if layout == 0:
+        lines = ["โอนเงินสำเร็จ", "17 ต.ค. 69 12:05 น.", "จาก", "นาย สมชาย ใจดี", sender, "ไปยัง", "ร้านค้า",
+                 receiver, f"จำนวน: {shown} บาท", f"ค่าธรรมเนียม: {fee} บาท", f"เลขที่รายการ: {reference}"]
+    elif layout == 1:
+        lines = ["Transfer successful", "17 Oct 2026 - 12:05", f"From MR SOMCHAI {sender.upper()}",
+                 f"To SHOP CO LTD {receiver.upper()}", f"Amount {shown} THB", f"Balance {balance} THB",
+                 f"Transaction ID: {reference}", "Refer a friend and get 50 THB"]
+    elif layout == 2:
+        lines = ["ชำระเงินสำเร็จ", f"ค่าธรรมเนียม {fee} บาท", "จำนวนเงิน", f"{shown}", sender, receiver,
+                 "17/10/2026 12:05", f"รหัสอ้างอิง {reference}"]
+    else:
+        lines = ["Referral program", "SUCCESS", sender, receiver, f"ยอดโอน {shown} บาท",
+                 f"คงเหลือ {balance} บาท", f"Ref No. {reference}", "17/10/26 12:05"]
+    return "\n".join(lines), amount, reference
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--slips", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    slips = [make_slip(rng) for _ in range(args.slips)]
+    texts = [text for text, _, _ in slips]
+
+    def scanned(text):
+        fields = scan_slip_text(text)
+        return to_baht(fields.best("amount_satang")), fields.best("reference")
+
+    print(f"{args.slips} slips, {sum(map(len, texts)) / len(texts):.0f} chars of OCR text on average")
+    for label, extract in [
+        ("re.search chains (legacy)", lambda text: (legacy_amount(text), legacy_ref(text))),
+        ("scan_slip_text", scanned),
+    ]:
+        results = [extract(text) for text in texts]
+        amounts = sum(found[0] == amount for found, (_, amount, _) in zip(results, slips))
+        references = sum(found[1] == reference for found, (_, _, reference) in zip(results, slips))
+        start = time.perf_counter()
+        for text in texts:
+            extract(text)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<26} amount {amounts / args.slips:7.1%}   reference {references / args.slips:7.1%}"
+              f"   {elapsed / args.slips * 1e6:6.1f} us/slip")
+
+
+if __name__ == "__main__":
+    main()
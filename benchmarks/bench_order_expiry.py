@@ -0,0 +1,137 @@
+"""
+Expiring abandoned orders: one transaction for all of them vs bounded SKIP LOCKED batches
+
+Run from the repository root (DATABASE_URL picks the database; a local
+PostgreSQL is the intended target, defaults to a throwaway SQLite file):
+    python -m benchmarks.bench_order_expiry [--overdue N] [--live L] [--batch B]
+
+Adds L pending orders still payable and N past their expires_at, each
+holding an amount slot (all removed again at the end), and expires the N
+twice from the same starting point:
+
+1. all at once: every overdue order selected, updated and its slot freed
+   in one transaction, as AmountSlotAllocator.expire_stale did.
+2. sweep: OrderExpirySweeper.expire_batch, B orders per transaction
+   (SELECT ... FOR UPDATE SKIP LOCKED, UPDATE, slot release, commit).
+
+Reports the total time and the longest transaction: how long the expired
+rows stay locked against a slip claiming one of them.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_order_expiry.db"
+
+from sqlalchemy import delete, func, insert, select, update  # noqa: E402
+
+from amount_slots import AmountSlotAllocator  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import PENDING_ORDER, AmountSlot, Order, OrderStatus  # noqa: E402
+from order_expiry import OrderExpirySweeper  # noqa: E402
+from pending_orders import PendingOrderIndex  # noqa: E402
+
+
+def fill(prefix: str, overdue: int, live: int):
+    """Fresh orders and slots under prefix"""
+    now = datetime.utcnow()
+    rng = random.Random(0)
+    # Amounts well above what the app's own tests and smoke runs issue
+    amounts = rng.sample(range(70_000_000, 79_000_000), overdue + live)
+    orders = [
+        {"order_id": f"{prefix}-{i}", "amount_satang": amount, "status": OrderStatus.pending,
+         "created_at": now - timedelta(hours=2),
+         "expires_at": now - timedelta(hours=1) if i < overdue else now + timedelta(hours=1)}
+        for i, amount in enumerate(amounts)
+    ]
+    with engine.begin() as connection:
+        connection.execute(delete(AmountSlot).where(AmountSlot.order_id.like(f"{prefix}-%")))
+        connection.execute(delete(Order).where(Order.order_id.like(f"{prefix}-%")))
+        connection.execute(insert(Order), orders)
+        connection.execute(insert(AmountSlot), [
+            {"amount_satang": order["amount_satang"], "order_id": order["order_id"], "created_at": now}
+            for order in orders
+        ])
+
+
+def all_at_once(allocator: AmountSlotAllocator, prefix: str) -> tuple:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        stale = db.execute(select(Order.order_id).where(
+            Order.status == PENDING_ORDER, Order.expires_at <= datetime.utcnow(),
+            Order.order_id.like(f"{prefix}-%")
+        )).scalars().all()
+        db.execute(
+            update(Order).where(Order.order_id.in_(stale)).values(status=OrderStatus.expired, updated_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False}
+        )
+        allocator.release(db, stale)
+        db.commit()
+        seconds = time.perf_counter() - started
+    finally:
+        db.close()
+    return len(stale), seconds, seconds, 1
+
+
+def swept(sweeper: OrderExpirySweeper) -> tuple:
+    db = SessionLocal()
+    expired, longest, batches = 0, 0.0, 0
+    try:
+        started = time.perf_counter()
+        while True:
+            batch_started = time.perf_counter()
+            batch = sweeper.expire_batch(db)
+            db.commit()
+            longest = max(longest, time.perf_counter() - batch_started)
+            expired += len(batch)
+            batches += 1
+            if len(batch) < sweeper.batch_size:
+                break
+        seconds = time.perf_counter() - started
+    finally:
+        db.close()
+    return expired, seconds, longest, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--overdue", type=int, default=20000)
+    parser.add_argument("--live", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    prefix = f"BOE-{int(time.time())}"
+    with engine.connect() as connection:
+        others = connection.execute(select(func.count()).where(
+            Order.status == PENDING_ORDER, Order.expires_at <= datetime.utcnow()
+        )).scalar()
+    if others:
+        # The sweep would expire them too; leave the database as it was
+        raise SystemExit(f"{others} orders are already overdue in this database; run the app's sweeper first")
+
+    allocator = AmountSlotAllocator()
+    sweeper = OrderExpirySweeper(allocator, PendingOrderIndex(), batch_size=args.batch)
+    print(f"{args.overdue} overdue of {args.overdue + args.live} pending orders, {engine.dialect.name}")
+    try:
+        for label, run in (("all at once", lambda: all_at_once(allocator, prefix)),
+                           (f"sweep, batches of {args.batch}", lambda: swept(sweeper))):
+            fill(prefix, args.overdue, args.live)
+            expired, seconds, longest, batches = run()
+            print(f"  {label:<24} {expired:>7} expired in {seconds * 1000:>8,.0f} ms, "
+                  f"longest transaction {longest * 1000:>7,.1f} ms ({batches} transactions)")
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(AmountSlot).where(AmountSlot.order_id.like(f"{prefix}-%")))
+            connection.execute(delete(Order).where(Order.order_id.like(f"{prefix}-%")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Slip -> pending order: in-memory index vs a database query per slip
+
+Run from the repository root (DATABASE_URL picks the database; a local
+PostgreSQL is the intended target, defaults to a throwaway SQLite file):
+    python -m benchmarks.bench_pending_index [--pending P] [--lookups L] [--changes C]
+
+Adds P pending orders to the orders table (removed again at the end) and
+measures, per slip:
+
+1. query: the upload_slip fallback, WHERE status = 'pending' AND
+   amount_satang = ? ORDER BY created_at DESC LIMIT 1 (one round trip on
+   idx_pending_amount_created).
+2. index: PendingOrderIndex.match, a dict lookup.
+
+Then, with the index following the database (PendingOrderIndex.start, as
+each worker runs it), inserts C more orders one transaction at a time from
+another connection and reports how long each takes to show up in the
+index after its commit: a NOTIFY on PostgreSQL, the next poll on SQLite.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_pending_index.db"
+
+from sqlalchemy import bindparam, delete, insert, select  # noqa: E402
+
+from database import AsyncSessionLocal, SessionLocal, async_engine, engine  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import PENDING_ORDER, Order, OrderStatus  # noqa: E402
+from pending_orders import PendingOrderIndex  # noqa: E402
+
+
+def percentiles(seconds):
+    seconds = sorted(seconds)
+    return statistics.median(seconds) * 1e6, seconds[min(len(seconds) - 1, int(len(seconds) * 0.99))] * 1e6
+
+
+async def propagation(index: PendingOrderIndex, prefix: str, amounts) -> list:
+    """Seconds from each insert's commit until the index holds it"""
+    loop = asyncio.get_running_loop()
+    index.start(async_engine, AsyncSessionLocal)
+    while not index.live:
+        await asyncio.sleep(0.01)
+
+    def commit_one(i, amount):
+        with engine.begin() as connection:
+            connection.execute(insert(Order).values(
+                order_id=f"{prefix}-C{i}", amount_satang=amount, status=OrderStatus.pending,
+                created_at=datetime.utcnow(), updated_at=datetime.utcnow()
+            ))
+        return time.perf_counter()
+
+    delays = []
+    for i, amount in enumerate(amounts):
+        committed = await loop.run_in_executor(None, commit_one, i, amount)
+        while index.match(amount) is None:
+            await asyncio.sleep(0.0005)
+        delays.append(time.perf_counter() - committed)
+    await index.stop()
+    await async_engine.dispose()
+    return delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pending", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--changes", type=int, default=200)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    prefix = f"BPI-{int(time.time())}"
+    rng = random.Random(0)
+    # Amounts well above what the app's own tests and smoke runs issue
+    amounts = rng.sample(range(90_000_000, 99_000_000), args.pending + args.changes)
+    pending, changes = amounts[:args.pending], amounts[args.pending:]
+    with engine.begin() as connection:
+        connection.execute(insert(Order), [
+            {"order_id": f"{prefix}-{i}", "amount_satang": amount, "status": OrderStatus.pending,
+             "created_at": datetime.utcnow()}
+            for i, amount in enumerate(pending)
+        ])
+
+    try:
+        measure(args, rng, prefix, pending, changes)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(Order).where(Order.order_id.like(f"{prefix}-%")))
+
+
+def measure(args, rng, prefix, pending, changes):
+    lookups = [rng.choice(pending) for _ in range(args.lookups)]
+    query = select(Order.id).where(
+        Order.status == PENDING_ORDER, Order.amount_satang == bindparam("amount")
+    ).order_by(Order.created_at.desc()).limit(1)
+
+    index = PendingOrderIndex(poll_interval=0.05)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        index.load(db)
+        load_seconds = time.perf_counter() - start
+
+        found, seconds = [], []
+        for amount in lookups:
+            start = time.perf_counter()
+            found.append(db.execute(query, {"amount": amount}).scalar())
+            seconds.append(time.perf_counter() - start)
+        query_p50, query_p99 = percentiles(seconds)
+
+        matched, seconds = [], []
+        for amount in lookups:
+            start = time.perf_counter()
+            order = index.match(amount)
+            seconds.append(time.perf_counter() - start)
+            matched.append(order.id)
+        index_p50, index_p99 = percentiles(seconds)
+    finally:
+        db.close()
+    assert matched == found, "index and query disagree"
+
+    print(f"{args.pending} pending orders ({len(index)} in the index), {args.lookups} lookups, {engine.dialect.name}")
+    print(f"  index load               {load_seconds * 1000:>10,.1f} ms")
+    print(f"  query per slip           {query_p50:>10,.1f} µs p50 {query_p99:>10,.1f} µs p99")
+    print(f"  index per slip           {index_p50:>10,.2f} µs p50 {index_p99:>10,.2f} µs p99")
+
+    delays = asyncio.run(propagation(index, prefix, changes))
+    feed = "NOTIFY" if engine.dialect.name == "postgresql" else f"poll every {index.poll_interval * 1000:.0f} ms"
+    delay_p50, delay_p99 = percentiles(delays)
+    print(f"  commit -> index ({feed}) {delay_p50 / 1000:>8,.2f} ms p50 {delay_p99 / 1000:>8,.2f} ms p99")
+
+
+if __name__ == "__main__":
+    main()
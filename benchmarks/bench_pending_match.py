@@ -0,0 +1,208 @@
+"""
+Slip -> pending order match at scale: which index serves it, and what building it costs
+
+Run from the repository root (DATABASE_URL picks the database; a local
+PostgreSQL is the intended target, defaults to a throwaway SQLite file):
+    python -m benchmarks.bench_pending_match [--orders N] [--pending P] [--lookups L]
+
+Fills a bench_orders table (same columns as orders) with N historical
+orders (completed / expired; 10 million by default) and P pending ones,
+then times the upload_slip fallback query
+
+    WHERE status = 'pending' AND amount_satang = ? ORDER BY created_at DESC LIMIT 1
+
+with each index the orders table has had in turn:
+
+1. (order_id, status) only: the schema before the amount index.
+2. (status, amount_satang): every order's amount.
+3. (amount_satang, created_at) WHERE status = 'pending': the partial index
+   from migration 0003, which holds only the pending rows.
+
+Per index: build time, size (PostgreSQL), lookup latency p50 / p99, and
+the plan of one lookup. On PostgreSQL the partial index is also built
+without and with CONCURRENTLY while another connection inserts orders,
+reporting the longest insert stall each way.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_pending_match.db"
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, MetaData, String, Table, bindparam, select, text  # noqa: E402
+
+from database import engine  # noqa: E402
+from migrations import create_index_concurrently, drop_index_concurrently  # noqa: E402
+from models import PENDING_ORDER  # noqa: E402
+
+bench_metadata = MetaData()
+bench_orders = Table(
+    "bench_orders", bench_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("order_id", String(100), nullable=False),
+    Column("amount_satang", BigInteger, nullable=False),
+    Column("status", String(9), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+# name, columns, partial-index predicate
+INDEXES = (
+    ("bench_order_id_status", "order_id, status", None),
+    ("bench_status_amount_satang", "status, amount_satang", None),
+    ("bench_pending_amount_created", "amount_satang, created_at", "status = 'pending'"),
+)
+LABELS = ("(order_id, status) only", "(status, amount_satang)", "partial, pending only")
+CHUNK = 1_000_000
+
+MATCH = select(bench_orders.c.order_id).where(
+    bench_orders.c.status == PENDING_ORDER,
+    bench_orders.c.amount_satang == bindparam("amount"),
+).order_by(bench_orders.c.created_at.desc()).limit(1)
+
+
+def fill(count: int, pending: int, seed: int = 0):
+    """Historical orders generated server-side, plus pending ones; returns the pending amounts"""
+    bench_metadata.drop_all(bind=engine)
+    bench_metadata.create_all(bind=engine)
+    postgres = engine.dialect.name == "postgresql"
+    # Amounts spread over 1 - 100,000 baht; one in ten historical orders expired unpaid
+    historical = (
+        "INSERT INTO bench_orders (order_id, amount_satang, status, created_at) "
+        "SELECT 'H' || g, CAST(g AS BIGINT) * 7919 % 10000000 + 100, "
+        "CASE WHEN g % 10 = 0 THEN 'expired' ELSE 'completed' END, {created} FROM {rows}"
+    ).format(
+        created="now() - g * interval '1 second'" if postgres else "datetime('now', '-' || g || ' seconds')",
+        rows="generate_series(:start, :stop) g" if postgres else
+             "(WITH RECURSIVE s(g) AS (SELECT :start UNION ALL SELECT g + 1 FROM s WHERE g < :stop) SELECT g FROM s)",
+    )
+    started = time.perf_counter()
+    for start in range(1, count + 1, CHUNK):
+        with engine.begin() as connection:
+            connection.execute(text(historical), {"start": start, "stop": min(start + CHUNK - 1, count)})
+        print(f"\r  {min(start + CHUNK - 1, count):,} historical orders", end="", flush=True)
+    print(f" ({time.perf_counter() - started:.0f}s)")
+
+    rng = random.Random(seed)
+    amounts = rng.sample(range(100, 10_000_100), pending)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO bench_orders (order_id, amount_satang, status, created_at) "
+            f"VALUES (:order_id, :amount, 'pending', {'now()' if postgres else 'CURRENT_TIMESTAMP'})"
+        ), [{"order_id": f"P{i}", "amount": amount} for i, amount in enumerate(amounts)])
+        if postgres:
+            connection.execute(text("ANALYZE bench_orders"))
+    return amounts
+
+
+def lookups_latency(amounts):
+    """Per-lookup seconds, checking every lookup finds its pending order"""
+    latencies = []
+    with engine.connect() as connection:
+        for amount in amounts:
+            start = time.perf_counter()
+            found = connection.execute(MATCH, {"amount": amount}).scalar()
+            latencies.append(time.perf_counter() - start)
+            assert found is not None and found.startswith("P"), f"no pending order for {amount}"
+    return latencies
+
+
+def plan(amount: int) -> str:
+    explain = "EXPLAIN" if engine.dialect.name == "postgresql" else "EXPLAIN QUERY PLAN"
+    compiled = MATCH.params(amount=amount).compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"{explain} {compiled}")
+        return " / ".join(str(row[-1]).strip() for row in rows)
+
+
+def index_size(name: str) -> str:
+    if engine.dialect.name != "postgresql":
+        return "-"
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT pg_size_pretty(pg_relation_size(to_regclass(:name)))"), {"name": name}).scalar()
+
+
+def insert_stall(build) -> tuple:
+    """(build seconds, longest single-row insert in ms) while build() runs"""
+    stop = threading.Event()
+    stalls = []
+
+    def writer():
+        with engine.connect() as connection:
+            connection.execution_options(isolation_level="AUTOCOMMIT")
+            i = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                connection.execute(text(
+                    "INSERT INTO bench_orders (order_id, amount_satang, status, created_at) "
+                    "VALUES (:order_id, 1, 'completed', now())"
+                ), {"order_id": f"W{time.time_ns()}-{i}"})
+                stalls.append(time.perf_counter() - start)
+                i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    build()
+    seconds = time.perf_counter() - start
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+    return seconds, max(stalls) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=10_000_000, help="historical orders")
+    parser.add_argument("--pending", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--scan-lookups", type=int, default=20, help="lookups without an amount index (each one scans)")
+    args = parser.parse_args()
+
+    print(f"Filling bench_orders on {engine.dialect.name}")
+    amounts = fill(args.orders, args.pending)
+    rng = random.Random(1)
+    lookups = [rng.choice(amounts) for _ in range(args.lookups)]
+
+    print(f"{args.orders:,} historical + {args.pending} pending orders, {engine.dialect.name}")
+    print(f"{'index':<26} {'build':>8} {'size':>9} {'lookups':>8} {'p50':>10} {'p99':>10}")
+    for (name, columns, where), label in zip(INDEXES, LABELS):
+        # Each amount index alongside (order_id, status), as on orders; the partial one replaces the full one
+        if name == INDEXES[2][0]:
+            drop_index_concurrently(engine, INDEXES[1][0])
+        start = time.perf_counter()
+        create_index_concurrently(engine, name, "bench_orders", columns, where=where)
+        build = time.perf_counter() - start
+        sample = lookups[:args.scan_lookups] if name == INDEXES[0][0] else lookups
+        latencies = sorted(lookups_latency(sample))
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{label:<26} {build:>7.1f}s {index_size(name):>9} {len(sample):>8} "
+              f"{statistics.median(latencies) * 1e6:>8,.0f}µs {p99 * 1e6:>8,.0f}µs")
+        print(f"  plan: {plan(lookups[0])}")
+
+    if engine.dialect.name == "postgresql":
+        name, columns, where = INDEXES[2]
+        print("Building the partial index while inserting orders")
+        drop_index_concurrently(engine, name)
+
+        def plain():
+            with engine.begin() as connection:
+                connection.execute(text(f"CREATE INDEX {name} ON bench_orders ({columns}) WHERE {where}"))
+
+        for label, build in (("CREATE INDEX", plain),
+                             ("CREATE INDEX CONCURRENTLY",
+                              lambda: create_index_concurrently(engine, name, "bench_orders", columns, where=where))):
+            seconds, stall = insert_stall(build)
+            print(f"  {label:<26} {seconds:>6.1f}s build, longest insert {stall:>8,.1f} ms")
+            drop_index_concurrently(engine, name)
+
+    bench_metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main()
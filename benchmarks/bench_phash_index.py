@@ -0,0 +1,85 @@
+"""
+Near-duplicate lookup latency of PerceptualHashIndex at scale
+
+Run from the repository root:
+    python -m benchmarks.bench_phash_index [--size N] [--queries Q] [--radius R]
+
+Bulk-loads the multi-index-hashing index with N random 64-bit hashes
+(as startup hydration does), adds a batch of recent inserts to the delta,
+then
+times lookups for near variants of stored hashes (hits) and for fresh
+random hashes (misses). A linear scan over the same hashes is timed on a
+few queries for comparison.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from config import settings
+from slip_phash import PerceptualHashIndex, hamming
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def time_queries(index, queries, radius):
+    timings = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        found += bool(index.search(query, radius))
+        timings.append(time.perf_counter() - start)
+    return timings, found
+
+
+def report(label, timings, found, total):
+    p99 = statistics.quantiles(timings, n=100)[-1]
+    print(
+        f"{label:<10}{statistics.mean(timings) * 1e6:>10.0f}{p99 * 1e6:>10.0f}"
+        f"{found:>10}/{total}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=int, default=settings.PHASH_MATCH_DISTANCE)
+    parser.add_argument("--chunks", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    hashes = [rng.getrandbits(64) for _ in range(args.size)]
+
+    index = PerceptualHashIndex(chunks=args.chunks)
+    start = time.perf_counter()
+    index.extend(list(enumerate(hashes)))
+    print(f"indexed {args.size:,} hashes in {time.perf_counter() - start:.1f}s, radius {args.radius}")
+
+    recent = [rng.getrandbits(64) for _ in range(index.compact_every // 2)]
+    for offset, value in enumerate(recent):
+        index.add(args.size + offset, value)
+    hashes.extend(recent)
+
+    near = [flip_bits(rng.choice(hashes), rng.randint(0, args.radius), rng) for _ in range(args.queries)]
+    fresh = [rng.getrandbits(64) for _ in range(args.queries)]
+
+    print(f"{'queries':<10}{'mean us':>10}{'p99 us':>10}{'matched':>12}")
+    report("near", *time_queries(index, near, args.radius), args.queries)
+    report("random", *time_queries(index, fresh, args.radius), args.queries)
+
+    scans = 5
+    start = time.perf_counter()
+    for query in near[:scans]:
+        [value for value in hashes if hamming(query, value) <= args.radius]
+    linear = (time.perf_counter() - start) / scans
+    print(f"linear scan: {linear * 1e3:.0f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
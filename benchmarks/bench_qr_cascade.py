@@ -0,0 +1,88 @@
+"""
+Adaptive QR preprocessing cascade: per-source ordering as it learns
+
+Run from the repository root:
+    python -m benchmarks.bench_qr_cascade [--slips N]
+
+Two synthetic slip sources, each at its own resolution and each with a
+degradation that defeats plain decoding (inverted colours, perspective
+skew). Slips are read through SlipQRReader.read_qr_from_image; the
+cascade time is reported for the first and last few slips of each
+source, then the stats that /api/admin/qr-cascade-stats would serve.
+"""
+
+import argparse
+import statistics
+
+import cv2
+import numpy as np
+
+from benchmarks._slips import encode_jpeg, render_slip
+import qr_reader
+from qr_cascade import PreprocessingCascade
+from qr_reader import SlipImage, SlipQRReader
+
+
+def inverted(image, box):
+    x, y, w, h = box
+    image[y:y + h, x:x + w] = 255 - image[y:y + h, x:x + w]
+    return image
+
+
+def skewed(image, box):
+    # Phone held well off-axis over a printed slip
+    height, width = image.shape[:2]
+    source = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    target = np.float32([
+        [width * 0.45, height * 0.2], [width * 0.8, 0],
+        [width, height], [0, height * 0.7]
+    ])
+    matrix = cv2.getPerspectiveTransform(source, target)
+    return cv2.warpPerspective(image, matrix, (width, height), borderValue=(235, 235, 235))
+
+
+SOURCES = {
+    "inverted": ((1080, 2340), inverted),
+    "skewed": ((3000, 4000), skewed),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--slips", type=int, default=30, help="slips per source")
+    parser.add_argument("--window", type=int, default=5)
+    args = parser.parse_args()
+
+    qr_reader._cascade = PreprocessingCascade(budget_ms=10000)
+
+    for label, ((width, height), degrade) in SOURCES.items():
+        timings, decoded, rescued = [], 0, {}
+        for i in range(args.slips):
+            image, payload, box = render_slip(width, height, qr_fraction=0.3, seed=i)
+            slip = SlipImage(encode_jpeg(degrade(image, box)))
+            decoded += SlipQRReader.read_qr_from_image(slip) == payload
+            record = slip.qr_preprocessing
+            if record:
+                timings.append(sum(attempt["ms"] for attempt in record["attempts"]))
+                rescued[record["strategy"]] = rescued.get(record["strategy"], 0) + 1
+
+        window = min(args.window, len(timings) // 2) or 1
+        print(f"{label} ({width}x{height}): decoded {decoded}/{args.slips}, cascade ran on {len(timings)}")
+        if timings:
+            print(
+                f"  cascade ms: first {window} median {statistics.median(timings[:window]):7.1f}, "
+                f"last {window} median {statistics.median(timings[-window:]):7.1f}"
+            )
+        print(f"  winning strategies: {rescued}")
+
+    print("\nper-strategy stats across sources:")
+    stats = qr_reader._cascade.stats.snapshot()["*"]
+    for name, row in sorted(stats["strategies"].items(), key=lambda item: -item[1]["successes"]):
+        print(
+            f"  {name:<20} attempts {row['attempts']:4d}  success {row['success_rate']:6.1%}  "
+            f"mean {row['mean_ms']:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+QR decode: legacy full-frame pyzbar vs pyramid localisation + cropped decode
+
+Run from the repository root (needs libzbar):
+    python -m benchmarks.bench_qr_localise [--count N] [--corpus DIR]
+
+Without --corpus a varied synthetic corpus is generated (sizes, QR scale,
+tilt, blur, JPEG quality). With --corpus every image file in DIR is used
+and a hit means "some QR decoded"; with the synthetic corpus a hit means
+the expected payload was decoded.
+"""
+
+import argparse
+import pathlib
+import statistics
+import time
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode
+
+from benchmarks._slips import make_corpus
+from qr_reader import SlipQRReader
+
+
+def legacy_read(image_bytes: bytes):
+    """read_qr_from_image before localisation: full-resolution, all symbologies"""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    qr_codes = decode(image)
+    if qr_codes:
+        return qr_codes[0].data.decode("utf-8")
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    for candidate in (thresh, cv2.bitwise_not(thresh)):
+        qr_codes = decode(candidate)
+        if qr_codes:
+            return qr_codes[0].data.decode("utf-8")
+    return None
+
+
+def load_corpus(directory: str):
+    for path in sorted(pathlib.Path(directory).iterdir()):
+        if path.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"}:
+            yield path.read_bytes(), None
+
+
+def run(reader, corpus):
+    timings, hits = [], 0
+    for image_bytes, expected in corpus:
+        start = time.perf_counter()
+        data = reader(image_bytes)
+        timings.append(time.perf_counter() - start)
+        if data and (expected is None or data == expected):
+            hits += 1
+    return timings, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=40, help="synthetic slips to generate")
+    parser.add_argument("--corpus", help="directory of real slip images")
+    args = parser.parse_args()
+
+    corpus = list(load_corpus(args.corpus) if args.corpus else make_corpus(args.count, seed=7))
+    print(f"corpus: {len(corpus)} slips")
+
+    print(f"{'reader':<12}{'hits':>8}{'median ms':>12}{'p95 ms':>10}{'total s':>10}")
+    for name, reader in (("legacy", legacy_read), ("localised", SlipQRReader.read_qr_from_image)):
+        timings, hits = run(reader, corpus)
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        print(
+            f"{name:<12}{hits:>5}/{len(corpus):<2}{statistics.median(timings) * 1000:>12.1f}"
+            f"{p95 * 1000:>10.1f}{sum(timings):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
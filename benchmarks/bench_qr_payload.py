@@ -0,0 +1,67 @@
+"""
+PromptPay payload generation: full rebuild vs per-merchant template
+
+Run from the repository root:
+    python -m benchmarks.bench_qr_payload [--orders N] [--merchants M]
+
+The legacy path is generate_qr_payload as it was before templates: every
+call rebuilds the merchant-info TLV and static tags and runs the CRC over
+the whole payload (with the bit-by-bit CRC loop, and with the table-driven
+emvco CRC for a like-for-like comparison). The template path reuses the
+cached prefix and its CRC state and only appends the amount.
+"""
+
+import argparse
+import random
+import time
+
+import emvco
+from benchmarks.bench_emvco_crc import legacy_crc
+from payment_service import PromptPayQRGenerator
+
+
+def rebuild_payload(account_id: str, amount_satang: int, crc) -> str:
+    qr = "000201" + "010212"
+    qr += "29" + PromptPayQRGenerator.generate_merchant_info(account_id)
+    qr += "5204" + "4111" + "5303764"
+    if amount_satang is not None:
+        qr += "54" + PromptPayQRGenerator.encode_length_value(f"{amount_satang / 100:.2f}")
+    qr += "5802TH"
+    qr += "59" + PromptPayQRGenerator.encode_length_value("MERCHANT")
+    qr += "60" + PromptPayQRGenerator.encode_length_value("BANGKOK")
+    return qr + "6304" + crc(qr + "6304")
+
+
+def throughput(fn, orders) -> float:
+    start = time.perf_counter()
+    for account_id, amount in orders:
+        fn(account_id, amount)
+    return len(orders) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--merchants", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    merchants = [f"08{rng.randrange(10 ** 8):08d}" for _ in range(args.merchants)]
+    orders = [(rng.choice(merchants), rng.randrange(100, 5000001)) for _ in range(args.orders)]
+
+    table_crc = lambda data: emvco.format_crc(emvco.crc16(data))
+    for account_id, amount in orders[:1000]:
+        assert rebuild_payload(account_id, amount, legacy_crc) == PromptPayQRGenerator.generate_qr_payload(account_id, amount)
+
+    print(f"{args.orders} orders across {args.merchants} merchant accounts")
+    rows = [
+        ("rebuild + bitwise CRC", lambda account_id, amount: rebuild_payload(account_id, amount, legacy_crc)),
+        ("rebuild + table CRC", lambda account_id, amount: rebuild_payload(account_id, amount, table_crc)),
+        ("merchant template", PromptPayQRGenerator.generate_qr_payload),
+    ]
+    for label, fn in rows:
+        print(f"  {label:<24} {throughput(fn, orders):>10,.0f} payloads/s")
+
+
+if __name__ == "__main__":
+    main()
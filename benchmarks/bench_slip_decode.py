@@ -0,0 +1,84 @@
+"""
+Per-slip image preparation: legacy double decode vs shared SlipImage context
+
+Run from the repository root:
+    python -m benchmarks.bench_slip_decode [--runs N] [--width W --height H]
+
+The legacy path mirrors what read_qr_from_image + extract_text_from_image
+did before the shared context: two BGR decodes, two cvtColor calls, then
+the CLAHE/Otsu/inverted and upscaled/threshold images. Only image
+preparation is timed; pyzbar and Tesseract costs are identical in both.
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks._slips import make_slip
+from qr_cascade import InvertStrategy, OtsuStrategy
+from qr_reader import SlipImage
+
+
+def legacy_prepare(image_bytes: bytes) -> None:
+    # QR stage
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    cv2.bitwise_not(thresh)
+
+    # OCR stage
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    upscaled = cv2.resize(gray, (gray.shape[1] * 2, gray.shape[0] * 2), interpolation=cv2.INTER_CUBIC)
+    cv2.threshold(upscaled, 150, 255, cv2.THRESH_BINARY)
+
+
+def context_prepare(image_bytes: bytes) -> None:
+    slip = SlipImage(image_bytes)
+    next(OtsuStrategy().images(slip.gray))
+    next(InvertStrategy().images(slip.gray))
+    slip.ocr_binary
+
+
+def measure(fn, image_bytes: bytes, runs: int):
+    fn(image_bytes)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(image_bytes)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(image_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    image_bytes = make_slip(args.width, args.height, seed=1)
+    megapixels = args.width * args.height / 1e6
+    print(f"slip: {megapixels:.1f} MP, {len(image_bytes) / 1024:.0f} KiB JPEG, {args.runs} runs")
+
+    legacy_time, legacy_peak = measure(legacy_prepare, image_bytes, args.runs)
+    context_time, context_peak = measure(context_prepare, image_bytes, args.runs)
+
+    print(f"{'path':<10}{'median ms':>12}{'peak MiB':>12}")
+    print(f"{'legacy':<10}{legacy_time * 1000:>12.1f}{legacy_peak / 2**20:>12.1f}")
+    print(f"{'context':<10}{context_time * 1000:>12.1f}{context_peak / 2**20:>12.1f}")
+    print(f"saved: {(legacy_time - context_time) * 1000:.1f} ms, {(legacy_peak - context_peak) / 2**20:.1f} MiB per slip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Slip ingestion: legacy `await file.read()` vs capped, header-checked readinto
+
+Run from the repository root:
+    python -m benchmarks.bench_slip_ingest [--uploads N] [--width W --height H]
+
+Each upload is a SpooledTemporaryFile holding a JPEG slip, as Starlette
+hands it to the endpoint. The legacy path reads the whole file into a new
+bytes object and decodes it; the ingest path sizes the spool, probes the
+header and fills one preallocated buffer while hashing it. Peak traced
+memory is reported for N uploads held concurrently (the in-flight state of
+N parallel requests), plus the cost of refusing a decompression bomb from
+its header versus handing it to cv2.imdecode.
+"""
+
+import argparse
+import hashlib
+import io
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks._slips import make_slip
+from config import settings
+from slip_upload import SlipRejected, ingest_slip_file
+
+
+def spool(data: bytes):
+    # Starlette's UploadFile spools to disk past 1 MB
+    fp = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    fp.write(data)
+    fp.seek(0)
+    return fp
+
+
+def legacy_ingest(fp):
+    contents = fp.read()
+    if not contents:
+        raise ValueError("File is empty")
+    hashlib.sha256(contents).hexdigest()
+    return contents
+
+
+def capped_ingest(fp):
+    return ingest_slip_file(fp, settings.SLIP_MAX_UPLOAD_BYTES, settings.SLIP_MAX_PIXELS).data
+
+
+def measure(fn, data: bytes, uploads: int):
+    files = [spool(data) for _ in range(uploads)]
+    timings = []
+    held = []
+    tracemalloc.start()
+    for fp in files:
+        start = time.perf_counter()
+        held.append(fn(fp))
+        timings.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for fp in files:
+        fp.close()
+    return statistics.median(timings), peak
+
+
+def decompression_bomb(side: int) -> bytes:
+    # A flat 1-bit PNG compresses to almost nothing but decodes to side*side pixels
+    buffer = io.BytesIO()
+    Image.new("1", (side, side)).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--width", type=int, default=1080)
+    parser.add_argument("--height", type=int, default=2340)
+    parser.add_argument("--bomb-side", type=int, default=20000)
+    args = parser.parse_args()
+
+    data = make_slip(args.width, args.height)
+    print(f"slip: {args.width}x{args.height} JPEG, {len(data) / 1024:.0f} KiB; {args.uploads} concurrent uploads")
+
+    for label, fn in (("legacy file.read()", legacy_ingest), ("capped readinto", capped_ingest)):
+        median, peak = measure(fn, data, args.uploads)
+        print(
+            f"  {label:<20} {median * 1000:7.2f} ms/upload   "
+            f"peak {peak / 1024 / 1024:7.1f} MiB ({peak / args.uploads / 1024:.0f} KiB/upload)"
+        )
+
+    bomb = decompression_bomb(args.bomb_side)
+    print(f"\nbomb: {args.bomb_side}x{args.bomb_side} PNG, {len(bomb) / 1024:.0f} KiB")
+
+    start = time.perf_counter()
+    try:
+        ingest_slip_file(spool(bomb), settings.SLIP_MAX_UPLOAD_BYTES, settings.SLIP_MAX_PIXELS)
+    except SlipRejected as e:
+        print(f"  header check rejected in {(time.perf_counter() - start) * 1000:.2f} ms: {e}")
+
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(bomb, np.uint8), cv2.IMREAD_GRAYSCALE)
+    elapsed = time.perf_counter() - start
+    decoded = "failed" if image is None else f"{image.nbytes / 1024 / 1024:.0f} MiB"
+    print(f"  cv2.imdecode took {elapsed * 1000:.0f} ms, decoded {decoded}")
+
+
+if __name__ == "__main__":
+    main()
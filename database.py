@@ -1,7 +1,23 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config import settings
 
+# Async driver per backend for the request-path engine
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with the backend's async driver, e.g. postgresql:// -> postgresql+asyncpg://"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} (set DATABASE_ASYNC_URL)")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+# Sync engine: startup (migrations), scripts and benchmarks
 engine = create_engine(
     settings.DATABASE_URL,
     echo=False,
@@ -12,6 +28,17 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine: the FastAPI endpoints, so DB round trips do not block the event loop
+_async_url = make_url(settings.DATABASE_ASYNC_URL or async_database_url(settings.DATABASE_URL))
+_async_pool = {} if _async_url.get_backend_name() == "sqlite" else {  # aiosqlite: a connection per session
+    "pool_size": settings.DATABASE_ASYNC_POOL_SIZE,
+    "max_overflow": settings.DATABASE_ASYNC_MAX_OVERFLOW,
+}
+async_engine = create_async_engine(_async_url, echo=False, **_async_pool)
+
+# expire_on_commit=False: attributes stay readable after commit without an implicit (blocking) reload
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -19,3 +46,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -10,6 +10,7 @@ Amount: 1500.50 THB (example)
 
 import json
 from datetime import datetime
+from money import to_satang
 from payment_service import PromptPayQRGenerator
 from schemas import OrderStatus, TransactionStatus, VerificationStatus
 
@@ -39,7 +40,7 @@ print()
 # Generate QR payload
 qr_payload = PromptPayQRGenerator.generate_qr_payload(
     account_id=merchant_account,
-    amount=customer_order_amount
+    amount_satang=to_satang(customer_order_amount)
 )
 
 print(f"Generated QR Payload (EMVCo Format):")
@@ -0,0 +1,201 @@
+import binascii
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CRC_INIT = 0xFFFF
+# EMVCo payload CRC (tag 63) / PromptPay slip-verification CRC (tag 91);
+# either is the last data object and covers everything before its value
+CRC_TAGS = ("63", "91")
+CRC_FIELD_LENGTH = 8  # tag + length + 4 hex digits
+
+# Top-level data object IDs (EMVCo merchant-presented QR / Thai QR Payment)
+TAG_PAYLOAD_FORMAT = "00"
+TAG_POINT_OF_INITIATION = "01"
+TAG_PROMPTPAY = "29"  # credit transfer: 00 AID, 01 mobile, 02 national ID, 03 e-wallet
+TAG_BILL_PAYMENT = "30"  # 00 AID, 01 biller ID, 02 reference 1, 03 reference 2
+TAG_MERCHANT_CATEGORY = "52"
+TAG_CURRENCY = "53"
+TAG_AMOUNT = "54"
+TAG_COUNTRY = "58"
+TAG_MERCHANT_NAME = "59"
+TAG_CITY = "60"
+TAG_ADDITIONAL_DATA = "62"  # 01 bill number, 05 reference label, 07 terminal label
+TAG_CRC = "63"
+
+# Bank slip-verification QR: a template under 00 (00 API ID, 01 sending bank
+# code, 02 transaction reference), then 51 country and 91 CRC
+TAG_SLIP_VERIFICATION = "00"
+
+
+def crc16(data: str, state: int = CRC_INIT) -> int:
+    """
+    CRC-16/CCITT-FALSE of the UTF-8 payload text, continuing from state
+
+    binascii.crc_hqx is polynomial 0x1021 run by CPython's table-driven C
+    loop; seeded with 0xFFFF it is exactly the EMVCo checksum. Passing a
+    previous result as state extends it, so a fixed payload prefix can be
+    checksummed once and reused.
+    """
+    return binascii.crc_hqx(data.encode("utf-8"), state)
+
+
+def format_crc(value: int) -> str:
+    """Four upper-case hex digits, as carried in the payload"""
+    return f"{value:04X}"
+
+
+def append_crc(payload: str, tag: str = "63") -> str:
+    """Append the CRC data object to a payload that ends just before it"""
+    body = payload + tag + "04"
+    return body + format_crc(crc16(body))
+
+
+def split_crc(payload: str) -> Optional[str]:
+    """The declared CRC (hex digits) if the payload ends in a CRC data object"""
+    if len(payload) < CRC_FIELD_LENGTH:
+        return None
+    tag, length = payload[-8:-6], payload[-6:-4]
+    if tag not in CRC_TAGS or length != "04":
+        return None
+    return payload[-4:]
+
+
+def verify_crc(payload: str) -> bool:
+    """
+    True when the payload ends in a CRC data object that matches its content
+
+    Payloads without a trailing CRC object are not valid EMVCo QRs and
+    fail verification.
+    """
+    declared = split_crc(payload)
+    if declared is None:
+        return False
+    return declared.upper() == format_crc(crc16(payload[:-4]))
+
+
+class TLVError(ValueError):
+    """Raised when a payload is not a well-formed sequence of EMVCo data objects"""
+
+
+def parse_spans(payload: str, start: int = 0, end: Optional[int] = None) -> Dict[str, Tuple[int, int]]:
+    """
+    Single pass over the data objects in payload[start:end]
+
+    Each object is a 2-character ID, a 2-digit length and the value. Only
+    the ID is sliced; lengths are read from the characters directly and
+    values are returned as (value_start, value_end) offsets into payload.
+    When an ID repeats, the first occurrence wins.
+
+    Raises:
+        TLVError: non-numeric length, or an object running past end
+    """
+    end = len(payload) if end is None else end
+    spans = {}
+    i = start
+    while i < end:
+        if i + 4 > end:
+            raise TLVError(f"Truncated data object header at offset {i}")
+        high = ord(payload[i + 2]) - 48
+        low = ord(payload[i + 3]) - 48
+        if not (0 <= high <= 9 and 0 <= low <= 9):
+            raise TLVError(f"Non-numeric length at offset {i}")
+        value_start = i + 4
+        value_end = value_start + high * 10 + low
+        if value_end > end:
+            raise TLVError(f"Data object at offset {i} runs past the end of its template")
+        spans.setdefault(payload[i:i + 2], (value_start, value_end))
+        i = value_end
+    return spans
+
+
+class TLVNode:
+    """
+    A parsed EMVCo template: the payload itself or a nested template in it
+
+    The object list is parsed on first access and nested templates (29/30
+    merchant account information, 62 additional data, the slip-verification
+    template under 00) only when template() is asked for them; values are
+    sliced from the shared payload string on access.
+    """
+
+    __slots__ = ("payload", "start", "end", "_spans", "_templates")
+
+    def __init__(self, payload: str, start: int = 0, end: Optional[int] = None):
+        self.payload = payload
+        self.start = start
+        self.end = len(payload) if end is None else end
+        self._spans: Optional[Dict[str, Tuple[int, int]]] = None
+        self._templates: Dict[str, Optional["TLVNode"]] = {}
+
+    @property
+    def spans(self) -> Dict[str, Tuple[int, int]]:
+        if self._spans is None:
+            self._spans = parse_spans(self.payload, self.start, self.end)
+        return self._spans
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self.spans
+
+    def tags(self) -> List[str]:
+        return list(self.spans)
+
+    def get(self, tag: str, default: Optional[str] = None) -> Optional[str]:
+        """Value of a data object, or default when absent"""
+        span = self.spans.get(tag)
+        if span is None:
+            return default
+        return self.payload[span[0]:span[1]]
+
+    def template(self, tag: str) -> Optional["TLVNode"]:
+        """The data object's value parsed as a nested template, or None when absent or malformed"""
+        if tag not in self._templates:
+            span = self.spans.get(tag)
+            node = None
+            if span is not None:
+                node = TLVNode(self.payload, span[0], span[1])
+                try:
+                    node.spans
+                except TLVError:
+                    node = None
+            self._templates[tag] = node
+        return self._templates[tag]
+
+    def find(self, *path: str) -> Optional[str]:
+        """Value at a template path, e.g. find("29", "01")"""
+        node = self
+        for tag in path[:-1]:
+            node = node.template(tag)
+            if node is None:
+                return None
+        return node.get(path[-1])
+
+
+def parse_payload(payload: str) -> TLVNode:
+    """
+    Parse the top level of a QR payload
+
+    Raises:
+        TLVError: the payload is not a well-formed data object sequence
+    """
+    node = TLVNode(payload)
+    node.spans
+    return node
+
+
+def parse_many(payloads: Iterable[str], verify: bool = True) -> List[Optional[TLVNode]]:
+    """
+    Batch parse, e.g. for reconciling thousands of stored payloads
+
+    Returns one entry per payload: its top-level node, or None when it is
+    malformed (or, with verify, fails the CRC check). Nested templates stay
+    unparsed until accessed.
+    """
+    nodes = []
+    for payload in payloads:
+        if verify and not verify_crc(payload):
+            nodes.append(None)
+            continue
+        try:
+            nodes.append(parse_payload(payload))
+        except TLVError:
+            nodes.append(None)
+    return nodes
@@ -1,19 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks, Header, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+import asyncio
+import hmac
 import logging
 from datetime import datetime
+from typing import List, Optional
 import io
 import os
 import time
 
 from config import settings
-from database import engine, get_db, Base
-from models import Order, Transaction, OrderStatus, TransactionStatus, SlipVerification, VerificationStatus
+from database import engine, async_engine, get_async_db, SessionLocal, AsyncSessionLocal
+from models import PENDING_ORDER, AmountSlot, Order, Transaction, OrderStatus, TransactionStatus, SlipVerification, VerificationStatus
 import schemas
-from payment_service import PromptPayQRGenerator, extract_amount_from_text
-from qr_reader import SlipQRReader
+from payment_service import PromptPayQRGenerator
+from notification_parser import get_notification_registry
+from qr_reader import SlipQRReader, OCRStatus
+from slip_workers import SlipAnalysisPool, AnalysisQueueFull, AnalysisTimeout
+from slip_cache import SlipAnalysisCache
+from slip_phash import PerceptualHashIndex
+from slip_upload import SlipUpload, SlipRejected, read_slip_upload
+from qr_cascade import CascadeStats
+from qr_images import QRImageCache, QR_IMAGE_MEDIA_TYPES, qr_image_etag
+from amount_slots import AmountSlotAllocator, AmountSlotsExhausted
+from pending_orders import PendingOrderIndex
+from webhook_ingest import NotificationWriter, parse_notification, record_each, record_notifications
+from reconciliation import NotificationReconciler
+from order_expiry import OrderExpirySweeper, order_expires_at
+from money import format_baht, to_baht, to_satang
+from migrations import run_migrations
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,15 +41,15 @@ logger = logging.getLogger(__name__)
 
 # Initialize database tables with retry logic
 def init_db():
-    """Initialize database tables with retry logic for PostgreSQL startup"""
+    """Bring the database schema up to date (migrations.py), with retry logic for PostgreSQL startup"""
     max_retries = 5
     retry_delay = 2
     
     for attempt in range(max_retries):
         try:
-            logger.info(f"Attempting to create database tables (attempt {attempt + 1}/{max_retries})...")
-            Base.metadata.create_all(bind=engine)
-            logger.info("✓ Database tables created successfully")
+            logger.info(f"Attempting to migrate database (attempt {attempt + 1}/{max_retries})...")
+            applied = run_migrations(engine)
+            logger.info(f"✓ Database schema up to date ({len(applied)} migrations applied)")
             return True
         except Exception as e:
             logger.warning(f"Database init failed: {str(e)}")
@@ -41,6 +61,35 @@ def init_db():
                 return False
     return False
 
+def hydrate_phash_index():
+    """Load stored perceptual hashes into the near-duplicate index"""
+    db = SessionLocal()
+    try:
+        phash_index.refresh(db)
+        logger.info(f"✓ Perceptual hash index loaded ({len(phash_index)} slips)")
+    except Exception as e:
+        logger.warning(f"Perceptual hash index not loaded: {str(e)}")
+    finally:
+        db.close()
+
+# CPU-bound slip analysis runs in worker processes, off the event loop
+analysis_pool = SlipAnalysisPool.from_settings()
+analysis_cache = SlipAnalysisCache.from_settings()
+phash_index = PerceptualHashIndex.from_settings()
+# Preprocessing cascade outcomes reported back by the workers
+cascade_stats = CascadeStats()
+qr_image_cache = QRImageCache.from_settings()
+# Unique cent slots for pending order amounts
+amount_slots = AmountSlotAllocator.from_settings()
+# Pending orders by amount, so slip matching needs no query; follows the database from startup
+pending_orders = PendingOrderIndex.from_settings()
+# Group commit for POST /api/webhook/linebk
+notification_writer = NotificationWriter.from_settings(AsyncSessionLocal)
+# Bank notifications complete their pending orders without a slip
+reconciler = NotificationReconciler.from_settings(amount_slots, pending_orders)
+# Pending orders past their expires_at expire (one worker sweeps at a time)
+expiry_sweeper = OrderExpirySweeper.from_settings(amount_slots, pending_orders)
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -53,8 +102,42 @@ async def startup_event():
     """Initialize database when app starts"""
     logger.info("FastAPI app starting up...")
     init_db()
+    hydrate_phash_index()
+    analysis_pool.start()
+    pending_orders.start(async_engine, AsyncSessionLocal)
+    if settings.RECONCILE_ENABLED and not settings.WEBHOOK_SECRET:
+        logger.warning("Reconciliation not started: RECONCILE_ENABLED needs WEBHOOK_SECRET set")
+    elif settings.RECONCILE_ENABLED:
+        reconciler.start(AsyncSessionLocal)
+    if settings.ORDER_EXPIRY_ENABLED:
+        expiry_sweeper.start(async_engine, AsyncSessionLocal)
     logger.info("✓ Application startup complete")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and close database connections"""
+    analysis_pool.shutdown()
+    await notification_writer.close()
+    await reconciler.stop()
+    await expiry_sweeper.stop()
+    await pending_orders.stop()
+    await async_engine.dispose()
+
+
+@app.middleware("http")
+async def limit_slip_upload_size(request, call_next):
+    """Refuse an oversized single-slip upload from its Content-Length, before the body is read"""
+    if request.url.path == "/api/payment/upload-slip":
+        length = request.headers.get("content-length")
+        # Multipart framing and form fields ride on top of the file itself
+        if length and length.isdigit() and int(length) > settings.SLIP_MAX_UPLOAD_BYTES + 64 * 1024:
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"Upload exceeds {settings.SLIP_MAX_UPLOAD_BYTES} bytes"}
+            )
+    return await call_next(request)
+
 # ============================================================================
 # ENDPOINT 1: Generate QR Code (POST /api/payment/generate-qr)
 # ============================================================================
@@ -66,71 +149,81 @@ async def startup_event():
 )
 async def generate_qr(
     request: schemas.GenerateQRRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Generate PromptPay QR Code for payment
     
     - **order_id**: Unique order identifier
     - **amount**: Payment amount in Thai Baht (will add random cent for matching)
+    - **ttl_minutes**: Minutes the order stays payable (default ORDER_PENDING_TTL_MINUTES)
     """
     
     try:
         # Check if order already exists
-        existing_order = db.query(Order).filter(
-            Order.order_id == request.order_id
-        ).first()
+        existing_order = (await db.execute(
+            select(Order).where(Order.order_id == request.order_id)
+        )).scalars().first()
         
         if existing_order:
-            # Return existing order
-            qr_payload = PromptPayQRGenerator.generate_qr_payload(
-                account_id=request.order_id,
-                amount=existing_order.amount
-            )
+            # Return existing order with the payload issued for it
+            qr_payload = await order_qr_payload(db, existing_order)
             
             return schemas.GenerateQRResponse(
                 order_id=existing_order.order_id,
                 amount=existing_order.amount,
+                amount_satang=existing_order.amount_satang,
                 qr_payload=qr_payload,
                 qr_raw_data=qr_payload,
-                created_at=existing_order.created_at
+                created_at=existing_order.created_at,
+                expires_at=existing_order.expires_at
             )
         
-        # Add micro-transaction (random decimal for accurate matching)
-        final_amount = PromptPayQRGenerator.add_micro_transaction(request.amount)
+        # Reserve a unique amount (random cents no other pending order holds)
+        amount_satang = await db.run_sync(amount_slots.reserve, request.order_id, to_satang(request.amount))
         
-        # Create new order
+        # Generate PromptPay QR Code from the merchant's cached payload template
+        # Falls back to order_id as the account ID when no merchant PromptPay ID is configured
+        qr_payload = PromptPayQRGenerator.generate_qr_payload(
+            account_id=settings.PROMPTPAY_ACCOUNT_ID or request.order_id,  # Could be phone or national ID
+            amount_satang=amount_satang
+        )
+        
+        # Create new order, storing the payload so repeat calls are a plain read
+        now = datetime.utcnow()
         db_order = Order(
             order_id=request.order_id,
-            amount=final_amount,
+            amount_satang=amount_satang,
+            qr_payload=qr_payload,
             status=OrderStatus.pending,
-            created_at=datetime.utcnow()
+            created_at=now,
+            expires_at=order_expires_at(now, request.ttl_minutes)
         )
         db.add(db_order)
-        db.flush()  # Get the ID without committing
-        
-        # Generate PromptPay QR Code
-        # Using order_id as the account ID (in real scenario, use merchant PromptPay ID)
-        qr_payload = PromptPayQRGenerator.generate_qr_payload(
-            account_id=request.order_id,  # Could be phone or national ID
-            amount=final_amount
-        )
+        await db.commit()
+        await db.refresh(db_order)
         
-        db.commit()
-        db.refresh(db_order)
-        
-        logger.info(f"QR generated for order {request.order_id} with amount {final_amount}")
+        logger.info(f"QR generated for order {request.order_id} with amount {format_baht(amount_satang)}")
         
         return schemas.GenerateQRResponse(
             order_id=db_order.order_id,
             amount=db_order.amount,
+            amount_satang=db_order.amount_satang,
             qr_payload=qr_payload,
             qr_raw_data=qr_payload,
-            created_at=db_order.created_at
+            created_at=db_order.created_at,
+            expires_at=db_order.expires_at
         )
         
+    except AmountSlotsExhausted as e:
+        await db.rollback()
+        logger.warning(f"Amount slots exhausted for order {request.order_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error generating QR: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -138,20 +231,209 @@ async def generate_qr(
         )
 
 
+@app.post(
+    "/api/payment/generate-qr/bulk",
+    response_model=schemas.BulkGenerateQRResponse,
+    tags=["Payment"]
+)
+async def generate_qr_bulk(
+    request: schemas.BulkGenerateQRRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create many orders and their PromptPay QR payloads at once (flash sales)
+    
+    - Amounts get a random cent, distinct from each other and from pending orders (amount slots)
+    - All new orders go in with one multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING
+    - order_ids that already exist are returned unchanged, as with the single endpoint
+    """
+    if len(request.orders) > settings.BULK_ORDER_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.BULK_ORDER_MAX} orders per request"
+        )
+    
+    try:
+        # First occurrence of a repeated order_id wins
+        requested = {}
+        ttl_minutes = {}
+        for item in request.orders:
+            requested.setdefault(item.order_id, to_satang(item.amount))
+            ttl_minutes.setdefault(item.order_id, item.ttl_minutes)
+        
+        # Orders created earlier keep their amount and payload
+        existing = {
+            row.order_id: row for row in await db.execute(select(
+                Order.order_id, Order.amount_satang, Order.qr_payload, Order.created_at, Order.expires_at
+            ).where(Order.order_id.in_(list(requested))))
+        }
+        new = {order_id: amount for order_id, amount in requested.items() if order_id not in existing}
+        
+        inserted = {}
+        if new:
+            amounts = await db.run_sync(amount_slots.reserve_many, new.items())
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "order_id": order_id,
+                    "amount_satang": amount,
+                    "qr_payload": PromptPayQRGenerator.generate_qr_payload(
+                        account_id=settings.PROMPTPAY_ACCOUNT_ID or order_id,
+                        amount_satang=amount
+                    ),
+                    "status": OrderStatus.pending,
+                    "created_at": now,
+                    "updated_at": now,
+                    "expires_at": order_expires_at(now, ttl_minutes[order_id])
+                }
+                for order_id, amount in amounts.items()
+            ]
+            
+            dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+            statement = dialect.insert(Order).values(rows).on_conflict_do_nothing(
+                index_elements=[Order.order_id]
+            ).returning(Order.order_id, Order.amount_satang, Order.qr_payload, Order.created_at, Order.expires_at)
+            inserted = {row.order_id: row for row in await db.execute(statement)}
+            
+            # Lost a race with a concurrent request creating the same order_id
+            raced = [order_id for order_id in new if order_id not in inserted]
+            if raced:
+                await db.execute(delete(AmountSlot).where(
+                    AmountSlot.order_id.in_(raced),
+                    AmountSlot.amount_satang.in_([amounts[order_id] for order_id in raced])
+                ))
+                existing.update({
+                    row.order_id: row for row in await db.execute(select(
+                        Order.order_id, Order.amount_satang, Order.qr_payload, Order.created_at, Order.expires_at
+                    ).where(Order.order_id.in_(raced)))
+                })
+        
+        backfill = [order_id for order_id, row in existing.items() if row.qr_payload is None]
+        if backfill:
+            for order in (await db.execute(select(Order).where(Order.order_id.in_(backfill)))).scalars().all():
+                await order_qr_payload(db, order)
+                existing[order.order_id] = order
+        
+        await db.commit()
+        
+        orders = []
+        for order_id in requested:
+            row = inserted.get(order_id) or existing[order_id]
+            orders.append(schemas.GenerateQRResponse(
+                order_id=row.order_id,
+                amount=to_baht(row.amount_satang),
+                amount_satang=row.amount_satang,
+                qr_payload=row.qr_payload,
+                qr_raw_data=row.qr_payload,
+                created_at=row.created_at,
+                expires_at=row.expires_at
+            ))
+        
+        logger.info(f"Bulk QR generation: {len(inserted)} created, {len(existing)} existing")
+        
+        return schemas.BulkGenerateQRResponse(
+            created=len(inserted),
+            existing=len(existing),
+            orders=orders
+        )
+        
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error generating QR codes in bulk: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate QR codes: {str(e)}"
+        )
+
+
+async def order_qr_payload(db: AsyncSession, order: Order) -> str:
+    """The payload issued for an order, backfilling orders created before payloads were stored"""
+    if order.qr_payload is None:
+        order.qr_payload = PromptPayQRGenerator.generate_qr_payload(
+            account_id=settings.PROMPTPAY_ACCOUNT_ID or order.order_id,
+            amount_satang=order.amount_satang
+        )
+        await db.commit()
+    return order.qr_payload
+
+
+@app.get(
+    "/api/payment/qr/{order_id}",
+    tags=["Payment"],
+    responses={
+        200: {"content": {"image/png": {}, "image/svg+xml": {}}},
+        304: {"description": "Not modified"}
+    }
+)
+async def get_qr_image(
+    order_id: str,
+    format: str = "png",
+    if_none_match: str = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Rendered QR image for an order's payload (PNG or SVG)
+    
+    Images are content-addressed by payload, so the strong ETag is known
+    before rendering and a matching If-None-Match returns 304 without
+    touching the image cache.
+    """
+    if format not in QR_IMAGE_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format '{format}', use one of: {', '.join(QR_IMAGE_MEDIA_TYPES)}"
+        )
+    
+    order = (await db.execute(select(Order).where(Order.order_id == order_id))).scalars().first()
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Order {order_id} not found"
+        )
+    qr_payload = await order_qr_payload(db, order)
+    
+    headers = {
+        "ETag": qr_image_etag(qr_payload, format),
+        "Cache-Control": f"public, max-age={settings.QR_IMAGE_MAX_AGE}, immutable"
+    }
+    if if_none_match and (if_none_match.strip() == "*" or headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    image, _ = await run_in_threadpool(qr_image_cache.get_or_render, qr_payload, format)
+    return Response(content=image, media_type=QR_IMAGE_MEDIA_TYPES[format], headers=headers)
+
+
 # ============================================================================
 # ENDPOINT 2: Webhook Receiver for LINE Bank Notification
 # POST /api/webhook/linebk
 # ============================================================================
 
+def verify_webhook_secret(x_webhook_secret: Optional[str] = Header(None)):
+    """Reject webhook calls without the relay's shared secret (when WEBHOOK_SECRET is set)"""
+    if not settings.WEBHOOK_SECRET:
+        return
+    if x_webhook_secret is None or not hmac.compare_digest(
+        x_webhook_secret.encode("utf-8"), settings.WEBHOOK_SECRET.encode("utf-8")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing X-Webhook-Secret"
+        )
+
+
 @app.post(
     "/api/webhook/linebk",
     response_model=schemas.WebhookResponse,
-    tags=["Webhook"]
+    tags=["Webhook"],
+    dependencies=[Depends(verify_webhook_secret)]
 )
-async def receive_line_notification(
-    request: schemas.WebhookLineNotification,
-    db: Session = Depends(get_db)
-):
+async def receive_line_notification(request: schemas.WebhookLineNotification):
     """
     Receive webhook notification from Android app (LINE Bank notification)
     
@@ -162,246 +444,521 @@ async def receive_line_notification(
         "text": "เงินเข้า 100.50 บาท เวลา 12:00",
         "timestamp": 1678888888
     }
+    
+    Notifications arriving together share one INSERT ... ON CONFLICT (ref_id)
+    DO NOTHING and one commit (notification_writer); the response is sent
+    once this notification's group has committed.
     """
     
-    try:
-        # Extract amount from notification text using regex
-        amount = extract_amount_from_text(request.text)
-        
-        if amount is None:
-            logger.warning(f"Could not extract amount from text: {request.text}")
-            return schemas.WebhookResponse(
-                success=False,
-                message="Could not extract amount from notification"
-            )
-        
-        # Generate reference ID from timestamp and amount
-        # In real scenario, this would come from the bank notification
-        ref_id = f"{request.timestamp}_{amount}".replace(".", "")
-        
-        # Check if this transaction already exists
-        existing_tx = db.query(Transaction).filter(
-            Transaction.ref_id == ref_id
-        ).first()
-        
-        if existing_tx:
-            logger.info(f"Transaction already recorded: {ref_id}")
-            return schemas.WebhookResponse(
-                success=True,
-                message="Transaction already recorded",
-                transaction_id=existing_tx.id
-            )
-        
-        # Create new transaction record
-        db_transaction = Transaction(
-            ref_id=ref_id,
-            amount=amount,
-            bank_id=None,  # Will be extracted from slip QR
-            status=TransactionStatus.pending_slip,
-            notification_text=request.text,
-            created_at=datetime.utcnow()
-        )
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
-        
-        logger.info(f"Webhook recorded: ref_id={ref_id}, amount={amount}")
-        
+    # Match the text against the bank notification templates (one combined regex)
+    parsed = parse_notification(request.text, request.timestamp)
+    
+    if parsed is None:
+        logger.warning(f"Could not extract amount from text: {request.text}")
         return schemas.WebhookResponse(
-            success=True,
-            message="Notification received and recorded",
-            transaction_id=db_transaction.id
+            success=False,
+            message="Could not extract amount from notification"
         )
-        
+    
+    try:
+        transaction_id, inserted = await notification_writer.submit(parsed.row)
     except Exception as e:
-        db.rollback()
         logger.error(f"Error processing webhook: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process webhook: {str(e)}"
         )
+    
+    if not inserted:
+        logger.info(f"Transaction already recorded: {parsed.ref_id}")
+        return schemas.WebhookResponse(
+            success=True,
+            message="Transaction already recorded",
+            transaction_id=transaction_id
+        )
+    
+    notification = parsed.notification
+    logger.info(
+        f"Webhook recorded: ref_id={parsed.ref_id}, amount={format_baht(notification.amount_satang)}, "
+        f"template={notification.template}, account={notification.account}, time={notification.time}, "
+        f"reference={notification.reference}"
+    )
+    
+    return schemas.WebhookResponse(
+        success=True,
+        message="Notification received and recorded",
+        transaction_id=transaction_id
+    )
 
 
-# ============================================================================
-# ENDPOINT 3: Upload Slip and Verify Payment
-# POST /api/payment/upload-slip
-# ============================================================================
-
 @app.post(
-    "/api/payment/upload-slip",
-    response_model=schemas.UploadSlipResponse,
-    tags=["Payment"]
+    "/api/webhook/linebk/batch",
+    response_model=schemas.WebhookBatchResponse,
+    tags=["Webhook"],
+    dependencies=[Depends(verify_webhook_secret)]
 )
-async def upload_slip(
-    file: UploadFile = File(...),
-    order_id: str = None,
-    db: Session = Depends(get_db)
+async def receive_line_notifications(
+    request: schemas.WebhookBatchRequest,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Upload slip image with 100% strict verification
+    Receive many LINE Bank notifications at once (the relay replaying a backlog)
     
-    - Comprehensive QR + OCR dual analysis
-    - STRICT amount matching (no tolerance)
-    - Duplicate detection
-    - Detailed audit trail
-    - Manual review for edge cases
+    - All recognised notifications go in with multi-row INSERT ... ON CONFLICT (ref_id) DO NOTHING RETURNING
+    - Already recorded ones (earlier deliveries, repeats within the batch) come back as duplicates
+    - One transaction for the whole batch; if it fails, the rows are recorded one by one
+      and only the ones that fail again are reported as failed
     """
+    if len(request.notifications) > settings.WEBHOOK_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.WEBHOOK_BATCH_MAX} notifications per request"
+        )
+    
+    now = datetime.utcnow()
+    parsed = [parse_notification(item.text, item.timestamp, now) for item in request.notifications]
+    rows = [item.row for item in parsed if item is not None]
     
     try:
-        # Read file content
-        contents = await file.read()
-        
-        if not contents:
-            raise ValueError("File is empty")
-        
-        # ========== STEP 1: Comprehensive Analysis ==========
-        logger.info(f"Starting comprehensive analysis for {file.filename}")
-        analysis = SlipQRReader.comprehensive_slip_analysis(contents)
-        
-        # ========== STEP 2: Validate QR Found ==========
-        if not analysis["qr_found"]:
-            logger.warning("QR code not found in image")
-            return schemas.UploadSlipResponse(
+        recorded = await record_notifications(db, rows)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Webhook batch insert failed, recording notifications one by one: {str(e)}")
+        recorded = await record_each(db, rows)
+    
+    results = []
+    outcomes = iter(recorded)
+    for item in parsed:
+        if item is None:
+            results.append(schemas.WebhookResponse(
                 success=False,
-                message="❌ QR Code not found in slip image. Please upload a clear slip photo with visible QR code."
-            )
-        
-        qr_amount = analysis["extracted_data"]["qr_amount"]
-        qr_ref_id = analysis["extracted_data"]["qr_ref_id"]
-        ocr_amount = analysis["extracted_data"]["ocr_amount"]
-        
-        if not qr_amount:
-            logger.warning("Could not extract amount from QR code")
+                message="Could not extract amount from notification"
+            ))
+            continue
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            logger.error(f"Error recording notification {item.ref_id}: {str(outcome)}")
+            results.append(schemas.WebhookResponse(
+                success=False,
+                message=f"Failed to record notification: {str(outcome)}"
+            ))
+            continue
+        transaction_id, inserted = outcome
+        results.append(schemas.WebhookResponse(
+            success=True,
+            message="Notification received and recorded" if inserted else "Transaction already recorded",
+            transaction_id=transaction_id
+        ))
+    
+    failed = sum(isinstance(outcome, Exception) for outcome in recorded)
+    new = sum(outcome[1] for outcome in recorded if not isinstance(outcome, Exception))
+    unparsed = len(parsed) - len(recorded)
+    logger.info(
+        f"Webhook batch: {new} recorded, {len(recorded) - new - failed} already recorded, "
+        f"{unparsed} unrecognised, {failed} failed"
+    )
+    
+    return schemas.WebhookBatchResponse(
+        recorded=new,
+        duplicates=len(recorded) - new - failed,
+        unparsed=unparsed,
+        failed=failed,
+        results=results
+    )
+
+
+async def analyze_slip(contents: bytes) -> dict:
+    """Analyze a slip in the worker pool, mapping pool errors to HTTP errors"""
+    try:
+        analysis = await analysis_pool.analyze(contents)
+    except AnalysisQueueFull as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Slip analysis is busy, please retry shortly",
+            headers={"Retry-After": str(settings.SLIP_ANALYSIS_RETRY_AFTER)}
+        )
+    except AnalysisTimeout as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Slip analysis timed out, please upload a clearer image"
+        )
+    record_cascade(analysis)
+    return analysis
+
+
+def record_cascade(analysis: dict):
+    """Fold a fresh analysis's preprocessing cascade record into cascade_stats"""
+    if analysis.get("qr_preprocessing"):
+        cascade_stats.record(analysis["qr_preprocessing"])
+
+
+def get_cached_analysis(db: Session, digest: str, filename: str):
+    """Analysis from the content-hash cache, or None if this slip is new"""
+    analysis = analysis_cache.get(db, digest)
+    if analysis is not None:
+        logger.info(f"Analysis cache hit for {filename} ({digest[:12]})")
+    else:
+        logger.info(f"Starting comprehensive analysis for {filename}")
+    return analysis
+
+
+def analysis_amounts(analysis: dict):
+    """(QR, OCR) amounts in satang; analyses cached before amounts were satang only hold baht floats"""
+    extracted = analysis["extracted_data"]
+    amounts = []
+    for field in ("qr_amount", "ocr_amount"):
+        satang = extracted.get(f"{field}_satang")
+        if satang is None and extracted.get(field) is not None:
+            satang = to_satang(extracted[field])
+        amounts.append(satang)
+    return tuple(amounts)
+
+
+def analysis_ref_id(analysis: dict, qr_amount: int, order: Order):
+    """
+    Transaction reference of a slip paying order: the QR's own, or for a merchant payload
+    its key scoped to the order
+
+    A merchant payload is the same for every order of its amount, and freed amount slots
+    are reused, so the payload alone would make a later order's payment a duplicate of
+    an earlier one. Analyses cached while the unscoped key stood in for the reference
+    hold that key; it is scoped too.
+    """
+    ref_id = analysis["extracted_data"]["qr_ref_id"]
+    payload_key = None
+    if analysis.get("qr_crc_valid"):
+        payload_key = SlipQRReader.payload_ref_id(analysis["qr_data"], qr_amount)
+    if payload_key is not None and ref_id in (None, payload_key):
+        return f"{payload_key}_{order.id}"
+    return ref_id
+
+
+def verify_slip(db: Session, analysis: dict, filename: str, order_id: str = None) -> schemas.UploadSlipResponse:
+    """
+    Steps 2-10 of slip verification: QR validation, STRICT order matching,
+    duplicate / near-duplicate checks and the audit trail
+    
+    Shared by the single and batch upload endpoints so both apply identical
+    matching semantics. Only flushes; the caller commits. Synchronous ORM
+    code: endpoints run it with AsyncSession.run_sync, so its queries still
+    go through the async driver without blocking the event loop.
+    """
+    # ========== STEP 2: Validate QR Found ==========
+    if not analysis["qr_found"]:
+        logger.warning("QR code not found in image")
+        return schemas.UploadSlipResponse(
+            success=False,
+            message="❌ QR Code not found in slip image. Please upload a clear slip photo with visible QR code."
+        )
+    
+    # Corrupted or forged payloads stop here, before any database work
+    if analysis.get("qr_crc_valid") is False:
+        logger.warning("QR payload failed CRC check")
+        return schemas.UploadSlipResponse(
+            success=False,
+            message="❌ QR Code checksum is invalid. The slip QR may be damaged or altered."
+        )
+    
+    qr_amount, ocr_amount = analysis_amounts(analysis)
+    
+    if not qr_amount:
+        logger.warning("Could not extract amount from QR code")
+        return schemas.UploadSlipResponse(
+            success=False,
+            message="❌ Could not extract amount from QR code. QR may be damaged."
+        )
+    
+    # ========== STEP 3: Find Target Order ==========
+    if order_id:
+        order = db.query(Order).filter(Order.order_id == order_id).first()
+        if order and order.status != OrderStatus.pending:
+            logger.warning(f"Order {order.order_id} is {order.status.value}, not pending; slip not applied")
             return schemas.UploadSlipResponse(
                 success=False,
-                message="❌ Could not extract amount from QR code. QR may be damaged."
+                message=f"❌ Order {order.order_id} has already been paid or has expired.",
+                matched_order_id=order.id,
+                order_status=order.status
             )
-        
-        # ========== STEP 3: Find Target Order ==========
-        if order_id:
-            order = db.query(Order).filter(Order.order_id == order_id).first()
-        else:
-            # Try to match by amount (STRICT: must be exact match)
+    else:
+        # Match by amount in satang (STRICT: integer equality); amount slots make it unique among pending orders.
+        # The in-memory index answers without a query; STEP 7 confirms the order is still pending
+        order = pending_orders.match(qr_amount) or amount_slots.match(db, qr_amount)
+        if order is None:
+            # Orders created before amount slots existed hold no slot (idx_pending_amount_created)
             order = db.query(Order).filter(
                 and_(
-                    Order.status == OrderStatus.pending,
-                    Order.amount == qr_amount  # STRICT: no tolerance
+                    Order.status == PENDING_ORDER,
+                    Order.amount_satang == qr_amount  # STRICT: no tolerance
                 )
             ).order_by(Order.created_at.desc()).first()
+    
+    if not order:
+        logger.warning(f"No matching order for amount {format_baht(qr_amount)}")
+        # Create verification record with failure
+        verification = SlipVerification(
+            transaction_id=None,
+            qr_found=True,
+            qr_amount_satang=qr_amount,
+            ocr_amount_satang=ocr_amount,
+            perceptual_hash=analysis.get("perceptual_hash"),
+            amounts_match=False,
+            status=VerificationStatus.rejected,
+            rejection_reason=f"No order found matching amount {format_baht(qr_amount)} exactly"
+        )
+        db.add(verification)
+        db.flush()
         
-        if not order:
-            logger.warning(f"No matching order for amount {qr_amount}")
-            # Create verification record with failure
-            verification = SlipVerification(
-                transaction_id=None,
-                qr_found=True,
-                qr_amount=qr_amount,
-                ocr_amount=ocr_amount,
-                amounts_match=False,
-                status=VerificationStatus.rejected,
-                rejection_reason=f"No order found matching amount {qr_amount} exactly"
-            )
-            db.add(verification)
-            db.commit()
-            
-            return schemas.UploadSlipResponse(
-                success=False,
-                message=f"❌ No order found for amount {qr_amount}. Check if amount is correct.",
-                verification_id=verification.id
-            )
-        
-        # ========== STEP 4: STRICT Amount Matching ==========
-        amount_diff = abs(order.amount - qr_amount)
-        amounts_match = amount_diff == 0  # STRICT: must be exact
-        
-        if not amounts_match:
-            logger.warning(f"Amount mismatch: expected {order.amount}, got {qr_amount}, diff={amount_diff}")
-            return schemas.UploadSlipResponse(
-                success=False,
-                message=f"❌ AMOUNT MISMATCH! Expected {order.amount:,.2f} ฿ but slip shows {qr_amount:,.2f} ฿ (Difference: {amount_diff:,.2f} ฿)"
-            )
-        
-        # ========== STEP 5: Check Duplicate Transaction ==========
-        existing_tx = db.query(Transaction).filter(
-            Transaction.ref_id == qr_ref_id,
-            Transaction.status != TransactionStatus.failed
-        ).first()
-        
-        if existing_tx:
-            logger.warning(f"Duplicate transaction detected: {qr_ref_id}")
-            return schemas.UploadSlipResponse(
-                success=False,
-                message="❌ This transaction has already been used. Duplicate payment detected!"
-            )
-        
-        # ========== STEP 6: Cross-Verify with OCR (if available) ==========
-        ocr_matches = False
-        if ocr_amount:
-            ocr_matches = abs(ocr_amount - qr_amount) < 0.01
-            if not ocr_matches:
-                logger.warning(f"OCR/QR mismatch: QR={qr_amount}, OCR={ocr_amount}")
-        
-        confidence = analysis["confidence"]
-        
-        # ========== STEP 7: Create Transaction ==========
+        return schemas.UploadSlipResponse(
+            success=False,
+            message=f"❌ No order found for amount {format_baht(qr_amount)}. Check if amount is correct.",
+            verification_id=verification.id
+        )
+    
+    # ========== STEP 4: STRICT Amount Matching ==========
+    amount_diff = abs(order.amount_satang - qr_amount)
+    amounts_match = amount_diff == 0  # STRICT: must be exact
+    
+    if not amounts_match:
+        logger.warning(
+            f"Amount mismatch: expected {format_baht(order.amount_satang)}, got {format_baht(qr_amount)}, "
+            f"diff={format_baht(amount_diff)}"
+        )
+        return schemas.UploadSlipResponse(
+            success=False,
+            message=f"❌ AMOUNT MISMATCH! Expected {order.amount:,.2f} ฿ but slip shows {to_baht(qr_amount):,.2f} ฿ (Difference: {to_baht(amount_diff):,.2f} ฿)"
+        )
+    
+    # ========== STEP 5: Check Duplicate Transaction ==========
+    qr_ref_id = analysis_ref_id(analysis, qr_amount, order)
+    existing_tx = db.query(Transaction).filter(
+        Transaction.ref_id == qr_ref_id,
+        Transaction.status != TransactionStatus.failed
+    ).first()
+    
+    if existing_tx:
+        logger.warning(f"Duplicate transaction detected: {qr_ref_id}")
+        return schemas.UploadSlipResponse(
+            success=False,
+            message="❌ This transaction has already been used. Duplicate payment detected!"
+        )
+    
+    # ========== STEP 5b: Near-Duplicate Check (perceptual hash) ==========
+    perceptual_hash = analysis.get("perceptual_hash")
+    near_duplicate = phash_index.find_near_duplicate(db, perceptual_hash, qr_amount)
+    
+    if near_duplicate:
+        duplicate_of_id, distance = near_duplicate
+        logger.warning(
+            f"Near-duplicate slip: matches verification {duplicate_of_id} "
+            f"(distance {distance}), flagging for manual review"
+        )
         transaction = Transaction(
             ref_id=qr_ref_id or f"{int(datetime.utcnow().timestamp())}_{qr_amount}",
-            amount=qr_amount,
+            amount_satang=qr_amount,
             bank_id=analysis["extracted_data"]["qr_ref_id"],
-            status=TransactionStatus.verified,
+            status=TransactionStatus.matched,
             matched_order_id=order.id,
-            slip_image_path=file.filename,
+            slip_image_path=filename,
             created_at=datetime.utcnow()
         )
         db.add(transaction)
         db.flush()
         
-        # ========== STEP 8: Create Detailed Verification Record ==========
         verification = SlipVerification(
             transaction_id=transaction.id,
             qr_found=analysis["qr_found"],
             qr_data=analysis["qr_data"],
-            qr_amount=qr_amount,
+            qr_amount_satang=qr_amount,
             qr_ref_id=qr_ref_id,
             ocr_text=analysis["ocr_text"],
-            ocr_amount=ocr_amount,
+            ocr_amount_satang=ocr_amount,
             ocr_ref_id=analysis["extracted_data"]["ocr_ref_id"],
+            ocr_status=analysis["ocr_status"],
+            perceptual_hash=perceptual_hash,
+            duplicate_of_id=duplicate_of_id,
             amounts_match=amounts_match,
-            amount_difference=amount_diff,
-            order_amount=order.amount,
-            status=VerificationStatus.verified,
-            confidence=confidence,
-            verified_at=datetime.utcnow()
+            amount_difference_satang=amount_diff,
+            order_amount_satang=order.amount_satang,
+            status=VerificationStatus.manual_review,
+            confidence=analysis["confidence"],
+            rejection_reason=f"Near-duplicate of verification {duplicate_of_id} (distance {distance})"
         )
         db.add(verification)
-        
-        # ========== STEP 9: Update Order Status ==========
-        order.status = OrderStatus.completed
-        order.updated_at = datetime.utcnow()
-        
-        db.commit()
-        db.refresh(order)
-        db.refresh(transaction)
-        db.refresh(verification)
-        
-        logger.info(
-            f"✅ PAYMENT VERIFIED: order_id={order.order_id}, "
-            f"amount={order.amount}, confidence={confidence}, "
-            f"qr_match=✓, ocr_match={'✓' if ocr_matches else '✗'}"
-        )
+        db.flush()
         
         return schemas.UploadSlipResponse(
-            success=True,
-            message="✅ Payment verified successfully! All checks passed.",
+            success=False,
+            message="⚠️ This slip closely matches a previously submitted slip and has been sent for manual review.",
             ref_id=qr_ref_id,
-            bank_id=analysis["extracted_data"]["qr_ref_id"],
             matched_order_id=order.id,
-            order_status=OrderStatus.completed,
+            order_status=order.status,
             verification_id=verification.id
         )
+    
+    # ========== STEP 6: Cross-Verify with OCR (if available) ==========
+    ocr_matches = False
+    if ocr_amount:
+        ocr_matches = ocr_amount == qr_amount
+        if not ocr_matches:
+            logger.warning(f"OCR/QR mismatch: QR={format_baht(qr_amount)}, OCR={format_baht(ocr_amount)}")
+    
+    confidence = analysis["confidence"]
+    
+    # ========== STEP 7: Claim Order ==========
+    # Compare-and-set on pending: loses if another slip, an admin or the
+    # expiry sweep changed the order since STEP 3 (the index may lag)
+    claimed = db.execute(
+        update(Order).where(
+            Order.id == order.id, Order.status == PENDING_ORDER
+        ).values(status=OrderStatus.completed, updated_at=datetime.utcnow())
+    ).rowcount
+    if not claimed:
+        pending_orders.discard(order.id)
+        logger.warning(f"Order {order.order_id} is no longer pending; slip not applied")
+        return schemas.UploadSlipResponse(
+            success=False,
+            message=f"❌ Order {order.order_id} has already been paid or has expired.",
+            ref_id=qr_ref_id,
+            matched_order_id=order.id
+        )
+    
+    # ========== STEP 8: Create Transaction ==========
+    transaction = Transaction(
+        ref_id=qr_ref_id or f"{int(datetime.utcnow().timestamp())}_{qr_amount}",
+        amount_satang=qr_amount,
+        bank_id=analysis["extracted_data"]["qr_ref_id"],
+        status=TransactionStatus.verified,
+        matched_order_id=order.id,
+        slip_image_path=filename,
+        created_at=datetime.utcnow()
+    )
+    db.add(transaction)
+    db.flush()
+    
+    # ========== STEP 9: Create Detailed Verification Record ==========
+    verification = SlipVerification(
+        transaction_id=transaction.id,
+        qr_found=analysis["qr_found"],
+        qr_data=analysis["qr_data"],
+        qr_amount_satang=qr_amount,
+        qr_ref_id=qr_ref_id,
+        ocr_text=analysis["ocr_text"],
+        ocr_amount_satang=ocr_amount,
+        ocr_ref_id=analysis["extracted_data"]["ocr_ref_id"],
+        ocr_status=analysis["ocr_status"],
+        perceptual_hash=perceptual_hash,
+        amounts_match=amounts_match,
+        amount_difference_satang=amount_diff,
+        order_amount_satang=order.amount_satang,
+        status=VerificationStatus.verified,
+        confidence=confidence,
+        verified_at=datetime.utcnow()
+    )
+    db.add(verification)
+    
+    # ========== STEP 10: Free the Amount Slot ==========
+    amount_slots.release(db, [order.order_id])
+    
+    db.flush()
+    
+    logger.info(
+        f"✅ PAYMENT VERIFIED: order_id={order.order_id}, "
+        f"amount={format_baht(order.amount_satang)}, confidence={confidence}, "
+        f"qr_match=✓, ocr_match={'✓' if ocr_matches else '✗'}"
+    )
+    
+    return schemas.UploadSlipResponse(
+        success=True,
+        message="✅ Payment verified successfully! All checks passed.",
+        ref_id=qr_ref_id,
+        bank_id=analysis["extracted_data"]["qr_ref_id"],
+        matched_order_id=order.id,
+        order_status=OrderStatus.completed,
+        verification_id=verification.id
+    )
+
+
+async def reconciled_transaction(db: AsyncSession, order_id: str):
+    """The bank notification that completed this order through reconciliation, if one did"""
+    return (await db.execute(
+        select(Transaction).join(Order, Transaction.matched_order_id == Order.id).where(
+            Order.order_id == order_id,
+            Order.status == OrderStatus.completed,
+            Transaction.status == TransactionStatus.matched,
+            Transaction.slip_image_path.is_(None)  # near-duplicate slips are "matched" too, with an image
+        )
+    )).scalars().first()
+
+
+# ============================================================================
+# ENDPOINT 3: Upload Slip and Verify Payment
+# POST /api/payment/upload-slip
+# ============================================================================
+
+@app.post(
+    "/api/payment/upload-slip",
+    response_model=schemas.UploadSlipResponse,
+    tags=["Payment"]
+)
+async def upload_slip(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    order_id: str = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Upload slip image with 100% strict verification
+    
+    - Comprehensive QR + OCR dual analysis
+    - STRICT amount matching (no tolerance)
+    - Duplicate detection
+    - Detailed audit trail
+    - Manual review for edge cases
+    """
+    
+    try:
+        # Already paid by a bank notification: nothing for the slip to prove, skip the analysis
+        if order_id:
+            notification = await reconciled_transaction(db, order_id)
+            if notification is not None:
+                logger.info(f"Order {order_id} already reconciled from notification {notification.ref_id}; slip not analysed")
+                return schemas.UploadSlipResponse(
+                    success=True,
+                    message="✅ Payment already confirmed by bank notification.",
+                    ref_id=notification.ref_id,
+                    matched_order_id=notification.matched_order_id,
+                    order_status=OrderStatus.completed
+                )
+        
+        # Size- and header-checked read of the spooled upload
+        upload = await read_slip_upload(file)
+        
+        # ========== STEP 1: Comprehensive Analysis ==========
+        analysis = await db.run_sync(get_cached_analysis, upload.digest, file.filename)
+        if analysis is None:
+            analysis = await analyze_slip(upload.data)
+            await db.run_sync(analysis_cache.put, upload.digest, analysis)
+        
+        # ========== STEPS 2-10: Match, Deduplicate, Record ==========
+        response = await db.run_sync(verify_slip, analysis, file.filename, order_id)
+        await db.commit()
+        
+        # OCR cross-check deferred by policy: run it after the response is sent
+        if response.success and analysis["ocr_status"] == OCRStatus.deferred:
+            background_tasks.add_task(cross_check_ocr, response.verification_id, upload.data)
+        
+        return response
         
+    except SlipRejected as e:
+        logger.warning(f"Rejected slip {file.filename}: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error uploading slip: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -409,6 +966,201 @@ async def upload_slip(
         )
 
 
+async def analyze_slip_queued(contents: bytes) -> dict:
+    """
+    Analyze a slip for the batch endpoint
+    
+    Waits for room in the pool instead of failing fast, up to
+    SLIP_ANALYSIS_TIMEOUT, so a large batch degrades to queueing rather than
+    a stream of 503 lines.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SLIP_ANALYSIS_TIMEOUT
+    while True:
+        try:
+            analysis = await analysis_pool.analyze(contents)
+        except AnalysisQueueFull:
+            if loop.time() >= deadline:
+                raise
+            await asyncio.sleep(0.25)
+        else:
+            record_cascade(analysis)
+            return analysis
+
+
+@app.post(
+    "/api/payment/upload-slips",
+    tags=["Payment"]
+)
+async def upload_slips(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...)
+):
+    """
+    Batch slip upload for back-office reconciliation
+    
+    Slips are analyzed in parallel across the analysis workers and matched
+    by amount with the same rules as /api/payment/upload-slip. Results
+    stream back as NDJSON (one BatchSlipResult per line) in completion
+    order; each line is sent only after its DB work has been committed.
+    """
+    if len(files) > settings.BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.BATCH_UPLOAD_MAX_FILES} files per batch"
+        )
+    
+    async def stream():
+        # Own session: the response body outlives the request dependencies
+        db = AsyncSessionLocal()
+        # Files are read one at a time as analysis capacity frees up: at most one in-flight
+        # analysis per worker (leaving queue room for single uploads), and a slip's buffer is
+        # dropped once its result is committed. The spooled UploadFiles stay open until the
+        # response (and its background tasks) have finished.
+        queued = iter(enumerate(files))
+        exhausted = False
+        try:
+            pending = {}
+            ready = []
+            while True:
+                while (not exhausted and len(pending) < analysis_pool.workers
+                       and len(ready) < settings.BATCH_COMMIT_SIZE):
+                    index, file = next(queued, (None, None))
+                    if file is None:
+                        exhausted = True
+                        break
+                    # Size- and header-checked here; a rejected file only fails its own line
+                    try:
+                        upload = await read_slip_upload(file)
+                    except SlipRejected as e:
+                        ready.append((index, file, None, None, e, False))
+                        continue
+                    analysis = await db.run_sync(get_cached_analysis, upload.digest, file.filename)
+                    if analysis is not None:
+                        ready.append((index, file, upload, analysis, None, False))
+                    else:
+                        pending[asyncio.ensure_future(analyze_slip_queued(upload.data))] = (index, file, upload)
+                
+                if not ready:
+                    if not pending:
+                        break
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        index, file, upload = pending.pop(task)
+                        error = task.exception()
+                        ready.append((index, file, upload, None if error else task.result(), error, True))
+                
+                # Group commit: everything that finished together, capped per commit
+                group, ready = ready[:settings.BATCH_COMMIT_SIZE], ready[settings.BATCH_COMMIT_SIZE:]
+                lines = []
+                for index, file, upload, analysis, error, fresh in group:
+                    result = await db.run_sync(process_batch_slip, index, file.filename, upload, analysis, error, fresh)
+                    lines.append(result)
+                    if result.success and analysis["ocr_status"] == OCRStatus.deferred:
+                        # Re-read from the spooled file after the response rather than kept in memory
+                        background_tasks.add_task(cross_check_ocr_upload, result.verification_id, file)
+                await db.commit()
+                # The group's slip buffers are not needed past here
+                group = upload = None
+                
+                for result in lines:
+                    yield result.model_dump_json() + "\n"
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            await db.close()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def process_batch_slip(
+    db: Session,
+    index: int,
+    filename: str,
+    upload: SlipUpload,
+    analysis: dict,
+    error: Exception,
+    fresh: bool
+) -> schemas.BatchSlipResult:
+    """Verify one slip of a batch inside a savepoint so a failure only discards that slip"""
+    if error is not None:
+        if isinstance(error, SlipRejected):
+            reason = str(error)
+        elif isinstance(error, AnalysisTimeout):
+            reason = "Slip analysis timed out"
+        else:
+            reason = f"Slip analysis failed: {str(error)}"
+        return schemas.BatchSlipResult(index=index, filename=filename, success=False, message=reason)
+    
+    savepoint = db.begin_nested()
+    try:
+        if fresh:
+            analysis_cache.put(db, upload.digest, analysis)
+        response = verify_slip(db, analysis, filename)
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        logger.error(f"Error processing batch slip {filename}: {str(e)}", exc_info=True)
+        return schemas.BatchSlipResult(
+            index=index, filename=filename, success=False, message=f"Failed to process slip: {str(e)}"
+        )
+    
+    return schemas.BatchSlipResult(index=index, filename=filename, **response.model_dump())
+
+
+async def cross_check_ocr_upload(verification_id: int, file: UploadFile):
+    """cross_check_ocr for a batch slip, reading its bytes back from the spooled upload"""
+    try:
+        upload = await read_slip_upload(file)
+    except SlipRejected as e:
+        logger.warning(f"Deferred OCR skipped for verification {verification_id}: {str(e)}")
+        return
+    await cross_check_ocr(verification_id, upload.data)
+
+
+async def cross_check_ocr(verification_id: int, contents: bytes):
+    """
+    Deferred OCR cross-check (OCR_POLICY=async_after_response)
+    
+    Runs OCR in the analysis pool after the upload response has been sent,
+    then stores the OCR fields and the re-scored confidence on the
+    SlipVerification row.
+    """
+    try:
+        ocr = await analysis_pool.ocr(contents)
+    except (AnalysisQueueFull, AnalysisTimeout) as e:
+        logger.warning(f"Deferred OCR skipped for verification {verification_id}: {str(e)}")
+        return
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            verification = await db.get(SlipVerification, verification_id)
+            if not verification:
+                return
+            
+            confidence, ocr_matches = SlipQRReader.score_confidence(
+                verification.qr_amount_satang, ocr["ocr_amount_satang"]
+            )
+            verification.ocr_text = ocr["ocr_text"]
+            verification.ocr_amount_satang = ocr["ocr_amount_satang"]
+            verification.ocr_ref_id = ocr["ocr_ref_id"]
+            verification.ocr_status = OCRStatus.done.value
+            verification.confidence = confidence
+            await db.commit()
+            
+            if ocr["ocr_amount_satang"] and not ocr_matches:
+                logger.warning(
+                    f"Deferred OCR/QR mismatch: verification_id={verification_id}, "
+                    f"QR={verification.qr_amount}, OCR={ocr['ocr_amount']}"
+                )
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Deferred OCR failed for verification {verification_id}: {str(e)}")
+
+
 # ============================================================================
 # ADMIN VERIFICATION ENDPOINT (for manual review cases)
 # ============================================================================
@@ -420,7 +1172,7 @@ async def upload_slip(
 )
 async def admin_verify_payment(
     request: schemas.AdminVerificationRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Admin manual verification endpoint
@@ -428,9 +1180,12 @@ async def admin_verify_payment(
     """
     
     try:
-        verification = db.query(SlipVerification).filter(
-            SlipVerification.id == request.verification_id
-        ).first()
+        # The transaction is loaded up front: lazy loads would block
+        verification = (await db.execute(
+            select(SlipVerification).options(
+                selectinload(SlipVerification.transaction)
+            ).where(SlipVerification.id == request.verification_id)
+        )).scalars().first()
         
         if not verification:
             raise HTTPException(
@@ -450,12 +1205,11 @@ async def admin_verify_payment(
             
             # Update order status
             if transaction.matched_order_id:
-                order = db.query(Order).filter(
-                    Order.id == transaction.matched_order_id
-                ).first()
+                order = await db.get(Order, transaction.matched_order_id)
                 if order:
                     order.status = OrderStatus.completed
                     order.updated_at = datetime.utcnow()
+                    await db.run_sync(amount_slots.release, [order.order_id])
             
             message = "✅ Payment approved by admin"
             order_status = OrderStatus.completed
@@ -473,17 +1227,16 @@ async def admin_verify_payment(
             
             # Revert order status
             if transaction.matched_order_id:
-                order = db.query(Order).filter(
-                    Order.id == transaction.matched_order_id
-                ).first()
+                order = await db.get(Order, transaction.matched_order_id)
                 if order:
                     order.status = OrderStatus.failed
                     order.updated_at = datetime.utcnow()
+                    await db.run_sync(amount_slots.release, [order.order_id])
             
             message = "❌ Payment rejected by admin"
             order_status = OrderStatus.failed
         
-        db.commit()
+        await db.commit()
         
         logger.info(
             f"Admin verification: verification_id={request.verification_id}, "
@@ -500,7 +1253,7 @@ async def admin_verify_payment(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error in admin verification: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -515,26 +1268,28 @@ async def admin_verify_payment(
 async def list_verifications(
     status_filter: str = None,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     List all verification records (for admin review)
     """
-    query = db.query(SlipVerification)
+    query = select(SlipVerification)
     
     if status_filter:
-        query = query.filter(SlipVerification.status == status_filter)
+        query = query.where(SlipVerification.status == status_filter)
     
-    verifications = query.order_by(
+    verifications = (await db.execute(query.order_by(
         SlipVerification.created_at.desc()
-    ).limit(limit).all()
+    ).limit(limit))).scalars().all()
     
     return [
         {
             "id": v.id,
             "status": v.status,
             "qr_amount": v.qr_amount,
-            "order_amount": v.order_amount,
+            "order_amount": to_baht(v.order_amount_satang),
+            "qr_amount_satang": v.qr_amount_satang,
+            "order_amount_satang": v.order_amount_satang,
             "amounts_match": v.amounts_match,
             "confidence": v.confidence,
             "created_at": v.created_at,
@@ -544,6 +1299,40 @@ async def list_verifications(
     ]
 
 
+@app.get(
+    "/api/admin/qr-cascade-stats",
+    tags=["Admin"]
+)
+async def qr_cascade_stats():
+    """
+    QR preprocessing cascade statistics since startup
+    
+    Per slip source (pixel size) and per strategy: attempts, successes,
+    success rate and mean time. "*" aggregates all sources. Each analysis
+    also stores its own record under qr_preprocessing in
+    slip_analysis_results for longer-range queries.
+    """
+    return {
+        "budget_ms": settings.QR_CASCADE_BUDGET_MS,
+        "sources": cascade_stats.snapshot()
+    }
+
+
+@app.get(
+    "/api/admin/notification-stats",
+    tags=["Admin"]
+)
+async def notification_stats():
+    """
+    Bank notification parsing statistics since startup
+    
+    Hits per template, plus unrecognised notifications: the total count
+    and one example per text shape (digits masked), most frequent first,
+    for adding the templates they are missing.
+    """
+    return get_notification_registry().stats()
+
+
 # ============================================================================
 # HEALTH CHECK & INFO ENDPOINTS
 # ============================================================================
@@ -554,7 +1343,15 @@ async def health_check():
     return {
         "status": "ok",
         "service": settings.PROJECT_NAME,
-        "version": settings.PROJECT_VERSION
+        "version": settings.PROJECT_VERSION,
+        "slip_analysis": analysis_pool.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "qr_image_cache": qr_image_cache.stats(),
+        "amount_slots": amount_slots.stats(),
+        "pending_orders": pending_orders.stats(),
+        "webhook_writer": notification_writer.stats(),
+        "reconciliation": reconciler.stats(),
+        "order_expiry": expiry_sweeper.stats()
     }
 
 
@@ -570,15 +1367,35 @@ async def api_info():
                 "path": "/api/payment/generate-qr",
                 "description": "Generate PromptPay QR code"
             },
+            {
+                "method": "POST",
+                "path": "/api/payment/generate-qr/bulk",
+                "description": "Create many orders and QR payloads in one insert"
+            },
+            {
+                "method": "GET",
+                "path": "/api/payment/qr/{order_id}",
+                "description": "Rendered QR image (PNG/SVG) with ETag caching"
+            },
             {
                 "method": "POST",
                 "path": "/api/webhook/linebk",
                 "description": "Receive LINE Bank notification webhook"
             },
+            {
+                "method": "POST",
+                "path": "/api/webhook/linebk/batch",
+                "description": "Receive many LINE Bank notifications (relay backlog replay)"
+            },
             {
                 "method": "POST",
                 "path": "/api/payment/upload-slip",
                 "description": "Upload slip image and verify payment"
+            },
+            {
+                "method": "POST",
+                "path": "/api/payment/upload-slips",
+                "description": "Batch slip upload, streams NDJSON results"
             }
         ]
     }
@@ -589,9 +1406,9 @@ async def api_info():
 # ============================================================================
 
 @app.get("/api/orders/{order_id}", response_model=schemas.OrderResponse)
-async def get_order(order_id: str, db: Session = Depends(get_db)):
+async def get_order(order_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get order status by order_id"""
-    order = db.query(Order).filter(Order.order_id == order_id).first()
+    order = (await db.execute(select(Order).where(Order.order_id == order_id))).scalars().first()
     
     if not order:
         raise HTTPException(
@@ -603,11 +1420,11 @@ async def get_order(order_id: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/transactions/{ref_id}", response_model=schemas.TransactionResponse)
-async def get_transaction(ref_id: str, db: Session = Depends(get_db)):
+async def get_transaction(ref_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get transaction status by ref_id"""
-    transaction = db.query(Transaction).filter(
-        Transaction.ref_id == ref_id
-    ).first()
+    transaction = (await db.execute(
+        select(Transaction).where(Transaction.ref_id == ref_id)
+    )).scalars().first()
     
     if not transaction:
         raise HTTPException(
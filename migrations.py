@@ -0,0 +1,340 @@
+import logging
+import re
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import BigInteger, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from amount_migration import migrate_amounts_to_satang
+from baseline_schema import create_baseline
+from config import settings
+from models import AmountSlot, SchemaMigration, SlipAnalysisResult, utc_now
+from pending_orders import install_notify_trigger
+from reconciliation import create_watermark
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key held while migrating, so workers starting together apply each migration once
+MIGRATION_LOCK_KEY = 0x5D1B_0001
+# Seconds between attempts to take the lock while another worker migrates
+MIGRATION_LOCK_POLL = 1.0
+
+
+class Migration:
+    """
+    One schema change, applied once per database in MIGRATIONS order
+    apply(engine) manages its own transactions (a concurrent index build
+    cannot run inside one) and must be safe to re-run if it was
+    interrupted before being recorded.
+    """
+
+    __slots__ = ("version", "description", "apply")
+
+    def __init__(self, version: str, description: str, apply: Callable[[Engine], None]):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+def create_index_concurrently(engine: Engine, name: str, table: str, columns: str, where: Optional[str] = None):
+    """
+    CREATE INDEX without blocking writes to the table
+
+    PostgreSQL builds it CONCURRENTLY, which cannot run in a transaction, so
+    on an autocommit connection. A concurrent build that failed part way
+    leaves an INVALID index behind: it is dropped and built again. SQLite has
+    no concurrent build (and one writer at a time anyway): plain CREATE INDEX.
+    """
+    predicate = f" WHERE {where}" if where else ""
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){predicate}"))
+        return
+
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        valid = connection.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+        if valid:
+            return
+        if valid is False:
+            logger.warning(f"Index {name} was left invalid by an interrupted build; rebuilding")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        started = time.perf_counter()
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {table} ({columns}){predicate}"))
+        logger.info(f"✓ Built index {name} concurrently in {time.perf_counter() - started:.1f}s")
+
+
+def drop_index_concurrently(engine: Engine, name: str):
+    """DROP INDEX without blocking reads and writes on the table (CONCURRENTLY on PostgreSQL)"""
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        return
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def add_column(engine: Engine, table: str, name: str, ddl: str) -> bool:
+    """ALTER TABLE table ADD COLUMN name ddl, unless the table has the column already; True if added"""
+    if name in {column["name"] for column in inspect(engine).get_columns(table)}:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    return True
+
+
+def rebuild_sqlite_table(engine: Engine, table: str, edit: Callable[[str], str]):
+    """
+    Recreate a SQLite table from its CREATE TABLE statement after edit(sql)
+
+    SQLite's ALTER TABLE cannot change a column's constraints: the rows
+    are copied into a table created from the edited statement, which then
+    takes the old one's name and indexes, all in one transaction. Columns
+    keep their order, so the edit must not add, drop or reorder any.
+    """
+    with engine.connect() as connection:
+        foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        connection.exec_driver_sql("PRAGMA foreign_keys = OFF")  # a no-op inside a transaction
+        connection.commit()
+        try:
+            # pysqlite only opens a transaction before DML; BEGIN here so the DDL is in it too
+            connection.exec_driver_sql("BEGIN")
+            sql, = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+            ).one()
+            indexes = connection.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+            ), {"table": table}).scalars().all()
+            rebuilt = f"{table}_rebuild"
+            connection.exec_driver_sql(re.sub(
+                rf"^CREATE TABLE \"?{table}\"?", f"CREATE TABLE {rebuilt}", edit(sql), count=1
+            ))
+            connection.exec_driver_sql(f"INSERT INTO {rebuilt} SELECT * FROM {table}")
+            connection.exec_driver_sql(f"DROP TABLE {table}")
+            connection.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+            for index in indexes:
+                connection.exec_driver_sql(index)
+            if foreign_keys and connection.exec_driver_sql(f"PRAGMA foreign_key_check({table})").first():
+                raise RuntimeError(f"Rebuilding {table} would break its foreign keys")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+            connection.commit()
+
+
+def _pending_amount_index(engine: Engine):
+    # Matches WHERE status = 'pending' AND amount_satang = ? ORDER BY created_at DESC LIMIT 1
+    # with one index probe; completed / expired orders are not in the index at all
+    create_index_concurrently(
+        engine, "idx_pending_amount_created", "orders", "amount_satang, created_at", where="status = 'pending'"
+    )
+    # Superseded: every order's (status, amount) for a lookup that only ever wants pending ones
+    drop_index_concurrently(engine, "idx_status_amount_satang")
+
+
+def _order_expiry(engine: Engine):
+    # Nullable column: no table rewrite. Only pending orders need a value, from the TTL
+    # they were created under; the table's other rows never expire
+    add_column(engine, "orders", "expires_at", "TIMESTAMP" if engine.dialect.name == "postgresql" else "DATETIME")
+    if engine.dialect.name == "postgresql":
+        expires_at = "created_at + make_interval(mins => :ttl)"
+    else:
+        expires_at = "strftime('%Y-%m-%d %H:%M:%f', created_at, '+' || :ttl || ' minutes')"
+    with engine.begin() as connection:
+        backfilled = connection.execute(
+            text(f"UPDATE orders SET expires_at = {expires_at} WHERE status = 'pending' AND expires_at IS NULL"),
+            {"ttl": settings.ORDER_PENDING_TTL_MINUTES}
+        ).rowcount
+    if backfilled:
+        logger.info(f"✓ Set expires_at on {backfilled} pending orders")
+    create_index_concurrently(engine, "idx_pending_expires", "orders", "expires_at", where="status = 'pending'")
+
+
+def _ocr_status(engine: Engine):
+    # Rows from before the OCR policy were all OCR'd inline: 'done'. On PostgreSQL a
+    # constant DEFAULT fills them without rewriting the table, and is dropped again
+    # so new rows carry what the policy decided; SQLite backfills with an UPDATE
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text(
+                "ALTER TABLE slip_verifications ADD COLUMN IF NOT EXISTS ocr_status VARCHAR(20) DEFAULT 'done'"
+            ))
+            connection.execute(text("ALTER TABLE slip_verifications ALTER COLUMN ocr_status DROP DEFAULT"))
+        return
+    add_column(engine, "slip_verifications", "ocr_status", "VARCHAR(20)")
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE slip_verifications SET ocr_status = 'done' WHERE ocr_status IS NULL"))
+
+
+def _slip_perceptual_hash(engine: Engine):
+    # Both nullable: no table rewrite, and rows from before the hash index are never matched
+    add_column(engine, "slip_verifications", "perceptual_hash", "VARCHAR(16)")
+    add_column(engine, "slip_verifications", "duplicate_of_id", "INTEGER REFERENCES slip_verifications (id)")
+    create_index_concurrently(
+        engine, "ix_slip_verifications_duplicate_of_id", "slip_verifications", "duplicate_of_id"
+    )
+
+
+def _slip_updated_index(engine: Engine):
+    create_index_concurrently(engine, "idx_slip_updated", "slip_verifications", "updated_at")
+
+
+def _verification_transaction_optional(engine: Engine):
+    # Slips that match no order are recorded too, without a transaction
+    column = next(c for c in inspect(engine).get_columns("slip_verifications") if c["name"] == "transaction_id")
+    if column["nullable"]:
+        return
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE slip_verifications ALTER COLUMN transaction_id DROP NOT NULL"))
+        return
+    rebuild_sqlite_table(engine, "slip_verifications", lambda sql: re.sub(
+        r"(\btransaction_id INTEGER) NOT NULL", r"\1", sql, count=1
+    ))
+
+
+def _order_qr_payload(engine: Engine):
+    # Nullable: orders from before it get their payload rendered and stored on first use
+    add_column(engine, "orders", "qr_payload", "VARCHAR(512)")
+
+
+def _amount_slots(engine: Engine):
+    # BIGINT like every other satang column: above 21,474,836.47 baht an INTEGER slot overflows.
+    # A table created as INTEGER is rewritten, which is quick: it only holds pending orders' slots
+    AmountSlot.__table__.create(bind=engine, checkfirst=True)
+    if engine.dialect.name != "postgresql":
+        return  # SQLite integers are 64-bit whatever the declared type
+    column = next(c for c in inspect(engine).get_columns("amount_slots") if c["name"] == "amount_satang")
+    if isinstance(column["type"], BigInteger):
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE amount_slots ALTER COLUMN amount_satang TYPE BIGINT"))
+
+
+def _slip_analysis_results(engine: Engine):
+    SlipAnalysisResult.__table__.create(bind=engine, checkfirst=True)
+
+
+def _amounts_not_null(engine: Engine):
+    # 0002 sets NOT NULL on PostgreSQL; SQLite's ADD COLUMN could not, so its tables are rebuilt
+    if engine.dialect.name == "postgresql":
+        return
+    for table in ("orders", "transactions"):
+        column = next(c for c in inspect(engine).get_columns(table) if c["name"] == "amount_satang")
+        if column["nullable"]:
+            rebuild_sqlite_table(engine, table, lambda sql: re.sub(
+                r"\bamount_satang BIGINT\b", "amount_satang BIGINT NOT NULL", sql, count=1
+            ))
+
+
+def _notification_insert_time(engine: Engine):
+    # created_at set by the database as each row is inserted (models.utc_now); existing rows keep theirs.
+    # SQLite cannot ALTER a column's default, so its table is rebuilt
+    default = str(utc_now().compile(dialect=engine.dialect))
+    column = next(c for c in inspect(engine).get_columns("transactions") if c["name"] == "created_at")
+    if column["default"] is None:
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE transactions ALTER COLUMN created_at SET DEFAULT {default}"))
+        else:
+            rebuild_sqlite_table(engine, "transactions", lambda sql: re.sub(
+                r"\bcreated_at DATETIME NOT NULL", f"created_at DATETIME DEFAULT ({default}) NOT NULL", sql, count=1
+            ))
+    create_index_concurrently(
+        engine, "idx_pending_slip_created", "transactions", "created_at", where="status = 'pending_slip'"
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration("0001_create_tables", "Baseline orders, transactions and slip_verifications tables", create_baseline),
+    Migration("0002_amounts_to_satang", "Float baht amounts to integer satang", migrate_amounts_to_satang),
+    Migration("0003_pending_amount_index", "Partial index on pending orders (amount_satang, created_at)",
+              _pending_amount_index),
+    Migration("0004_pending_order_notify", "NOTIFY pending_orders on changes to pending orders (PostgreSQL)",
+              install_notify_trigger),
+    Migration("0005_reconciliation_watermark", "Watermark for notification -> order reconciliation",
+              create_watermark),
+    Migration("0006_order_expiry", "orders.expires_at and a partial index on pending orders by it",
+              _order_expiry),
+    Migration("0007_ocr_status", "slip_verifications.ocr_status, 'done' for existing rows", _ocr_status),
+    Migration("0008_slip_perceptual_hash", "slip_verifications.perceptual_hash and duplicate_of_id",
+              _slip_perceptual_hash),
+    Migration("0009_slip_updated_index", "Index slip_verifications by updated_at (perceptual hash refresh)",
+              _slip_updated_index),
+    Migration("0010_verification_transaction_optional", "slip_verifications.transaction_id nullable",
+              _verification_transaction_optional),
+    Migration("0011_order_qr_payload", "orders.qr_payload", _order_qr_payload),
+    Migration("0012_amount_slots", "amount_slots table, amount_satang BIGINT", _amount_slots),
+    Migration("0013_slip_analysis_results", "slip_analysis_results table (slip analysis cache)",
+              _slip_analysis_results),
+    Migration("0014_amounts_not_null", "orders / transactions amount_satang NOT NULL (SQLite)", _amounts_not_null),
+    Migration("0015_notification_insert_time", "transactions.created_at set on insert; partial index on "
+              "pending_slip notifications by it", _notification_insert_time),
+]
+
+
+def _acquire_lock(connection: Connection):
+    """
+    Wait for the migration lock, polling pg_try_advisory_lock
+
+    Not pg_advisory_lock: a worker blocked inside that statement holds a
+    snapshot, and CREATE INDEX CONCURRENTLY in the worker that has the lock
+    waits for every older snapshot to finish, so the two would deadlock.
+    """
+    waiting = False
+    while not connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}).scalar():
+        if not waiting:
+            logger.info("Another worker is applying migrations; waiting")
+            waiting = True
+        time.sleep(MIGRATION_LOCK_POLL)
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """
+    Apply the migrations this database has not recorded yet, in order
+
+    Each applied version is recorded in schema_migrations. On PostgreSQL a
+    session advisory lock serialises workers starting at the same time;
+    the lock's connection stays idle in autocommit, outside any
+    transaction, so it does not hold up concurrent index builds.
+
+    Returns the versions applied by this call.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    applied = []
+    with engine.connect() as lock:
+        if postgres:
+            lock.execution_options(isolation_level="AUTOCOMMIT")
+            _acquire_lock(lock)
+        try:
+            SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+            with engine.connect() as connection:
+                done = set(connection.execute(select(SchemaMigration.version)).scalars())
+
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                logger.info(f"Applying migration {migration.version}: {migration.description}")
+                migration.apply(engine)
+                with engine.begin() as connection:
+                    connection.execute(SchemaMigration.__table__.insert().values(version=migration.version))
+                applied.append(migration.version)
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    applied = run_migrations(engine)
+    logger.info(f"Applied {len(applied)} migrations" + (f": {', '.join(applied)}" if applied else ""))
@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Index, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum as SQLEnum, Index, Boolean, JSON, literal_column, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql.expression import FunctionElement
+from datetime import datetime, timedelta
 import enum
+from config import settings
 from database import Base
+from money import to_baht
 
 
 class OrderStatus(str, enum.Enum):
@@ -12,6 +16,40 @@ class OrderStatus(str, enum.Enum):
     expired = "expired"
 
 
+# Pending orders as a literal rather than a bound parameter: PostgreSQL only uses a
+# partial index when it can prove the query's WHERE implies the index's, and a
+# prepared statement's generic plan cannot see the value of a parameter
+PENDING_ORDER = literal_column("'pending'")
+PENDING_SLIP = literal_column("'pending_slip'")
+
+
+class utc_now(FunctionElement):
+    """
+    The database's clock in UTC, naive like datetime.utcnow()
+
+    As a server default it is the time the row was inserted, not when the
+    statement's transaction began (PostgreSQL's now()).
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now)
+def _utc_now_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+@compiles(utc_now, "postgresql")
+def _utc_now_postgresql(element, compiler, **kw):
+    return "timezone('utc', clock_timestamp())"
+
+
+def default_expires_at(context):
+    """Order.expires_at when the insert does not set one: created_at + ORDER_PENDING_TTL_MINUTES"""
+    created_at = context.get_current_parameters().get("created_at") or datetime.utcnow()
+    return created_at + timedelta(minutes=settings.ORDER_PENDING_TTL_MINUTES)
+
+
 class TransactionStatus(str, enum.Enum):
     pending_slip = "pending_slip"
     matched = "matched"
@@ -24,14 +62,48 @@ class Order(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(String(100), unique=True, index=True, nullable=False)
-    amount = Column(Float, nullable=False)  # Decimal precision (e.g., 100.01)
+    amount_satang = Column(BigInteger, nullable=False)  # e.g. 10001 for 100.01 baht
+    qr_payload = Column(String(512), nullable=True)  # EMVCo payload issued for this order
     status = Column(SQLEnum(OrderStatus), default=OrderStatus.pending, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, default=default_expires_at, nullable=True)  # still pending after this: expired
 
     transactions = relationship("Transaction", back_populates="order")
 
-    __table_args__ = (Index("idx_order_id_status", "order_id", "status"),)
+    __table_args__ = (
+        Index("idx_order_id_status", "order_id", "status"),
+        # Slip -> pending order lookup; only pending rows, so it stays small as orders pile up.
+        # Existing databases get it from migrations.py, built CONCURRENTLY
+        Index(
+            "idx_pending_amount_created", "amount_satang", "created_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+        # Expiry sweep: pending orders in expires_at order (order_expiry.expire_due)
+        Index(
+            "idx_pending_expires", "expires_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+
+    @property
+    def amount(self):
+        """Amount in baht, for responses and logs"""
+        return to_baht(self.amount_satang)
+
+
+class AmountSlot(Base):
+    """
+    An amount in use by a pending order
+    The primary key keeps amounts unique among pending orders across all workers
+    """
+    __tablename__ = "amount_slots"
+
+    amount_satang = Column(BigInteger, primary_key=True, autoincrement=False)  # e.g. 10037 for 100.37
+    order_id = Column(String(100), index=True, nullable=False)  # Order.order_id; reserved before the order row exists
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 class Transaction(Base):
@@ -39,19 +111,34 @@ class Transaction(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     ref_id = Column(String(255), unique=True, index=True, nullable=False)  # Transaction reference from bank
-    amount = Column(Float, nullable=False)
+    amount_satang = Column(BigInteger, nullable=False)
     bank_id = Column(String(50), nullable=True)  # Sending bank ID
     status = Column(SQLEnum(TransactionStatus), default=TransactionStatus.pending_slip, nullable=False)
     matched_order_id = Column(Integer, ForeignKey("orders.id"), nullable=True, index=True)
     notification_text = Column(String(500), nullable=True)  # Original notification text from LINE BK
     slip_image_path = Column(String(255), nullable=True)  # Path to uploaded slip image
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set by the database as the row is inserted: a batch of notifications is not stamped before its
+    # transaction starts, and the reconciler compares it with the database clock (reconciliation.py)
+    created_at = Column(DateTime, server_default=utc_now(), nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     order = relationship("Order", back_populates="transactions")
     verification = relationship("SlipVerification", uselist=False, back_populates="transaction")
 
-    __table_args__ = (Index("idx_ref_id_status", "ref_id", "status"),)
+    __table_args__ = (
+        Index("idx_ref_id_status", "ref_id", "status"),
+        # Reconciler re-scan: recent notifications still waiting for an order, below the watermark
+        Index(
+            "idx_pending_slip_created", "created_at",
+            postgresql_where=text("status = 'pending_slip'"),
+            sqlite_where=text("status = 'pending_slip'"),
+        ),
+    )
+
+    @property
+    def amount(self):
+        """Amount in baht, for responses and logs"""
+        return to_baht(self.amount_satang)
 
 
 class VerificationStatus(str, enum.Enum):
@@ -70,23 +157,28 @@ class SlipVerification(Base):
     __tablename__ = "slip_verifications"
 
     id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(Integer, ForeignKey("transactions.id"), unique=True, nullable=False, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), unique=True, nullable=True, index=True)  # None when no order matched
     
     # QR Analysis
     qr_found = Column(Boolean, default=False)
     qr_data = Column(String(500), nullable=True)
-    qr_amount = Column(Float, nullable=True)
+    qr_amount_satang = Column(BigInteger, nullable=True)
     qr_ref_id = Column(String(255), nullable=True)
     
     # OCR Analysis
     ocr_text = Column(String(2000), nullable=True)
-    ocr_amount = Column(Float, nullable=True)
+    ocr_amount_satang = Column(BigInteger, nullable=True)
     ocr_ref_id = Column(String(255), nullable=True)
+    ocr_status = Column(String(20), nullable=True)  # done / skipped / deferred
+    
+    # Near-duplicate detection
+    perceptual_hash = Column(String(16), nullable=True)  # 64-bit DCT hash, hex
+    duplicate_of_id = Column(Integer, ForeignKey("slip_verifications.id"), nullable=True, index=True)
     
     # Matching Results
     amounts_match = Column(Boolean, default=False)
-    amount_difference = Column(Float, nullable=True)  # |expected - actual|
-    order_amount = Column(Float, nullable=True)
+    amount_difference_satang = Column(BigInteger, nullable=True)  # |expected - actual|
+    order_amount_satang = Column(BigInteger, nullable=True)
     
     # Verification Status
     status = Column(SQLEnum(VerificationStatus), default=VerificationStatus.pending, nullable=False)
@@ -104,4 +196,48 @@ class SlipVerification(Base):
     
     transaction = relationship("Transaction", back_populates="verification")
     
-    __table_args__ = (Index("idx_status_created", "status", "created_at"),)
+    __table_args__ = (
+        Index("idx_status_created", "status", "created_at"),
+        # Perceptual hash index refresh: verifications changed since the last one
+        Index("idx_slip_updated", "updated_at"),
+    )
+
+    @property
+    def qr_amount(self):
+        """QR amount in baht, for SlipVerificationDetail"""
+        return to_baht(self.qr_amount_satang)
+
+    @property
+    def ocr_amount(self):
+        """OCR amount in baht, for SlipVerificationDetail"""
+        return to_baht(self.ocr_amount_satang)
+
+
+class SlipAnalysisResult(Base):
+    """
+    Persistent content-hash cache of slip analysis results
+    Keyed by the SHA-256 digest of the uploaded image bytes
+    """
+    __tablename__ = "slip_analysis_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 hex
+    analysis = Column(JSON, nullable=False)  # comprehensive_slip_analysis() output
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SchemaMigration(Base):
+    """A migration from migrations.MIGRATIONS applied to this database"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(String(50), primary_key=True)  # e.g. "0003_pending_amount_index"
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ReconciliationWatermark(Base):
+    """How far a reconciliation pass has read a table; see reconciliation.py"""
+    __tablename__ = "reconciliation_watermarks"
+
+    name = Column(String(50), primary_key=True)  # e.g. "notifications"
+    last_id = Column(BigInteger, nullable=False, default=0)  # highest row id fully reconciled
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,54 @@
+from decimal import Decimal
+from typing import Optional, Union
+
+# Amounts are integer satang (1/100 baht) everywhere they are stored, matched
+# or encoded; baht floats only appear at the edges (JSON responses, logs)
+SATANG_PER_BAHT = 100
+
+
+def parse_satang(text: str) -> int:
+    """
+    Satang in a decimal amount string, without going through float
+
+    Accepts "1500", "1500.5", "1,500.50"; a comma is a thousands separator.
+
+    Raises:
+        ValueError: not a plain amount, or finer than a satang
+    """
+    baht, _, fraction = text.strip().replace(",", "").partition(".")
+    if not (baht or fraction) or (baht and not baht.isdigit()) or \
+            (fraction and not fraction.isdigit()) or len(fraction) > 2:
+        raise ValueError(f"Not an amount in baht and satang: {text!r}")
+    return int(baht or 0) * SATANG_PER_BAHT + int(fraction.ljust(2, "0"))
+
+
+def to_satang(amount: Union[int, Decimal, str, float]) -> int:
+    """
+    Satang in an amount in baht
+
+    int, Decimal and str are converted exactly (a Decimal or str finer
+    than a satang is a ValueError); a float, left only in legacy data, is
+    rounded to the nearest satang.
+    """
+    if isinstance(amount, str):
+        return parse_satang(amount)
+    if isinstance(amount, int):
+        return amount * SATANG_PER_BAHT
+    if isinstance(amount, Decimal):
+        satang = amount * SATANG_PER_BAHT
+        if satang != satang.to_integral_value():
+            raise ValueError(f"Amount is finer than a satang: {amount}")
+        return int(satang)
+    return int(round(amount * SATANG_PER_BAHT))
+
+
+def format_baht(satang: int) -> str:
+    """Two-decimal amount string, e.g. 150050 -> "1500.50" (as encoded in QR tag 54)"""
+    sign = "-" if satang < 0 else ""
+    baht, cents = divmod(abs(satang), SATANG_PER_BAHT)
+    return f"{sign}{baht}.{cents:02d}"
+
+
+def to_baht(satang: Optional[int]) -> Optional[float]:
+    """Baht for display and JSON responses; never compare amounts with it"""
+    return None if satang is None else satang / SATANG_PER_BAHT
@@ -0,0 +1,230 @@
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import settings
+from money import parse_satang, to_baht
+
+logger = logging.getLogger(__name__)
+
+# Building blocks shared by the templates
+# At most 15 baht digits, so every amount parsed fits a BIGINT amount_satang; a longer
+# number is not an amount at all rather than the first 15 digits of one
+AMOUNT = r"(?:\d{1,3}(?:,\d{3}){1,4}|\d{1,15})(?:\.\d{1,2})?(?!,?\d)"
+TIME = r"\d{1,2}[:.]\d{2}(?::\d{2})?"
+DATE = r"\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?"
+ACCOUNT = r"[xX*\d][xX*\d-]{2,16}\d[xX*\d-]*"  # masked, e.g. xxx-x-x1234-x / XX5678
+REFERENCE = r"[A-Za-z0-9]{6,40}"
+
+FIELDS = ("amount", "date", "time", "account", "reference")
+_GROUP = re.compile(r"\(\?P<(\w+)>")
+_DIGITS = re.compile(r"\d")
+
+
+class NotificationTemplate:
+    """
+    One bank / app's notification wording
+
+    pattern is matched from the start of the text (with DOTALL) and names
+    the fields it captures from FIELDS; amount is required. Templates are
+    tried in registry order, so specific wordings go before generic ones.
+    """
+
+    __slots__ = ("name", "bank", "pattern")
+
+    def __init__(self, name: str, bank: str, pattern: str):
+        groups = set(_GROUP.findall(pattern))
+        if "amount" not in groups or not groups <= set(FIELDS):
+            raise ValueError(f"Template {name}: groups must include amount and be among {FIELDS}")
+        self.name = name
+        self.bank = bank
+        self.pattern = pattern
+
+
+class ParsedNotification:
+    """Fields extracted from one notification; absent fields are None"""
+
+    __slots__ = ("template", "bank", "amount_satang", "date", "time", "account", "reference")
+
+    def __init__(self, template: str, bank: str, amount_satang: int, date: Optional[str] = None,
+                 time: Optional[str] = None, account: Optional[str] = None, reference: Optional[str] = None):
+        self.template = template
+        self.bank = bank
+        self.amount_satang = amount_satang
+        self.date = date
+        self.time = time
+        self.account = account
+        self.reference = reference
+
+    @property
+    def amount(self) -> float:
+        """Amount in baht, for display"""
+        return to_baht(self.amount_satang)
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _after(label: str, field: str, value: str) -> str:
+    """Optional `label ... field` section, skipped when absent"""
+    return rf"(?:.*?{label}\s*(?P<{field}>{value}))?"
+
+
+DEFAULT_TEMPLATES = [
+    # "บัญชี XXX-X-XX123-4 เงินเข้า +1,500.00 บาท คงเหลือ 25,000.00 บาท 17-10-69@12:00"
+    # The balance follows the amount; only the first figure is the credit
+    NotificationTemplate(
+        "krungthai_next", "KTB",
+        rf"\s*บัญชี\s*(?P<account>{ACCOUNT})\s*เงินเข้า\s*\+?\s*(?P<amount>{AMOUNT})\s*บาท"
+        rf"(?:.*?(?P<date>{DATE})\s*@\s*(?P<time>{TIME}))?",
+    ),
+    # "รับเงิน 1,500.00 บาท จาก นาย ก เข้าบัญชี xxx-x-x1234-x วันที่ 17/10/69 12:00 น. Ref 0123456789AB"
+    NotificationTemplate(
+        "kplus", "KBANK",
+        rf"\s*(?:รับเงิน|รับโอนเงิน)\s*(?P<amount>{AMOUNT})\s*บาท"
+        + _after("เข้าบัญชี", "account", ACCOUNT)
+        + rf"(?:.*?วันที่\s*(?P<date>{DATE})\s*(?P<time>{TIME})?)?"
+        + _after(r"Ref\.?", "reference", REFERENCE),
+    ),
+    # "เงินเข้าบัญชี xx5678 จำนวน 1,500.00 บาท วันที่ 17/10 @12:00 Ref 2026101712ABCD"
+    NotificationTemplate(
+        "scb_easy", "SCB",
+        rf"\s*เงินเข้าบัญชี\s*(?P<account>{ACCOUNT})\s*จำนวน\s*(?P<amount>{AMOUNT})\s*บาท"
+        + rf"(?:.*?วันที่\s*(?P<date>{DATE}))?"
+        + _after("@", "time", TIME)
+        + _after(r"Ref\.?", "reference", REFERENCE),
+    ),
+    # "ฝาก/โอนเข้า 1,500.00 บาท บ/ช X1234 17/10/26 12:00"
+    NotificationTemplate(
+        "bualuang", "BBL",
+        rf"\s*(?:ฝาก/)?โอนเข้า\s*(?P<amount>{AMOUNT})\s*บาท"
+        + _after("บ/ช", "account", ACCOUNT)
+        + rf"(?:.*?(?P<date>{DATE})\s+(?P<time>{TIME}))?",
+    ),
+    # "เงินเข้า 1,500.50 บาท เวลา 12:00" (LINE BK)
+    NotificationTemplate(
+        "linebk_th", "LINEBK",
+        rf"\s*เงินเข้า\s*\+?\s*(?P<amount>{AMOUNT})\s*บาท"
+        + _after("บัญชี", "account", ACCOUNT)
+        + _after("เวลา", "time", TIME)
+        + _after(r"(?:Ref\.?|รหัสอ้างอิง)", "reference", REFERENCE),
+    ),
+    # "Money in THB 1,500.50 to a/c x1234 at 12:00 Ref. ABC123456" (LINE BK, English)
+    NotificationTemplate(
+        "linebk_en", "LINEBK",
+        rf"\s*(?:Money in|You received|Received)\s*(?:THB|฿)?\s*(?P<amount>{AMOUNT})\s*(?:THB|Baht)?"
+        + _after("a/c", "account", ACCOUNT)
+        + _after("at", "time", TIME)
+        + _after(r"Ref\.?", "reference", REFERENCE),
+    ),
+]
+
+
+class NotificationTemplateRegistry:
+    """
+    Bank notification templates compiled into one matcher
+
+    Each template becomes a named alternative of a single regex (its
+    fields renamed t<i>_<field>), so a notification is matched against
+    every template in one call, in registry order, and match.lastgroup
+    says which one hit. Registering a template recompiles the matcher.
+
+    Texts no template matches are counted, and by shape (digits masked)
+    with one example per shape for the first max_samples shapes, as
+    material for the next template.
+    """
+
+    def __init__(self, templates: Optional[List[NotificationTemplate]] = None, max_samples: int = 100):
+        self.templates: List[NotificationTemplate] = []
+        self.max_samples = max_samples
+        self.hits: Counter = Counter()
+        self.unknown = 0
+        self._unknown_shapes: Counter = Counter()
+        self._unknown_samples: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._matcher = None
+        self._fields: Dict[str, List[tuple]] = {}
+        for template in templates if templates is not None else DEFAULT_TEMPLATES:
+            self.register(template)
+
+    @classmethod
+    def from_settings(cls) -> "NotificationTemplateRegistry":
+        return cls(max_samples=settings.NOTIFICATION_UNKNOWN_SAMPLES)
+
+    def register(self, template: NotificationTemplate, first: bool = False):
+        """Add a template (after the existing ones, or before them with first) and recompile"""
+        if any(existing.name == template.name for existing in self.templates):
+            raise ValueError(f"Template {template.name} is already registered")
+        if first:
+            self.templates.insert(0, template)
+        else:
+            self.templates.append(template)
+        self._compile()
+
+    def _compile(self):
+        alternatives = []
+        fields = {}
+        for index, template in enumerate(self.templates):
+            key = f"t{index}"
+            pattern = _GROUP.sub(lambda group: f"(?P<{key}_{group.group(1)}>", template.pattern)
+            alternatives.append(f"(?P<{key}>{pattern})")
+            fields[key] = [(name, f"{key}_{name}") for name in FIELDS if f"(?P<{name}>" in template.pattern]
+        self._matcher = re.compile("|".join(alternatives), re.DOTALL | re.IGNORECASE)
+        self._fields = fields
+
+    def parse(self, text: str) -> Optional[ParsedNotification]:
+        """Fields of a notification, or None (and the text sampled) when no template matches"""
+        match = self._matcher.match(text)
+        if match is None:
+            self._record_unknown(text)
+            return None
+
+        key = match.lastgroup
+        template = self.templates[int(key[1:])]
+        values = {name: match.group(group) for name, group in self._fields[key]}
+        amount_satang = parse_satang(values.pop("amount"))
+        self.hits[template.name] += 1
+        return ParsedNotification(template.name, template.bank, amount_satang, **values)
+
+    def _record_unknown(self, text: str):
+        shape = _DIGITS.sub("9", text.strip())[:200]
+        with self._lock:
+            self.unknown += 1
+            if shape in self._unknown_shapes:
+                self._unknown_shapes[shape] += 1
+            elif len(self._unknown_shapes) < self.max_samples:
+                self._unknown_shapes[shape] = 1
+                self._unknown_samples[shape] = text[:500]
+                logger.warning(f"Unrecognised notification format: {text[:200]!r}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = [
+                {"shape": shape, "count": self._unknown_shapes[shape], "example": example}
+                for shape, example in self._unknown_samples.items()
+            ]
+        samples.sort(key=lambda sample: -sample["count"])
+        return {
+            "templates": [
+                {"name": template.name, "bank": template.bank, "hits": self.hits[template.name]}
+                for template in self.templates
+            ],
+            "unknown": self.unknown,
+            "unknown_samples": samples,
+        }
+
+
+_registry: Optional[NotificationTemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_notification_registry() -> NotificationTemplateRegistry:
+    """Per-process template registry shared by the webhook and extract_amount_from_text"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = NotificationTemplateRegistry.from_settings()
+    return _registry
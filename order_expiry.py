@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import PENDING_ORDER, Order, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key the sweeping worker holds for as long as it leads
+SWEEPER_LOCK_KEY = 0x5D1B_0002
+
+
+def order_expires_at(created_at: datetime, ttl_minutes: Optional[int] = None) -> datetime:
+    """When an order created at created_at stops being payable (ORDER_PENDING_TTL_MINUTES by default)"""
+    return created_at + timedelta(minutes=ttl_minutes or settings.ORDER_PENDING_TTL_MINUTES)
+
+
+def expire_due(db: Session, limit: int, now: Optional[datetime] = None) -> List[Tuple[int, str]]:
+    """
+    Expire up to limit pending orders past their expires_at, oldest first; the caller commits
+
+    The orders are locked FOR UPDATE SKIP LOCKED: rows another transaction
+    is completing (or another sweep is expiring) are left to it instead of
+    waited on. The caller frees their amount slots.
+
+    Returns (id, order_id) of the orders expired.
+    """
+    now = now or datetime.utcnow()
+    due = db.execute(
+        select(Order.id).where(
+            Order.status == PENDING_ORDER,  # idx_pending_expires
+            Order.expires_at <= now
+        ).order_by(Order.expires_at).limit(limit).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not due:
+        return []
+    return [tuple(row) for row in db.execute(
+        update(Order).where(
+            Order.id.in_(due), Order.status == PENDING_ORDER
+        ).values(status=OrderStatus.expired, updated_at=now).returning(Order.id, Order.order_id),
+        execution_options={"synchronize_session": False}
+    )]
+
+
+class OrderExpirySweeper:
+    """
+    Expires pending orders past their expires_at, in the background
+
+    One worker sweeps at a time: the leader, which holds a session advisory
+    lock (SWEEPER_LOCK_KEY) on a connection of its own for as long as it
+    runs. The others try to take the lock every interval, so one of them
+    takes over within interval seconds of the leader going away. On SQLite
+    (one host, one writer at a time) every worker sweeps.
+
+    A sweep expires batch_size orders per transaction until none are due,
+    frees their amount slots and drops them from the pending order index,
+    then counts the pending set for stats().
+    """
+
+    def __init__(self, amount_slots, pending_orders, batch_size: int = 500, interval: float = 30.0):
+        self.amount_slots = amount_slots
+        self.pending_orders = pending_orders
+        self.batch_size = batch_size
+        self.interval = interval
+        self.leader = False
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.batches = 0
+        self.expired = 0
+        self.failures = 0
+        self.last_sweep_ms = 0.0
+        self.max_sweep_ms = 0.0
+        self.pending = None  # pending orders after the last sweep
+        self.oldest_pending_seconds = None
+
+    @classmethod
+    def from_settings(cls, amount_slots, pending_orders) -> "OrderExpirySweeper":
+        return cls(
+            amount_slots,
+            pending_orders,
+            batch_size=settings.ORDER_EXPIRY_BATCH_SIZE,
+            interval=settings.ORDER_EXPIRY_INTERVAL,
+        )
+
+    def expire_batch(self, db: Session) -> List[Tuple[int, str]]:
+        """One batch: expire_due plus freeing the slots; the caller commits (run with AsyncSession.run_sync)"""
+        expired = expire_due(db, self.batch_size)
+        self.amount_slots.release(db, [order_id for _, order_id in expired])
+        return expired
+
+    async def sweep(self, session_factory) -> int:
+        """Expire every order due, a batch per transaction; returns how many"""
+        started = time.perf_counter()
+        expired = 0
+        while not self._stop.is_set():
+            async with session_factory() as db:
+                batch = await db.run_sync(self.expire_batch)
+                await db.commit()
+            for order_pk, _ in batch:
+                self.pending_orders.discard(order_pk)
+            expired += len(batch)
+            self.batches += bool(batch)
+            if len(batch) < self.batch_size:
+                break
+
+        async with session_factory() as db:
+            count, oldest = (await db.execute(
+                select(func.count(), func.min(Order.created_at)).where(Order.status == PENDING_ORDER)
+            )).one()
+        self.pending = count
+        self.oldest_pending_seconds = round((datetime.utcnow() - oldest).total_seconds()) if oldest else None
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.sweeps += 1
+        self.expired += expired
+        self.last_sweep_ms = round(elapsed, 1)
+        self.max_sweep_ms = max(self.max_sweep_ms, self.last_sweep_ms)
+        if expired:
+            logger.info(f"Expired {expired} pending orders in {elapsed:.0f} ms ({count} still pending)")
+        return expired
+
+    async def _wait(self, seconds: float) -> bool:
+        """Sleep up to seconds; True if stop() was called"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop.is_set()
+
+    async def _lead(self, async_engine, session_factory):
+        """Sweep every interval while holding the leader lock; returns at once if another worker holds it"""
+        async with async_engine.connect() as connection:
+            await connection.execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                if not (await connection.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": SWEEPER_LOCK_KEY}
+                )).scalar():
+                    return
+                self.leader = True
+                logger.info("Leading order expiry sweeps")
+                while True:
+                    await self.sweep(session_factory)
+                    if await self._wait(self.interval):
+                        break
+                    # Still connected, so still holding the lock (raises if the connection is gone)
+                    await connection.execute(text("SELECT 1"))
+            finally:
+                self.leader = False
+                # Closing the connection releases the lock, held or not
+                await connection.invalidate()
+
+    async def follow(self, async_engine, session_factory):
+        """Sweep (or wait to lead) until stop()"""
+        while not self._stop.is_set():
+            try:
+                if async_engine.dialect.name == "postgresql":
+                    await self._lead(async_engine, session_factory)
+                else:
+                    self.leader = True
+                    await self.sweep(session_factory)
+            except Exception as e:
+                self.leader = False
+                self.failures += 1
+                logger.warning(f"Order expiry sweep failed: {str(e)}")
+            await self._wait(self.interval)
+        self.leader = False
+
+    def start(self, async_engine, session_factory):
+        """Sweep in a background task of the running event loop (one per worker)"""
+        if self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self.follow(async_engine, session_factory))
+
+    async def stop(self):
+        """Finish the current batch and stop (a leader releases its lock)"""
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "leader": self.leader,
+            "sweeps": self.sweeps,
+            "batches": self.batches,
+            "expired": self.expired,
+            "failures": self.failures,
+            "last_sweep_ms": self.last_sweep_ms,
+            "max_sweep_ms": self.max_sweep_ms,
+            "pending": self.pending,
+            "oldest_pending_seconds": self.oldest_pending_seconds,
+        }
@@ -1,6 +1,10 @@
-import re
 from typing import Tuple, Optional
 import random
+from functools import lru_cache
+
+import emvco
+from money import format_baht
+from notification_parser import get_notification_registry
 
 
 class PromptPayQRGenerator:
@@ -17,7 +21,7 @@ class PromptPayQRGenerator:
     MERCHANT_ACCOUNT_INFO = "29"
     AMOUNT = "54"
     CURRENCY_CODE = "5303"
-    COUNTRY_CODE = "5A"
+    COUNTRY_CODE = "58"
     CRC = "63"
     
     @staticmethod
@@ -41,104 +45,114 @@ class PromptPayQRGenerator:
     @staticmethod
     def calculate_crc(data: str) -> str:
         """Calculate CRC-16/CCITT-FALSE checksum"""
-        crc = 0xFFFF
-        for char in data:
-            crc ^= ord(char) << 8
-            for _ in range(8):
-                crc <<= 1
-                if crc & 0x10000:
-                    crc ^= 0x1021
-                crc &= 0xFFFF
-        return f"{crc:04X}"
+        return emvco.format_crc(emvco.crc16(data))
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def payload_template(account_id: str) -> "PromptPayPayloadTemplate":
+        """Compiled payload template for a merchant account (cached per account)"""
+        return PromptPayPayloadTemplate(account_id)
     
     @staticmethod
-    def generate_qr_payload(account_id: str, amount: float = None) -> str:
+    def generate_qr_payload(account_id: str, amount_satang: int = None) -> str:
         """
         Generate PromptPay QR Code payload
         
         Args:
             account_id: PromptPay account (phone number or national ID)
-            amount: Transaction amount in THB (optional for static QR)
+            amount_satang: Transaction amount in satang (optional for static QR)
         
         Returns:
             QR payload string in EMVCo format
         """
+        return PromptPayQRGenerator.payload_template(account_id).render(amount_satang)
+    
+    @staticmethod
+    def add_micro_transaction(amount: float) -> float:
+        """
+        Add random cent to amount for accurate matching
+        Helps when multiple orders have same amount
+        
+        Not aware of other pending orders; orders get their amount from
+        amount_slots.AmountSlotAllocator, which never hands out a duplicate.
+        
+        Args:
+            amount: Base amount
+        
+        Returns:
+            Modified amount with random decimal (0-99 cents)
+        """
+        cents = random.randint(1, 99)
+        modified_amount = amount + (cents / 100.0)
+        return round(modified_amount, 2)
+
+
+class PromptPayPayloadTemplate:
+    """
+    Per-merchant PromptPay payload with everything but the amount precompiled
+    
+    Only the amount (tag 54) varies between orders of one merchant account.
+    The data objects before it are built once along with their CRC state,
+    and the ones after it once as a suffix, so rendering an order appends
+    the amount and finishes the CRC over the amount and suffix alone.
+    """
+    
+    def __init__(self, account_id: str):
         # Payload Format Indicator
-        qr = "000201"  # Static QR, format version 1
+        prefix = "000201"  # Static QR, format version 1
         
-        # Point of Initiation Method (01 = static, 11 = dynamic)
-        qr += "01020112"  # Dynamic QR
+        # Point of Initiation Method (11 = static, 12 = dynamic)
+        prefix += "010212"  # Dynamic QR
         
         # Merchant Account Information (Tag 29)
-        merchant_info = PromptPayQRGenerator.generate_merchant_info(account_id)
-        qr += "29" + merchant_info
+        prefix += "29" + PromptPayQRGenerator.generate_merchant_info(account_id)
         
-        # Merchant Category Code (Tag 58)
-        qr += "5807" + "4111"  # 4111 = Merchant
+        # Merchant Category Code (Tag 52)
+        prefix += "5204" + "4111"  # 4111 = Merchant
         
         # Transaction Currency (Tag 53) - THB = 764
-        qr += "5303764"
+        prefix += "5303764"
         
-        # Transaction Amount (Tag 54) - if provided
-        if amount is not None:
-            amount_str = f"{amount:.2f}"
-            qr += "54" + PromptPayQRGenerator.encode_length_value(amount_str)
+        # Transaction Amount (Tag 54) goes here, per order
         
         # Country Code (Tag 58) - Thailand = TH
-        qr += "5A0TH"
+        suffix = "5802TH"
         
         # Merchant Name (Tag 59)
         merchant_name = "MERCHANT"
-        qr += "59" + PromptPayQRGenerator.encode_length_value(merchant_name)
+        suffix += "59" + PromptPayQRGenerator.encode_length_value(merchant_name)
         
         # City (Tag 60)
         city = "BANGKOK"
-        qr += "60" + PromptPayQRGenerator.encode_length_value(city)
+        suffix += "60" + PromptPayQRGenerator.encode_length_value(city)
         
-        # CRC (Tag 63) - calculated without the CRC field itself
-        crc = PromptPayQRGenerator.calculate_crc(qr + "6304")
-        qr += "6304" + crc
+        # CRC (Tag 63) covers everything up to and including its own tag/length
+        suffix += "6304"
         
-        return qr
+        self.account_id = account_id
+        self.prefix = prefix
+        self.prefix_crc = emvco.crc16(prefix)
+        self.suffix = suffix
     
-    @staticmethod
-    def add_micro_transaction(amount: float) -> float:
-        """
-        Add random cent to amount for accurate matching
-        Helps when multiple orders have same amount
-        
-        Args:
-            amount: Base amount
-        
-        Returns:
-            Modified amount with random decimal (0-99 cents)
-        """
-        cents = random.randint(1, 99)
-        modified_amount = amount + (cents / 100.0)
-        return round(modified_amount, 2)
+    def render(self, amount_satang: int = None) -> str:
+        """Complete payload for one order (amount in satang, written as baht with two decimals)"""
+        amount_tlv = ""
+        if amount_satang is not None:
+            amount_tlv = "54" + PromptPayQRGenerator.encode_length_value(format_baht(amount_satang))
+        crc = emvco.crc16(amount_tlv + self.suffix, self.prefix_crc)
+        return self.prefix + amount_tlv + self.suffix + emvco.format_crc(crc)
 
 
 def extract_amount_from_text(text: str) -> Optional[float]:
     """
-    Extract amount from LINE notification text using regex
-    Handles Thai text formats like "เงินเข้า 100.50 บาท"
+    Extract amount from bank notification text
+    Handles Thai text formats like "เงินเข้า 1,500.50 บาท เวลา 12:00"
     
     Args:
         text: Notification text
     
     Returns:
-        Extracted amount or None
+        Extracted amount or None when no notification template matches
     """
-    # Pattern for Thai text like "เงินเข้า 100.50 บาท"
-    pattern = r"(\d+[.,]\d+|\d+)"
-    matches = re.findall(pattern, text)
-    
-    if matches:
-        # Get the last number (usually amount)
-        amount_str = matches[-1].replace(",", ".")
-        try:
-            return float(amount_str)
-        except ValueError:
-            return None
-    
-    return None
+    parsed = get_notification_registry().parse(text)
+    return parsed.amount if parsed else None
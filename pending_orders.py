@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import PENDING_ORDER, Order, OrderStatus
+from money import to_baht
+
+logger = logging.getLogger(__name__)
+
+# pg_notify channel the orders trigger (migration 0004) publishes order changes on
+CHANNEL = "pending_orders"
+
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION notify_pending_order() RETURNS trigger AS $$
+DECLARE
+    row orders%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row := OLD;
+    ELSE
+        row := NEW;
+    END IF;
+    -- Only changes that move an order into, out of or within the pending set
+    IF TG_OP = 'UPDATE' AND NEW.status IS NOT DISTINCT FROM OLD.status
+            AND NEW.amount_satang IS NOT DISTINCT FROM OLD.amount_satang THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' AND NEW.status <> 'pending' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('{CHANNEL}', json_build_object(
+        'id', row.id, 'order_id', row.order_id, 'amount_satang', row.amount_satang,
+        'status', CASE WHEN TG_OP = 'DELETE' THEN 'deleted' ELSE row.status::text END,
+        'created_at', row.created_at
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+NOTIFY_TRIGGER = """
+CREATE TRIGGER orders_notify_pending
+AFTER INSERT OR UPDATE OF status, amount_satang OR DELETE ON orders
+FOR EACH ROW EXECUTE FUNCTION notify_pending_order()
+"""
+
+
+def install_notify_trigger(engine: Engine):
+    """Publish every change to the pending set on CHANNEL (PostgreSQL; migration 0004)"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        connection.execute(text(NOTIFY_FUNCTION))
+        connection.execute(text("DROP TRIGGER IF EXISTS orders_notify_pending ON orders"))
+        connection.execute(text(NOTIFY_TRIGGER))
+
+
+class PendingOrder:
+    """The columns of a pending Order that slip matching reads, held in memory"""
+
+    __slots__ = ("id", "order_id", "amount_satang", "created_at")
+
+    status = OrderStatus.pending
+
+    def __init__(self, order_pk: int, order_id: str, amount_satang: int, created_at: datetime):
+        self.id = order_pk  # Order.id
+        self.order_id = order_id
+        self.amount_satang = amount_satang
+        self.created_at = created_at
+
+    @property
+    def amount(self):
+        return to_baht(self.amount_satang)
+
+    def __repr__(self):
+        return f"PendingOrder({self.order_id}, {self.amount_satang})"
+
+
+class PendingOrderIndex:
+    """
+    Pending orders by amount in satang, in process memory
+
+    Slip matching resolves its candidate order here without a database
+    round trip; the compare-and-set on the order's status when it is
+    completed is what confirms it. Pending orders are few (they complete
+    or expire within minutes), so the whole set fits in a dict.
+
+    Kept in step with every worker's writes by a change feed:
+
+    - PostgreSQL: LISTEN on CHANNEL, fed by a trigger on orders. The index
+      is (re)loaded after each LISTEN starts, so nothing committed while
+      not listening is missed; notifications arriving during the load are
+      replayed on top of it, in commit order.
+    - SQLite (tests, single host): orders updated since the last poll are
+      re-read every poll_interval seconds.
+
+    Until the first load, and while the feed is down, the index is not
+    live and match() returns None: callers then query the database. A
+    miss is not proof that no order exists (a new order's notification may
+    still be on its way), so callers fall back to the database then too.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, poll_overlap: float = 5.0, reconnect_delay: float = 5.0):
+        self.poll_interval = poll_interval
+        self.poll_overlap = poll_overlap  # seconds re-read each poll, for writes committed late
+        self.reconnect_delay = reconnect_delay
+        self.live = False
+        self._by_amount: Dict[int, List[PendingOrder]] = {}
+        self._by_id: Dict[int, PendingOrder] = {}
+        self._replay: Optional[List[tuple]] = None  # changes seen while a load is running
+        self._polled_at: Optional[datetime] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.changes = 0
+        self.loads = 0
+
+    @classmethod
+    def from_settings(cls) -> "PendingOrderIndex":
+        return cls(
+            poll_interval=settings.PENDING_INDEX_POLL_INTERVAL,
+            reconnect_delay=settings.PENDING_INDEX_RECONNECT_DELAY,
+        )
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def match(self, amount_satang: int) -> Optional[PendingOrder]:
+        """The newest pending order for this exact amount, or None (not found, or the index is not live)"""
+        if not self.live:
+            return None
+        candidates = self._by_amount.get(amount_satang)
+        if not candidates:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return max(candidates, key=lambda order: order.created_at)
+
+    def apply(self, order_pk: int, order_id: str, amount_satang: int, status: str, created_at: datetime):
+        """Record an order's current state; anything but pending leaves the index"""
+        if self._replay is not None:
+            self._replay.append((order_pk, order_id, amount_satang, status, created_at))
+        self.discard(order_pk)
+        if status == OrderStatus.pending.value:
+            order = PendingOrder(order_pk, order_id, amount_satang, created_at)
+            self._by_id[order_pk] = order
+            self._by_amount.setdefault(amount_satang, []).append(order)
+        self.changes += 1
+
+    def discard(self, order_pk: int):
+        """Drop an order (by Order.id), e.g. one whose claim was lost to another worker"""
+        order = self._by_id.pop(order_pk, None)
+        if order is None:
+            return
+        candidates = self._by_amount[order.amount_satang]
+        candidates.remove(order)
+        if not candidates:
+            del self._by_amount[order.amount_satang]
+
+    def load(self, db: Session):
+        """
+        Replace the index with the pending orders in the database
+
+        Synchronous ORM code (run it with AsyncSession.run_sync). Changes
+        applied while the query runs are replayed onto the loaded set.
+        """
+        self._replay = []
+        try:
+            self._polled_at = datetime.utcnow()
+            rows = db.query(Order.id, Order.order_id, Order.amount_satang, Order.created_at).filter(
+                Order.status == PENDING_ORDER
+            ).all()
+            replay = self._replay
+        finally:
+            self._replay = None
+
+        self._by_amount = {}
+        self._by_id = {}
+        for order_pk, order_id, amount_satang, created_at in rows:
+            order = PendingOrder(order_pk, order_id, amount_satang, created_at)
+            self._by_id[order_pk] = order
+            self._by_amount.setdefault(amount_satang, []).append(order)
+        for change in replay:
+            self.apply(*change)
+        self.loads += 1
+        self.live = True
+        logger.info(f"Pending order index loaded ({len(self)} orders)")
+
+    def poll(self, db: Session):
+        """Apply orders updated since the previous poll (less poll_overlap); loads on first use"""
+        if self._polled_at is None:
+            self.load(db)
+            return
+        since = self._polled_at - timedelta(seconds=self.poll_overlap)
+        self._polled_at = datetime.utcnow()
+        rows = db.query(Order.id, Order.order_id, Order.amount_satang, Order.status, Order.created_at).filter(
+            Order.updated_at >= since
+        ).all()
+        for order_pk, order_id, amount_satang, status, created_at in rows:
+            self.apply(order_pk, order_id, amount_satang, status.value, created_at)
+
+    def _notified(self, connection, pid, channel, payload: str):
+        change = json.loads(payload)
+        self.apply(
+            change["id"], change["order_id"], change["amount_satang"], change["status"],
+            datetime.fromisoformat(change["created_at"])
+        )
+
+    async def _wait(self, seconds: float) -> bool:
+        """Sleep up to seconds; True if stop() was called"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop.is_set()
+
+    async def _listen(self, async_engine, session_factory):
+        """One LISTEN session: load, then apply notifications until the connection drops or stop()"""
+        async with async_engine.connect() as connection:
+            raw = (await connection.get_raw_connection()).driver_connection  # asyncpg.Connection
+            lost = asyncio.Event()
+            raw.add_termination_listener(lambda _: lost.set())
+            await raw.add_listener(CHANNEL, self._notified)
+            try:
+                async with session_factory() as db:
+                    await db.run_sync(self.load)
+                waits = [asyncio.ensure_future(lost.wait()), asyncio.ensure_future(self._stop.wait())]
+                _, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+                for wait in pending:
+                    wait.cancel()
+            finally:
+                self.live = False
+                # Closed rather than returned to the pool: it is LISTENing, or already dead
+                await connection.invalidate()
+
+    async def follow(self, async_engine, session_factory):
+        """
+        Keep the index in step with the database until stop()
+
+        LISTEN/NOTIFY on PostgreSQL, polling otherwise. Reconnects after
+        reconnect_delay on errors, reloading the index each time.
+        """
+        while not self._stop.is_set():
+            try:
+                if async_engine.dialect.name == "postgresql":
+                    await self._listen(async_engine, session_factory)
+                    if self._stop.is_set():
+                        break
+                    logger.warning("Pending order feed connection lost; reconnecting")
+                else:
+                    async with session_factory() as db:
+                        await db.run_sync(self.poll)
+                    await self._wait(self.poll_interval)
+                    continue
+            except Exception as e:
+                self.live = False
+                self._polled_at = None
+                logger.warning(f"Pending order feed failed: {str(e)}")
+            await self._wait(self.reconnect_delay)
+        self.live = False
+
+    def start(self, async_engine, session_factory):
+        """Follow the database in a background task of the running event loop (one per worker)"""
+        if self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self.follow(async_engine, session_factory))
+
+    async def stop(self):
+        """Finish the current poll or load and stop following"""
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "live": self.live,
+            "orders": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "changes": self.changes,
+            "loads": self.loads,
+        }
@@ -0,0 +1,297 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PreprocessStrategy:
+    """
+    One way of rescuing a QR that plain decoding missed
+
+    images() yields one or more transformed variants of a region; the
+    cascade decodes each until one succeeds. prior_ms is the cold-start
+    cost estimate used for ordering before any timings are recorded.
+    """
+
+    name = "base"
+    prior_ms = 10.0
+
+    def images(self, region: np.ndarray) -> Iterator[np.ndarray]:
+        raise NotImplementedError
+
+
+class OtsuStrategy(PreprocessStrategy):
+    """CLAHE contrast enhancement + Otsu binarisation"""
+
+    name = "otsu"
+    prior_ms = 4.0
+
+    def images(self, region):
+        enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(region)
+        _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        yield thresh
+
+
+class InvertStrategy(PreprocessStrategy):
+    """Inverted Otsu binarisation (light-on-dark QR codes)"""
+
+    name = "invert"
+    prior_ms = 5.0
+
+    def images(self, region):
+        _, thresh = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        yield thresh
+
+
+class SharpenStrategy(PreprocessStrategy):
+    """Unsharp mask for soft, recompressed or slightly out-of-focus photos"""
+
+    name = "sharpen"
+    prior_ms = 6.0
+
+    def images(self, region):
+        blurred = cv2.GaussianBlur(region, (0, 0), 3)
+        yield cv2.addWeighted(region, 1.5, blurred, -0.5, 0)
+
+
+class AdaptiveThresholdStrategy(PreprocessStrategy):
+    """Local thresholding for photos with glare or uneven lighting"""
+
+    name = "adaptive_threshold"
+    prior_ms = 6.0
+
+    def images(self, region):
+        yield cv2.adaptiveThreshold(
+            region, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 5
+        )
+
+
+class ResizeStrategy(PreprocessStrategy):
+    """Rescale so modules fall in zbar's comfortable size range"""
+
+    name = "resize"
+    prior_ms = 8.0
+    FACTORS = (0.5, 2.0)
+
+    def images(self, region):
+        for factor in self.FACTORS:
+            interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+            yield cv2.resize(region, None, fx=factor, fy=factor, interpolation=interpolation)
+
+
+class RotationStrategy(PreprocessStrategy):
+    """Small-angle rotations for tilted photos of printed / on-screen slips"""
+
+    name = "rotation"
+    prior_ms = 12.0
+    ANGLES = (-12, 12)
+
+    def images(self, region):
+        height, width = region.shape[:2]
+        centre = (width / 2, height / 2)
+        for angle in self.ANGLES:
+            matrix = cv2.getRotationMatrix2D(centre, angle, 1.0)
+            yield cv2.warpAffine(region, matrix, (width, height), borderValue=255)
+
+
+class PerspectiveStrategy(PreprocessStrategy):
+    """
+    Warp the largest quadrilateral to a square
+
+    Photos of a phone screen or a printed slip taken at an angle shear the
+    QR beyond what zbar tolerates; flattening the dominant quad fixes it.
+    """
+
+    name = "perspective"
+    prior_ms = 15.0
+    OUTPUT_SIDE = 600
+
+    def images(self, region):
+        _, mask = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        # Merge the dark modules into one solid blob whose hull is the code's outline
+        side = max(3, min(region.shape[:2]) // 25)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (side, side)))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = 0.1 * region.shape[0] * region.shape[1]
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:2]:
+            if cv2.contourArea(contour) < min_area:
+                break
+            hull = cv2.convexHull(contour)
+            quad = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+            if len(quad) != 4:
+                continue
+            side = self.OUTPUT_SIDE
+            source = self._order_corners(quad.reshape(4, 2).astype(np.float32))
+            margin = side * 0.1
+            target = np.float32([
+                [margin, margin], [side - margin, margin],
+                [side - margin, side - margin], [margin, side - margin]
+            ])
+            matrix = cv2.getPerspectiveTransform(source, target)
+            yield cv2.warpPerspective(region, matrix, (side, side), borderValue=255)
+
+    @staticmethod
+    def _order_corners(points: np.ndarray) -> np.ndarray:
+        """Top-left, top-right, bottom-right, bottom-left"""
+        sums = points.sum(axis=1)
+        diffs = np.diff(points, axis=1).ravel()
+        return np.float32([
+            points[np.argmin(sums)], points[np.argmin(diffs)],
+            points[np.argmax(sums)], points[np.argmax(diffs)]
+        ])
+
+
+DEFAULT_STRATEGIES = (
+    OtsuStrategy(),
+    InvertStrategy(),
+    SharpenStrategy(),
+    AdaptiveThresholdStrategy(),
+    ResizeStrategy(),
+    RotationStrategy(),
+    PerspectiveStrategy(),
+)
+
+
+class CascadeStats:
+    """
+    Per-source, per-strategy attempt / success / time counters
+
+    Used twice: inside each analysis worker to order its own cascade, and
+    in the API process to aggregate the records returned with every
+    analysis so the numbers can be queried and used to tune the cascade.
+    Sources are kept in LRU order and bounded; the "*" row aggregates all.
+    """
+
+    ALL = "*"
+    MIN_SOURCE_SLIPS = 5  # below this a source is ordered by the global row
+
+    def __init__(self, max_sources: int = 256):
+        self.max_sources = max_sources
+        self._sources: "OrderedDict[str, Dict[str, List[float]]]" = OrderedDict()
+        self._slips: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: Dict):
+        """Fold one cascade record (see PreprocessingCascade.run) into the counters"""
+        source = record.get("source") or self.ALL
+        with self._lock:
+            for key in {source, self.ALL}:
+                rows = self._sources.setdefault(key, {})
+                self._sources.move_to_end(key)
+                self._slips[key] = self._slips.get(key, 0) + 1
+                for attempt in record.get("attempts", []):
+                    # [attempts, successes, total_ms]
+                    row = rows.setdefault(attempt["strategy"], [0, 0, 0.0])
+                    row[0] += 1
+                    row[1] += int(attempt["success"])
+                    row[2] += attempt["ms"]
+            while len(self._sources) > self.max_sources:
+                oldest = next(key for key in self._sources if key != self.ALL)
+                del self._sources[oldest]
+                self._slips.pop(oldest, None)
+
+    def expected_cost(self, source: str, strategy: PreprocessStrategy) -> float:
+        """
+        Expected milliseconds spent per success: mean time / success rate
+
+        Smoothed with the strategy's prior so untried strategies still get
+        a turn, and a strategy that never succeeds sinks steadily.
+        """
+        key = source if self._slips.get(source, 0) >= self.MIN_SOURCE_SLIPS else self.ALL
+        attempts, successes, total_ms = self._sources.get(key, {}).get(strategy.name, (0, 0, 0.0))
+        mean_ms = (total_ms + strategy.prior_ms) / (attempts + 1)
+        success_rate = (successes + 1) / (attempts + 2)
+        return mean_ms / success_rate
+
+    def order(self, source: str, strategies: Sequence[PreprocessStrategy]) -> List[PreprocessStrategy]:
+        with self._lock:
+            return sorted(strategies, key=lambda strategy: self.expected_cost(source, strategy))
+
+    def snapshot(self) -> Dict:
+        """Counters per source, most recent first, with derived rates"""
+        with self._lock:
+            result = {}
+            for source, rows in reversed(self._sources.items()):
+                result[source] = {
+                    "slips": self._slips.get(source, 0),
+                    "strategies": {
+                        name: {
+                            "attempts": attempts,
+                            "successes": successes,
+                            "success_rate": round(successes / attempts, 3) if attempts else 0.0,
+                            "mean_ms": round(total_ms / attempts, 2) if attempts else 0.0,
+                        }
+                        for name, (attempts, successes, total_ms) in rows.items()
+                    },
+                }
+            return result
+
+
+class PreprocessingCascade:
+    """
+    Self-ordering cascade of preprocessing strategies for hard QR slips
+
+    Strategies run cheapest-expected-success first for the slip's source,
+    within a per-slip time budget; every attempt is timed and recorded.
+    """
+
+    def __init__(self, strategies: Sequence[PreprocessStrategy] = DEFAULT_STRATEGIES, budget_ms: float = 1500.0):
+        self.strategies = list(strategies)
+        self.budget_ms = budget_ms
+        self.stats = CascadeStats()
+
+    def run(
+        self,
+        regions: Sequence[np.ndarray],
+        decode: Callable[[np.ndarray], Optional[str]],
+        source: str
+    ) -> Tuple[Optional[str], Dict]:
+        """
+        Try each strategy on each region until one decodes
+
+        Returns:
+            (qr_data or None, record) where record is
+            {"source", "strategy", "attempts": [{"strategy", "success", "ms"}],
+             "budget_exhausted"}
+        """
+        record = {"source": source, "strategy": None, "attempts": [], "budget_exhausted": False}
+        started = time.perf_counter()
+        qr_data = None
+
+        for strategy in self.stats.order(source, self.strategies):
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.budget_ms:
+                record["budget_exhausted"] = True
+                break
+
+            attempt_start = time.perf_counter()
+            try:
+                qr_data = self._try(strategy, regions, decode)
+            except cv2.error as e:
+                logger.debug(f"Preprocessing strategy {strategy.name} failed: {str(e)}")
+            record["attempts"].append({
+                "strategy": strategy.name,
+                "success": qr_data is not None,
+                "ms": round((time.perf_counter() - attempt_start) * 1000, 3),
+            })
+            if qr_data is not None:
+                record["strategy"] = strategy.name
+                break
+
+        self.stats.record(record)
+        return qr_data, record
+
+    @staticmethod
+    def _try(strategy: PreprocessStrategy, regions, decode) -> Optional[str]:
+        for region in regions:
+            for image in strategy.images(region):
+                qr_data = decode(image)
+                if qr_data:
+                    return qr_data
+        return None
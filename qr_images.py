@@ -0,0 +1,174 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import qrcode
+import qrcode.image.svg
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+QR_IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def qr_image_key(payload: str, image_format: str) -> str:
+    """Content address of a rendered QR: SHA-256 of format, render settings and payload"""
+    material = f"{image_format}:{settings.QR_IMAGE_BOX_SIZE}:{settings.QR_IMAGE_BORDER}:{payload}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def qr_image_etag(payload: str, image_format: str) -> str:
+    """Strong ETag for a rendered QR; computable without rendering"""
+    return f'"{qr_image_key(payload, image_format)}"'
+
+
+def render_qr_image(payload: str, image_format: str) -> bytes:
+    """Render a payload as PNG or SVG bytes"""
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=settings.QR_IMAGE_BOX_SIZE,
+        border=settings.QR_IMAGE_BORDER,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    if image_format == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRImageCache:
+    """
+    Content-addressed cache of rendered QR images
+
+    A bounded in-process LRU sits in front of an optional directory of
+    files named by content hash; a QR for a given payload never changes,
+    so entries are never invalidated, only evicted. The directory is
+    pruned back to its file limit, oldest first.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str] = None, max_files: int = 10000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls) -> "QRImageCache":
+        return cls(
+            max_entries=settings.QR_IMAGE_CACHE_SIZE,
+            directory=settings.QR_IMAGE_CACHE_DIR,
+            max_files=settings.QR_IMAGE_CACHE_MAX_FILES,
+        )
+
+    def get_or_render(self, payload: str, image_format: str) -> Tuple[bytes, str]:
+        """
+        Rendered image for a payload, rendering it at most once per cache lifetime
+
+        Returns:
+            (image bytes, strong ETag)
+        """
+        key = qr_image_key(payload, image_format)
+        etag = f'"{key}"'
+
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return image, etag
+
+        image = self._read_file(key, image_format)
+        if image is not None:
+            self.disk_hits += 1
+        else:
+            image = render_qr_image(payload, image_format)
+            self.renders += 1
+            self._write_file(key, image_format, image)
+
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return image, etag
+
+    def _path(self, key: str, image_format: str) -> str:
+        return os.path.join(self.directory, f"{key}.{image_format}")
+
+    def _read_file(self, key: str, image_format: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key, image_format), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"QR image cache read failed: {str(e)}")
+            return None
+
+    def _write_file(self, key: str, image_format: str, image: bytes):
+        if not self.directory:
+            return
+        try:
+            # Write-then-rename so concurrent readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(image)
+            os.replace(temp_path, self._path(key, image_format))
+        except OSError as e:
+            logger.warning(f"QR image cache write failed: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            due = self._writes_since_prune >= max(1, self.max_files // 10)
+            if due:
+                self._writes_since_prune = 0
+        if due:
+            self._prune()
+
+    def _prune(self):
+        """Drop the oldest files beyond max_files"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+            excess = len(entries) - self.max_files
+            if excess <= 0:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:excess]:
+                os.unlink(entry.path)
+            logger.info(f"Pruned {excess} cached QR images")
+        except OSError as e:
+            logger.warning(f"QR image cache prune failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        requests = self.memory_hits + self.disk_hits + self.renders
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "directory": self.directory,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "renders": self.renders,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / requests, 4) if requests else 0.0,
+        }
@@ -3,9 +3,19 @@ import numpy as np
 from pyzbar.pyzbar import decode, ZBarSymbol
 from PIL import Image
 import io
-from typing import Optional, Tuple, Dict
+from typing import Optional, Tuple, Dict, List, Union
+from functools import cached_property
+import enum
 import logging
-import re
+import queue
+import random
+import threading
+
+from config import settings
+import emvco
+from money import parse_satang, to_baht
+from qr_cascade import PreprocessingCascade
+from slip_text import scan_slip_text
 
 try:
     import pytesseract
@@ -14,81 +24,421 @@ except ImportError:
     TESSERACT_AVAILABLE = False
     pytesseract = None
 
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    tesserocr = None
+
 logger = logging.getLogger(__name__)
 
 
+class OCRPolicy(str, enum.Enum):
+    """When comprehensive_slip_analysis runs the (expensive) OCR cross-check"""
+    always = "always"
+    on_qr_failure = "on_qr_failure"  # only when the QR is not conclusive
+    sampled = "sampled"  # QR failures plus a random sample of QR successes
+    async_after_response = "async_after_response"  # QR successes are cross-checked later
+
+
+class OCRStatus(str, enum.Enum):
+    done = "done"
+    skipped = "skipped"
+    deferred = "deferred"
+
+
+class SlipImage:
+    """
+    Per-slip analysis context
+
+    Decodes the uploaded bytes once, straight to grayscale, and lazily
+    caches the derived images used by the QR and OCR stages so each one
+    is computed at most once per slip.
+    """
+
+    OCR_SCALE_PERCENT = 200
+    OCR_THRESHOLD = 150
+    LOCALISE_MAX_SIDE = 1024  # long side of the pyramid level used for QR localisation
+
+    def __init__(self, image_bytes: bytes):
+        self.image_bytes = image_bytes
+        self.qr_preprocessing: Optional[Dict] = None  # cascade record, when it ran
+
+    @classmethod
+    def from_source(cls, source: "SlipSource") -> "SlipImage":
+        """Wrap raw bytes in a context, or return an existing context unchanged"""
+        if isinstance(source, SlipImage):
+            return source
+        return cls(source)
+
+    @cached_property
+    def gray(self) -> Optional[np.ndarray]:
+        """Grayscale image decoded directly from the uploaded bytes"""
+        nparr = np.frombuffer(self.image_bytes, np.uint8)
+        image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            logger.error("Failed to decode image")
+        return image
+
+    @cached_property
+    def pyramid_level(self) -> Tuple[np.ndarray, float]:
+        """
+        Downscaled grayscale for QR localisation
+
+        Returns:
+            (image, scale) where scale maps level coordinates to full resolution
+            (full = level / scale)
+        """
+        level = self.gray
+        scale = 1.0
+        while max(level.shape[:2]) > self.LOCALISE_MAX_SIDE:
+            level = cv2.pyrDown(level)
+            scale /= 2
+        return level, scale
+
+    @cached_property
+    def perceptual_hash(self) -> Optional[str]:
+        """
+        64-bit DCT perceptual hash (hex) for near-duplicate detection
+
+        Shrinks to 32x32, takes the 8x8 lowest-frequency DCT coefficients and
+        records which are above their median. Survives recompression,
+        rescaling, brightness changes and light cropping (screenshots /
+        re-saves of the same slip); flat slip backgrounds make the cheaper
+        difference hash too unstable.
+        """
+        if self.gray is None:
+            return None
+        small = cv2.resize(self.gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        coefficients = cv2.dct(small)[:8, :8].flatten()
+        bits = np.packbits(coefficients > np.median(coefficients[1:]))
+        return bits.tobytes().hex()
+
+    @cached_property
+    def source_key(self) -> str:
+        """
+        Slip source used to specialise the preprocessing cascade
+
+        Bank apps export slips at fixed resolutions, so the pixel size is a
+        cheap stand-in for "which app / device produced this" before the QR
+        has been read.
+        """
+        height, width = self.gray.shape[:2]
+        return f"{width}x{height}"
+
+    @cached_property
+    def upscaled(self) -> np.ndarray:
+        """Grayscale upscaled for OCR"""
+        width = int(self.gray.shape[1] * self.OCR_SCALE_PERCENT / 100)
+        height = int(self.gray.shape[0] * self.OCR_SCALE_PERCENT / 100)
+        return cv2.resize(self.gray, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    @cached_property
+    def ocr_binary(self) -> np.ndarray:
+        """Fixed-threshold binarisation of the upscaled image, fed to Tesseract"""
+        _, thresh = cv2.threshold(self.upscaled, self.OCR_THRESHOLD, 255, cv2.THRESH_BINARY)
+        return thresh
+
+
+SlipSource = Union[bytes, SlipImage]
+
+
+class OCRBackend:
+    """OCR engine interface used by SlipQRReader.extract_text_from_image"""
+    
+    name = "base"
+    
+    def image_to_string(self, image: np.ndarray) -> str:
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+
+class PytesseractBackend(OCRBackend):
+    """
+    pytesseract: forks a `tesseract` process per call and reloads the
+    traineddata every time. Always works when the binary is installed.
+    """
+    
+    name = "pytesseract"
+    
+    def __init__(self, lang: str):
+        self.lang = lang
+    
+    def image_to_string(self, image: np.ndarray) -> str:
+        return pytesseract.image_to_string(image, lang=self.lang)
+
+
+class TesserocrBackend(OCRBackend):
+    """
+    Pool of long-lived, pre-initialised Tesseract engines (tesserocr API
+    bindings). Language data is loaded once per engine, at construction;
+    each call borrows an engine from the pool and returns it afterwards.
+    """
+    
+    name = "tesserocr"
+    
+    def __init__(self, lang: str, pool_size: int):
+        self.lang = lang
+        self.pool_size = max(1, pool_size)
+        self._engines: "queue.Queue" = queue.Queue()
+        for _ in range(self.pool_size):
+            self._engines.put(tesserocr.PyTessBaseAPI(lang=lang))
+    
+    def image_to_string(self, image: np.ndarray) -> str:
+        engine = self._engines.get()
+        try:
+            engine.SetImage(Image.fromarray(image))
+            return engine.GetUTF8Text()
+        finally:
+            engine.Clear()
+            self._engines.put(engine)
+    
+    def close(self):
+        while not self._engines.empty():
+            self._engines.get_nowait().End()
+
+
+OCR_LANG = 'tha+eng'
+
+_ocr_backend: Optional[OCRBackend] = None
+_ocr_backend_lock = threading.Lock()
+
+
+def create_ocr_backend(preference: str, pool_size: int) -> Optional[OCRBackend]:
+    """
+    Build an OCR backend
+    
+    Args:
+        preference: "auto" (tesserocr if installed, else pytesseract),
+            "tesserocr" or "pytesseract"
+        pool_size: Engines kept alive by the tesserocr backend
+    
+    Returns:
+        Backend, or None if no OCR engine is installed
+    """
+    if preference in ("auto", "tesserocr"):
+        if TESSEROCR_AVAILABLE:
+            try:
+                return TesserocrBackend(OCR_LANG, pool_size)
+            except RuntimeError as e:
+                logger.warning(f"tesserocr engine init failed, falling back to pytesseract: {str(e)}")
+        elif preference == "tesserocr":
+            logger.warning("tesserocr not installed, falling back to pytesseract")
+    
+    if TESSERACT_AVAILABLE:
+        return PytesseractBackend(OCR_LANG)
+    return None
+
+
+def get_ocr_backend() -> Optional[OCRBackend]:
+    """Process-wide OCR backend, created on first use (OCR_BACKEND / OCR_ENGINE_POOL_SIZE)"""
+    global _ocr_backend
+    if _ocr_backend is None:
+        with _ocr_backend_lock:
+            if _ocr_backend is None:
+                _ocr_backend = create_ocr_backend(settings.OCR_BACKEND, settings.OCR_ENGINE_POOL_SIZE)
+                if _ocr_backend:
+                    logger.info(f"OCR backend: {_ocr_backend.name}")
+    return _ocr_backend
+
+
+_cascade: Optional[PreprocessingCascade] = None
+_cascade_lock = threading.Lock()
+
+
+def get_preprocessing_cascade() -> PreprocessingCascade:
+    """Per-process preprocessing cascade; its ordering learns from this process's slips"""
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                _cascade = PreprocessingCascade(budget_ms=settings.QR_CASCADE_BUDGET_MS)
+    return _cascade
+
+
 class SlipQRReader:
     """Read and extract QR code information from slip images"""
     
+    # Slips only carry QR codes; restricting zbar skips the 1D scanners
+    QR_SYMBOLS = [ZBarSymbol.QRCODE]
+    QR_DECODE_SIDE = 600  # target long side of a candidate crop before decode
+    QR_CROP_MARGIN = 0.15  # quiet-zone margin added around each candidate
+    MAX_QR_CANDIDATES = 4
+    
+    # Merchant account sub-tags that carry the payee, per template
+    ACCOUNT_TYPES = {
+        emvco.TAG_PROMPTPAY: (("01", "mobile"), ("02", "national_id"), ("03", "ewallet")),
+        emvco.TAG_BILL_PAYMENT: (("01", "biller"),),
+    }
+    
+    @staticmethod
+    def _decode_qr(image: np.ndarray) -> Optional[str]:
+        """Decode the first QR symbol in image, or None"""
+        qr_codes = decode(image, symbols=SlipQRReader.QR_SYMBOLS)
+        if qr_codes:
+            return qr_codes[0].data.decode('utf-8')
+        return None
+    
+    @staticmethod
+    def locate_qr_candidates(slip: SlipImage) -> List[Tuple[int, int, int, int]]:
+        """
+        Find candidate QR regions on the downscaled pyramid level
+        
+        Uses dense-gradient blobs first (QR modules produce strong edges in
+        both directions, cheap to find); OpenCV's slower finder-pattern
+        detector only runs when no blob qualifies.
+        
+        Args:
+            slip: Decoded slip context
+        
+        Returns:
+            Boxes (x, y, w, h) in full-resolution coordinates, best first
+        """
+        level, scale = slip.pyramid_level
+        boxes = SlipQRReader._gradient_candidates(level)
+        
+        if not boxes:
+            try:
+                found, points = cv2.QRCodeDetector().detectMulti(level)
+                if found and points is not None:
+                    boxes = [cv2.boundingRect(quad.astype(np.float32)) for quad in points]
+            except cv2.error as e:
+                logger.debug(f"QR detector failed: {str(e)}")
+        
+        height, width = slip.gray.shape[:2]
+        candidates = []
+        for x, y, w, h in boxes:
+            # Skip boxes whose centre is already covered by a better candidate
+            cx, cy = (x + w / 2) / scale, (y + h / 2) / scale
+            if any(bx <= cx <= bx + bw and by <= cy <= by + bh for bx, by, bw, bh in candidates):
+                continue
+            
+            margin = SlipQRReader.QR_CROP_MARGIN * max(w, h)
+            x0 = max(0, int((x - margin) / scale))
+            y0 = max(0, int((y - margin) / scale))
+            x1 = min(width, int((x + w + margin) / scale))
+            y1 = min(height, int((y + h + margin) / scale))
+            candidates.append((x0, y0, x1 - x0, y1 - y0))
+            
+            if len(candidates) >= SlipQRReader.MAX_QR_CANDIDATES:
+                break
+        
+        return candidates
+    
     @staticmethod
-    def read_qr_from_image(image_bytes: bytes) -> Optional[str]:
+    def _gradient_candidates(level: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """Square-ish regions of dense gradient on the pyramid level, largest first"""
+        grad_x = cv2.Sobel(level, cv2.CV_32F, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(level, cv2.CV_32F, 0, 1, ksize=3)
+        # QR modules have edges in both directions; text is mostly vertical strokes
+        energy = cv2.convertScaleAbs(cv2.min(cv2.absdiff(grad_x, 0), cv2.absdiff(grad_y, 0)))
+        blurred = cv2.blur(energy, (9, 9))
+        _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.erode(mask, None, iterations=2)
+        mask = cv2.dilate(mask, None, iterations=2)
+        
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_side = 0.05 * min(level.shape[:2])
+        rects = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w < min_side or h < min_side or not 0.6 <= w / h <= 1.6:
+                continue
+            rects.append((x, y, w, h))
+        
+        rects.sort(key=lambda r: r[2] * r[3], reverse=True)
+        return rects[:SlipQRReader.MAX_QR_CANDIDATES]
+    
+    @staticmethod
+    def _crop_for_decode(gray: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+        """Crop a candidate box and rescale it so modules are a comfortable size for zbar"""
+        x, y, w, h = box
+        crop = gray[y:y + h, x:x + w]
+        long_side = max(w, h)
+        target = SlipQRReader.QR_DECODE_SIDE
+        if long_side > target * 1.5 or long_side < target / 2:
+            factor = target / long_side
+            interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+            crop = cv2.resize(crop, None, fx=factor, fy=factor, interpolation=interpolation)
+        return crop
+    
+    @staticmethod
+    def read_qr_from_image(image: SlipSource) -> Optional[str]:
         """
         Read QR code from image bytes
         
+        Localises candidate regions on a downscaled pyramid level and decodes
+        only those crops; falls back to whole-frame decoding on a miss.
+        
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or an existing SlipImage context
         
         Returns:
             QR code data as string or None if not found
         """
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            # Decode image
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            slip = SlipImage.from_source(image)
             
-            if image is None:
-                logger.error("Failed to decode image")
+            if slip.gray is None:
                 return None
             
-            # Try to decode QR codes
-            qr_codes = decode(image)
+            # Decode localised candidates only
+            crops = [SlipQRReader._crop_for_decode(slip.gray, box) for box in SlipQRReader.locate_qr_candidates(slip)]
+            for crop in crops:
+                qr_data = SlipQRReader._decode_qr(crop)
+                if qr_data:
+                    return qr_data
             
-            if qr_codes:
-                # Return first QR code data
-                return qr_codes[0].data.decode('utf-8')
+            # Whole frame: coarse level first, then full resolution
+            level, scale = slip.pyramid_level
+            if scale < 1:
+                qr_data = SlipQRReader._decode_qr(level)
+                if qr_data:
+                    return qr_data
+            
+            qr_data = SlipQRReader._decode_qr(slip.gray)
+            if qr_data:
+                return qr_data
             
             # If no QR found, try with preprocessing
             logger.info("No QR found on first attempt, trying with preprocessing")
-            return SlipQRReader._read_qr_with_preprocessing(image)
+            return SlipQRReader._read_qr_with_preprocessing(slip, crops)
             
         except Exception as e:
             logger.error(f"Error reading QR code: {str(e)}")
             return None
     
     @staticmethod
-    def _read_qr_with_preprocessing(image: np.ndarray) -> Optional[str]:
+    def _read_qr_with_preprocessing(slip: SlipImage, crops: List[np.ndarray]) -> Optional[str]:
         """
-        Try to read QR code with image preprocessing
-        Useful for low-quality or rotated images
+        Try to read QR code through the adaptive preprocessing cascade
+        Useful for low-quality, rotated or skewed images
+        
+        Strategies run on the localised candidate crops, or on the whole
+        grayscale image when localisation found nothing. The cascade record
+        is left on slip.qr_preprocessing for the analysis result.
         
         Args:
-            image: OpenCV image array
+            slip: Decoded slip context
+            crops: Candidate crops already prepared for decode
         
         Returns:
             QR code data or None
         """
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply contrast enhancement
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(gray)
-            
-            # Threshold
-            _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Decode
-            qr_codes = decode(thresh)
-            if qr_codes:
-                return qr_codes[0].data.decode('utf-8')
-            
-            # Try with inverted image
-            inverted = cv2.bitwise_not(thresh)
-            qr_codes = decode(inverted)
-            if qr_codes:
-                return qr_codes[0].data.decode('utf-8')
+            qr_data, record = get_preprocessing_cascade().run(
+                crops or [slip.gray], SlipQRReader._decode_qr, slip.source_key
+            )
+            slip.qr_preprocessing = record
+            if qr_data:
+                logger.info(f"QR recovered by preprocessing strategy '{record['strategy']}'")
+            return qr_data
             
         except Exception as e:
             logger.error(f"Error in preprocessing: {str(e)}")
@@ -100,81 +450,124 @@ class SlipQRReader:
         """
         Parse PromptPay QR code payload (EMVCo format)
         
+        The trailing CRC is checked first; a corrupted or forged payload is
+        returned with crc_valid False and no fields extracted.
+        
         Args:
             qr_data: QR code data string
         
+        Nested templates are decoded through emvco.TLVNode: tag 29/30
+        sub-tags give the payee account, tag 62 sub-tag 05 or the bill
+        payment reference give the transaction reference, and bank
+        slip-verification QRs (template under tag 00) give the sending bank
+        code and transaction reference.
+        
         Returns:
-            Dictionary with parsed data (merchant_id, amount, etc)
+            Dictionary with parsed data (merchant_id, account_id, reference,
+            amount_satang, etc; amount is the same in baht, for display)
         """
         result = {
             "merchant_id": None,
             "account_id": None,
+            "account_type": None,
+            "reference": None,
+            "bank_code": None,
+            "is_slip_verification": False,
             "amount": None,
+            "amount_satang": None,
             "currency": None,
             "merchant_name": None,
             "city": None,
+            "crc_valid": emvco.verify_crc(qr_data),
             "raw_data": qr_data
         }
         
+        if not result["crc_valid"]:
+            logger.warning("QR payload failed CRC check, ignoring its contents")
+            return result
+        
         try:
-            # Parse EMVCo format TLV
-            i = 0
-            while i < len(qr_data) - 4:  # -4 for CRC
-                tag = qr_data[i:i+2]
-                length = int(qr_data[i+2:i+4])
-                value = qr_data[i+4:i+4+length]
-                
-                # Tag 29: Merchant Account Information
-                if tag == "29":
-                    # Parse merchant info
-                    result["merchant_id"] = value
-                
-                # Tag 54: Amount
-                elif tag == "54":
-                    try:
-                        result["amount"] = float(value)
-                    except ValueError:
-                        pass
-                
-                # Tag 53: Currency
-                elif tag == "53":
-                    result["currency"] = value
-                
-                # Tag 59: Merchant Name
-                elif tag == "59":
-                    result["merchant_name"] = value
-                
-                # Tag 60: City
-                elif tag == "60":
-                    result["city"] = value
-                
-                i += 4 + length
+            payload = emvco.parse_payload(qr_data)
             
-        except Exception as e:
+            # Bank slip-verification QR: 00 is a template, not the format indicator
+            slip = payload.template(emvco.TAG_SLIP_VERIFICATION) if len(payload.get("00", "")) > 2 else None
+            if slip is not None:
+                result["is_slip_verification"] = True
+                result["bank_code"] = slip.get("01")
+                result["reference"] = slip.get("02")
+                return result
+            
+            # Tag 29: PromptPay credit transfer / Tag 30: bill payment
+            merchant_tag = emvco.TAG_PROMPTPAY if emvco.TAG_PROMPTPAY in payload else emvco.TAG_BILL_PAYMENT
+            result["merchant_id"] = payload.get(merchant_tag)
+            merchant = payload.template(merchant_tag)
+            if merchant is not None:
+                for sub_tag, account_type in SlipQRReader.ACCOUNT_TYPES[merchant_tag]:
+                    if sub_tag in merchant:
+                        result["account_id"] = merchant.get(sub_tag)
+                        result["account_type"] = account_type
+                        break
+                if merchant_tag == emvco.TAG_BILL_PAYMENT:
+                    result["reference"] = merchant.get("02")
+            
+            # Tag 62 sub-tag 05: reference label
+            if result["reference"] is None:
+                result["reference"] = payload.find(emvco.TAG_ADDITIONAL_DATA, "05")
+            
+            amount = payload.get(emvco.TAG_AMOUNT)
+            if amount is not None:
+                try:
+                    result["amount_satang"] = parse_satang(amount)
+                    result["amount"] = to_baht(result["amount_satang"])
+                except ValueError:
+                    pass
+            
+            result["currency"] = payload.get(emvco.TAG_CURRENCY)
+            result["merchant_name"] = payload.get(emvco.TAG_MERCHANT_NAME)
+            result["city"] = payload.get(emvco.TAG_CITY)
+            
+        except emvco.TLVError as e:
             logger.error(f"Error parsing QR data: {str(e)}")
         
         return result
     
     @staticmethod
-    def extract_ref_id_from_image(image_bytes: bytes) -> Tuple[Optional[str], Optional[str]]:
+    def payload_ref_id(qr_data: str, amount_satang: Optional[int]) -> Optional[str]:
+        """
+        Key of a QR that carries no transaction reference (PromptPay merchant payloads)
+        
+        The payload's declared CRC plus its amount. Every order for that
+        amount renders the same payload, so the key names a payment only
+        together with the order it pays (see main.analysis_ref_id).
+        """
+        crc = emvco.split_crc(qr_data)
+        if crc is None or amount_satang is None:
+            return None
+        return f"{crc}_{amount_satang}"
+    
+    @staticmethod
+    def extract_ref_id_from_image(image: SlipSource) -> Tuple[Optional[str], Optional[str]]:
         """
         Extract QR code and parse it to get reference ID and bank ID
         
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or an existing SlipImage context
         
         Returns:
             Tuple of (ref_id, bank_id) or (None, None) if extraction fails
         """
-        qr_data = SlipQRReader.read_qr_from_image(image_bytes)
+        qr_data = SlipQRReader.read_qr_from_image(image)
         
         if not qr_data:
             logger.warning("No QR code found in image")
             return None, None
         
-        # If it's PromptPay format, parse it
-        if qr_data.startswith("00020"):  # EMVCo format indicator
-            parsed = SlipQRReader.parse_promptpay_qr(qr_data)
+        # If it's an EMVCo payload (PromptPay or slip verification), parse it
+        parsed = SlipQRReader.parse_promptpay_qr(qr_data)
+        if parsed["is_slip_verification"]:
+            ref_id = parsed["reference"]
+            bank_id = parsed["bank_code"]
+        elif parsed["crc_valid"]:
             # Extract account ID as ref_id (could be phone or national ID)
             ref_id = parsed.get("account_id")
             bank_id = parsed.get("merchant_id")
@@ -186,42 +579,30 @@ class SlipQRReader:
         return ref_id, bank_id
     
     @staticmethod
-    def extract_text_from_image(image_bytes: bytes) -> Optional[str]:
+    def extract_text_from_image(image: SlipSource) -> Optional[str]:
         """
         Extract text from slip image using OCR (Tesseract)
         For backup verification when QR fails
         
         Args:
-            image_bytes: Image file bytes
+            image: Image file bytes or an existing SlipImage context
         
         Returns:
             Extracted text or None
         """
-        if not TESSERACT_AVAILABLE:
-            logger.warning("pytesseract not available - OCR skipped")
+        backend = get_ocr_backend()
+        if backend is None:
+            logger.warning("No OCR engine available - OCR skipped")
             return None
         
         try:
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            slip = SlipImage.from_source(image)
             
-            if image is None:
+            if slip.gray is None:
                 return None
             
-            # Preprocess for better OCR
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Upscale image for better OCR
-            scale_percent = 200
-            width = int(gray.shape[1] * scale_percent / 100)
-            height = int(gray.shape[0] * scale_percent / 100)
-            upscaled = cv2.resize(gray, (width, height), interpolation=cv2.INTER_CUBIC)
-            
-            # Apply thresholding
-            _, thresh = cv2.threshold(upscaled, 150, 255, cv2.THRESH_BINARY)
-            
-            # OCR
-            text = pytesseract.image_to_string(thresh, lang='tha+eng')
+            # Upscaled + thresholded image (cached on the context)
+            text = backend.image_to_string(slip.ocr_binary)
             
             return text.strip() if text else None
             
@@ -233,48 +614,23 @@ class SlipQRReader:
     def extract_amount_from_ocr_text(text: str) -> Optional[float]:
         """
         Extract amount from OCR text (slip text)
-        Patterns: "123.45", "123,45", "เงินเข้า 123.45"
+        Highest-ranked amount from scan_slip_text: labelled ("จำนวน",
+        "Amount") and unit-suffixed figures win; fees and balances are skipped
         
         Args:
             text: OCR extracted text
         
         Returns:
-            Amount or None
+            Amount in baht or None
         """
-        if not text:
-            return None
-        
-        try:
-            # Pattern 1: เงินเข้า X บาท
-            match = re.search(r'เงินเข้า\s*(\d+[.,]\d+)\s*บาท', text)
-            if match:
-                return float(match.group(1).replace(',', '.'))
-            
-            # Pattern 2: จำนวน X บาท
-            match = re.search(r'จำนวน\s*(\d+[.,]\d+)\s*บาท', text)
-            if match:
-                return float(match.group(1).replace(',', '.'))
-            
-            # Pattern 3: Just number with บาท
-            match = re.search(r'(\d+[.,]\d+)\s*บาท', text)
-            if match:
-                return float(match.group(1).replace(',', '.'))
-            
-            # Pattern 4: ยอดเงิน X บาท
-            match = re.search(r'ยอดเงิน\s*(\d+[.,]\d+)', text)
-            if match:
-                return float(match.group(1).replace(',', '.'))
-        
-        except Exception as e:
-            logger.error(f"Error extracting amount from OCR: {str(e)}")
-        
-        return None
+        return to_baht(scan_slip_text(text).best("amount_satang"))
     
     @staticmethod
     def extract_ref_from_ocr_text(text: str) -> Optional[str]:
         """
         Extract transaction reference from OCR text
-        Patterns: "Ref: ABC123", "Reference: ABC123", etc.
+        Highest-ranked reference from scan_slip_text ("เลขที่รายการ",
+        "Transaction ID", "Ref No", ...)
         
         Args:
             text: OCR extracted text
@@ -282,43 +638,89 @@ class SlipQRReader:
         Returns:
             Reference ID or None
         """
-        if not text:
-            return None
+        return scan_slip_text(text).best("reference")
+    
+    @staticmethod
+    def run_ocr(image: SlipSource) -> Dict:
+        """
+        OCR the slip and extract its fields in one scan of the text
         
-        try:
-            # Pattern 1: Ref: ABC123
-            match = re.search(r'Ref[erence]*\s*:?\s*([A-Za-z0-9]+)', text)
-            if match:
-                return match.group(1).strip()
-            
-            # Pattern 2: เลขอ้างอิง
-            match = re.search(r'เลขอ้างอิง\s*([A-Za-z0-9]+)', text)
-            if match:
-                return match.group(1).strip()
-            
-            # Pattern 3: Transaction ID / Ref ID
-            match = re.search(r'(?:Transaction|Transfer)\s*(?:ID|Ref)\s*:?\s*([A-Za-z0-9]+)', text, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
+        Returns:
+            {"ocr_text": str, "ocr_amount_satang": int, "ocr_amount": float (baht),
+             "ocr_ref_id": str, "ocr_fields": best value per slip_text.FIELDS}
+            (values may be None)
+        """
+        ocr_text = SlipQRReader.extract_text_from_image(image)
+        fields = scan_slip_text(ocr_text)
+        ocr_amount_satang = fields.best("amount_satang")
+        return {
+            "ocr_text": ocr_text,
+            "ocr_amount_satang": ocr_amount_satang,
+            "ocr_amount": to_baht(ocr_amount_satang),
+            "ocr_ref_id": fields.best("reference"),
+            "ocr_fields": fields.to_dict(),
+        }
+    
+    @staticmethod
+    def score_confidence(qr_amount_satang: Optional[int], ocr_amount_satang: Optional[int]) -> Tuple[str, bool]:
+        """
+        Confidence from the QR and OCR amounts (in satang, compared exactly)
         
-        except Exception as e:
-            logger.error(f"Error extracting ref from OCR: {str(e)}")
+        Both present and equal -> high; one present (or both, disagreeing)
+        -> medium; neither -> low. A skipped or deferred OCR counts as "no
+        OCR amount", so QR-only results score medium until cross-checked.
         
-        return None
+        Returns:
+            (confidence, amounts_match)
+        """
+        if qr_amount_satang and ocr_amount_satang:
+            if qr_amount_satang == ocr_amount_satang:
+                return "high", True
+            return "medium", False
+        if qr_amount_satang or ocr_amount_satang:
+            return "medium", False
+        return "low", False
+    
+    @staticmethod
+    def should_run_ocr(qr_conclusive: bool, policy: OCRPolicy, sample_rate: float = 0.0) -> bool:
+        """Decide whether OCR runs inline for this slip under the given policy"""
+        if policy == OCRPolicy.always or not qr_conclusive:
+            return True
+        if policy == OCRPolicy.sampled:
+            return random.random() < sample_rate
+        return False
     
     @staticmethod
-    def comprehensive_slip_analysis(image_bytes: bytes) -> Dict:
+    def comprehensive_slip_analysis(
+        image: SlipSource,
+        ocr_policy: OCRPolicy = OCRPolicy.always,
+        ocr_sample_rate: float = 0.0,
+    ) -> Dict:
         """
         Comprehensive analysis of slip image (QR + OCR dual verification)
+        The image is decoded once and shared by the QR and OCR stages.
+        
+        Args:
+            image: Image file bytes or an existing SlipImage context
+            ocr_policy: When to run OCR (see OCRPolicy); a QR is conclusive
+                when it decodes and carries an amount
+            ocr_sample_rate: Fraction of conclusive slips OCR'd under `sampled`
         
         Returns:
             {
                 "qr_found": bool,
                 "qr_data": str,
+                "qr_crc_valid": bool (None when no QR was read),
                 "ocr_text": str,
+                "ocr_fields": OCR date / time / accounts etc. (None unless OCR ran),
+                "ocr_status": "done/skipped/deferred",
+                "perceptual_hash": str,
+                "qr_preprocessing": cascade record or None,
                 "extracted_data": {
-                    "qr_amount": float,
-                    "ocr_amount": float,
+                    "qr_amount_satang": int,
+                    "ocr_amount_satang": int,
+                    "qr_amount": float (baht, for display),
+                    "ocr_amount": float (baht, for display),
                     "qr_ref_id": str,
                     "ocr_ref_id": str,
                     "amounts_match": bool
@@ -329,8 +731,15 @@ class SlipQRReader:
         result = {
             "qr_found": False,
             "qr_data": None,
+            "qr_crc_valid": None,
             "ocr_text": None,
+            "ocr_fields": None,
+            "ocr_status": OCRStatus.skipped.value,
+            "perceptual_hash": None,
+            "qr_preprocessing": None,
             "extracted_data": {
+                "qr_amount_satang": None,
+                "ocr_amount_satang": None,
                 "qr_amount": None,
                 "ocr_amount": None,
                 "qr_ref_id": None,
@@ -340,33 +749,42 @@ class SlipQRReader:
             "confidence": "low"
         }
         
+        slip = SlipImage.from_source(image)
+        result["perceptual_hash"] = slip.perceptual_hash
+        
         # Try QR first
-        qr_data = SlipQRReader.read_qr_from_image(image_bytes)
+        qr_data = SlipQRReader.read_qr_from_image(slip)
+        result["qr_preprocessing"] = slip.qr_preprocessing
         if qr_data:
             result["qr_found"] = True
             result["qr_data"] = qr_data
             parsed = SlipQRReader.parse_promptpay_qr(qr_data)
+            result["qr_crc_valid"] = parsed["crc_valid"]
+            result["extracted_data"]["qr_amount_satang"] = parsed.get("amount_satang")
             result["extracted_data"]["qr_amount"] = parsed.get("amount")
-            result["extracted_data"]["qr_ref_id"] = parsed.get("merchant_id")
-        
-        # Try OCR as backup/verification
-        ocr_text = SlipQRReader.extract_text_from_image(image_bytes)
-        if ocr_text:
-            result["ocr_text"] = ocr_text
-            result["extracted_data"]["ocr_amount"] = SlipQRReader.extract_amount_from_ocr_text(ocr_text)
-            result["extracted_data"]["ocr_ref_id"] = SlipQRReader.extract_ref_from_ocr_text(ocr_text)
+            # Transaction-level reference only: the merchant account is shared by every payment to it.
+            # Merchant payloads have none; verify_slip keys them on the payload and the order it pays
+            result["extracted_data"]["qr_ref_id"] = parsed.get("reference")
+        
+        # OCR as backup/verification, subject to the policy
+        qr_conclusive = result["extracted_data"]["qr_amount_satang"] is not None
+        if SlipQRReader.should_run_ocr(qr_conclusive, OCRPolicy(ocr_policy), ocr_sample_rate):
+            ocr = SlipQRReader.run_ocr(slip)
+            result["ocr_text"] = ocr["ocr_text"]
+            result["ocr_fields"] = ocr["ocr_fields"]
+            result["extracted_data"]["ocr_amount_satang"] = ocr["ocr_amount_satang"]
+            result["extracted_data"]["ocr_amount"] = ocr["ocr_amount"]
+            result["extracted_data"]["ocr_ref_id"] = ocr["ocr_ref_id"]
+            result["ocr_status"] = OCRStatus.done.value
+        elif ocr_policy == OCRPolicy.async_after_response:
+            result["ocr_status"] = OCRStatus.deferred.value
         
         # Calculate confidence
-        qr_amount = result["extracted_data"]["qr_amount"]
-        ocr_amount = result["extracted_data"]["ocr_amount"]
-        
-        if qr_amount and ocr_amount:
-            if abs(qr_amount - ocr_amount) < 0.01:
-                result["extracted_data"]["amounts_match"] = True
-                result["confidence"] = "high"
-            else:
-                result["confidence"] = "medium"
-        elif qr_amount or ocr_amount:
-            result["confidence"] = "medium"
+        confidence, amounts_match = SlipQRReader.score_confidence(
+            result["extracted_data"]["qr_amount_satang"],
+            result["extracted_data"]["ocr_amount_satang"]
+        )
+        result["extracted_data"]["amounts_match"] = amounts_match
+        result["confidence"] = confidence
         
         return result
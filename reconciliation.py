@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import (
+    PENDING_ORDER, PENDING_SLIP, Order, OrderStatus, ReconciliationWatermark, Transaction, TransactionStatus, utc_now
+)
+
+logger = logging.getLogger(__name__)
+
+# reconciliation_watermarks row for bank notifications (transactions.id)
+WATERMARK = "notifications"
+
+
+def create_watermark(engine: Engine):
+    """The reconciliation_watermarks table and the notifications row, starting before every transaction (migration 0005)"""
+    ReconciliationWatermark.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as connection:
+        exists = connection.execute(
+            select(ReconciliationWatermark.name).where(ReconciliationWatermark.name == WATERMARK)
+        ).first()
+        if exists is None:
+            connection.execute(ReconciliationWatermark.__table__.insert().values(
+                name=WATERMARK, last_id=0, updated_at=datetime.utcnow()
+            ))
+
+
+class ReconcileBatch:
+    """What one reconcile() call did"""
+
+    __slots__ = ("scanned", "rescanned", "matched", "ambiguous", "order_ids", "watermark")
+
+    def __init__(self, scanned: int = 0, rescanned: int = 0, matched: int = 0, ambiguous: int = 0,
+                 order_ids: Optional[List[int]] = None, watermark: Optional[int] = None):
+        self.scanned = scanned  # pending_slip notifications read past the watermark
+        self.rescanned = rescanned  # recent pending_slip notifications read again below it
+        self.matched = matched  # orders completed by a notification
+        self.ambiguous = ambiguous  # notifications left for a slip: more than one candidate pairing (re-scans count again)
+        self.order_ids = order_ids or []
+        self.watermark = watermark  # None: another worker holds it, or nothing settled yet
+
+
+class NotificationReconciler:
+    """
+    Completes pending orders from bank notifications, without a slip
+
+    A pass reads the pending_slip notifications past a watermark (the
+    highest transactions.id already reconciled), batch_size at a time, and
+    the pending orders that could have been paid by them in one query:
+    same amounts, created within window_minutes before the notification.
+    They are joined in memory by amount. A pairing is only made when it is
+    unambiguous, one notification and one order that fit each other in the
+    batch; anything else is left for the slip upload to decide.
+
+    Each batch is one database transaction: orders claimed with a
+    compare-and-set on their status (a slip may have completed one
+    meanwhile), notifications marked matched, amount slots freed and the
+    watermark advanced together. A pass interrupted at any point resumes
+    from the last committed watermark and redoes nothing. The watermark
+    row is read FOR UPDATE SKIP LOCKED, so with several workers one runs
+    the batch and the others skip it.
+
+    Notifications younger than settle_seconds are not read yet: a
+    concurrent commit of a lower transaction id may still be in flight, and
+    the watermark should not pass it. A commit can still land behind the
+    watermark (a batch of thousands, a lock wait), so each pass also reads
+    the pending_slip notifications of the last rescan_seconds below it
+    again, and pairs them with the new ones. Both ages are measured on the
+    database clock, against created_at, which it sets on insert.
+    """
+
+    def __init__(self, amount_slots, pending_orders, batch_size: int = 1000, window_minutes: int = 60,
+                 settle_seconds: float = 5.0, rescan_seconds: float = 300.0, interval: float = 5.0):
+        self.amount_slots = amount_slots
+        self.pending_orders = pending_orders
+        self.batch_size = batch_size
+        self.window = timedelta(minutes=window_minutes)
+        self.settle = timedelta(seconds=settle_seconds)
+        self.rescan = timedelta(seconds=rescan_seconds)
+        self.interval = interval
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.batches = 0
+        self.scanned = 0
+        self.rescanned = 0
+        self.matched = 0
+        self.ambiguous = 0
+        self.lost = 0
+        self.failures = 0
+        self.watermark: Optional[int] = None
+        self.last_pass_ms = 0.0
+
+    @classmethod
+    def from_settings(cls, amount_slots, pending_orders) -> "NotificationReconciler":
+        return cls(
+            amount_slots,
+            pending_orders,
+            batch_size=settings.RECONCILE_BATCH_SIZE,
+            window_minutes=settings.RECONCILE_WINDOW_MINUTES,
+            settle_seconds=settings.RECONCILE_SETTLE_SECONDS,
+            rescan_seconds=settings.RECONCILE_RESCAN_SECONDS,
+            interval=settings.RECONCILE_INTERVAL,
+        )
+
+    def pair(self, notifications: List[Tuple], orders: List[Tuple]) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Unambiguous (transaction id, order id) pairs, and how many notifications had a rival
+
+        notifications: (id, amount_satang, created_at); orders: (id, amount_satang, created_at).
+        A notification's candidates are the orders of its amount created at
+        most window before it; it pairs only when it has one candidate and is
+        that order's only notification. A notification no order fits (one
+        re-scanned from an earlier pass, say) is no rival.
+        """
+        by_amount: Dict[int, List[Tuple]] = {}
+        for order in orders:
+            by_amount.setdefault(order[1], []).append(order)
+        candidates: Dict[int, List[int]] = {}
+        claims: Dict[int, int] = {}
+        for transaction_id, amount, received_at in notifications:
+            fits = [
+                order_id for order_id, _, created_at in by_amount.get(amount, ())
+                if created_at <= received_at <= created_at + self.window
+            ]
+            if fits:
+                candidates[transaction_id] = fits
+                for order_id in fits:
+                    claims[order_id] = claims.get(order_id, 0) + 1
+
+        pairs = []
+        ambiguous = 0
+        for transaction_id, fits in candidates.items():
+            if len(fits) == 1 and claims[fits[0]] == 1:
+                pairs.append((transaction_id, fits[0]))
+            else:
+                ambiguous += 1
+        return pairs, ambiguous
+
+    def reconcile(self, db: Session, rescan: bool = True) -> ReconcileBatch:
+        """
+        Reconcile one batch past the watermark, and with rescan the recent
+        notifications below it; the caller commits
+
+        Synchronous ORM code (run it with AsyncSession.run_sync).
+        """
+        watermark = db.execute(
+            select(ReconciliationWatermark).where(
+                ReconciliationWatermark.name == WATERMARK
+            ).with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+        if watermark is None:  # another worker's pass holds it (or migration 0005 has not run)
+            return ReconcileBatch()
+
+        now = db.execute(select(utc_now())).scalar()
+        rows = db.execute(
+            select(Transaction.id, Transaction.amount_satang, Transaction.created_at).where(
+                Transaction.id > watermark.last_id,
+                Transaction.status == TransactionStatus.pending_slip
+            ).order_by(Transaction.id).limit(self.batch_size)
+        ).all()
+        # Stop at the first unsettled notification: everything after it waits too
+        cutoff = now - self.settle
+        settled = []
+        for row in rows:
+            if row.created_at >= cutoff:
+                break
+            settled.append(tuple(row))
+
+        # Commits that landed behind the watermark (idx_pending_slip_created)
+        late = []
+        if rescan and self.rescan:
+            late = [tuple(row) for row in db.execute(
+                select(Transaction.id, Transaction.amount_satang, Transaction.created_at).where(
+                    Transaction.status == PENDING_SLIP,
+                    Transaction.created_at >= now - self.rescan,
+                    Transaction.id <= watermark.last_id
+                ).order_by(Transaction.created_at).limit(self.batch_size)
+            ).all()]
+        notifications = late + settled
+        if not notifications:
+            return ReconcileBatch()
+
+        # One query for every order any of them could have paid (idx_pending_amount_created)
+        orders = db.execute(
+            select(Order.id, Order.amount_satang, Order.created_at).where(
+                Order.status == PENDING_ORDER,
+                Order.amount_satang.in_({amount for _, amount, _ in notifications}),
+                Order.created_at >= min(received_at for _, _, received_at in notifications) - self.window,
+                Order.created_at <= max(received_at for _, _, received_at in notifications)
+            )
+        ).all()
+        pairs, ambiguous = self.pair(notifications, [tuple(order) for order in orders])
+
+        claimed: Dict[int, str] = {}
+        if pairs:
+            now = datetime.utcnow()
+            # Compare-and-set: an order a slip completed since the query above stays as it is
+            claimed = dict(db.execute(
+                update(Order).where(
+                    Order.id.in_([order_id for _, order_id in pairs]),
+                    Order.status == PENDING_ORDER
+                ).values(status=OrderStatus.completed, updated_at=now).returning(Order.id, Order.order_id),
+                execution_options={"synchronize_session": False}
+            ).all())
+            if claimed:
+                # One statement for the batch; executemany is a round trip per row on some drivers
+                matched = {transaction_id: order_id for transaction_id, order_id in pairs if order_id in claimed}
+                db.execute(
+                    update(Transaction).where(Transaction.id.in_(matched)).values(
+                        status=TransactionStatus.matched,
+                        matched_order_id=case(matched, value=Transaction.id),
+                        updated_at=now
+                    ),
+                    execution_options={"synchronize_session": False}
+                )
+                self.amount_slots.release(db, claimed.values())
+            self.lost += len(pairs) - len(claimed)
+
+        if settled:
+            watermark.last_id = settled[-1][0]
+            watermark.updated_at = datetime.utcnow()
+        db.flush()
+        return ReconcileBatch(
+            scanned=len(settled), rescanned=len(late), matched=len(claimed), ambiguous=ambiguous,
+            order_ids=list(claimed), watermark=watermark.last_id
+        )
+
+    async def run_once(self, session_factory) -> int:
+        """Reconcile batches until caught up (or stop()); returns the orders completed"""
+        started = time.perf_counter()
+        completed = 0
+        rescan = True  # once per pass: the batches after the first only read further past the watermark
+        while not self._stop.is_set():
+            async with session_factory() as db:
+                batch = await db.run_sync(self.reconcile, rescan)
+                await db.commit()
+            if batch.watermark is None:
+                break
+            for order_id in batch.order_ids:
+                self.pending_orders.discard(order_id)
+            self.batches += 1
+            rescan = False
+            self.scanned += batch.scanned
+            self.rescanned += batch.rescanned
+            self.matched += batch.matched
+            self.ambiguous += batch.ambiguous
+            self.watermark = batch.watermark
+            completed += batch.matched
+            if batch.scanned < self.batch_size:
+                break
+        self.passes += 1
+        self.last_pass_ms = round((time.perf_counter() - started) * 1000, 1)
+        if completed:
+            logger.info(f"Reconciliation completed {completed} orders from bank notifications (watermark {self.watermark})")
+        return completed
+
+    async def _wait(self, seconds: float) -> bool:
+        """Sleep up to seconds; True if stop() was called"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stop.is_set()
+
+    async def follow(self, session_factory):
+        """A pass every interval seconds until stop()"""
+        while not await self._wait(self.interval):
+            try:
+                await self.run_once(session_factory)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Reconciliation pass failed: {str(e)}")
+
+    def start(self, session_factory):
+        """Reconcile in a background task of the running event loop (one per worker)"""
+        if self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self.follow(session_factory))
+
+    async def stop(self):
+        """Finish the current batch and stop"""
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "passes": self.passes,
+            "batches": self.batches,
+            "scanned": self.scanned,
+            "rescanned": self.rescanned,
+            "matched": self.matched,
+            "ambiguous": self.ambiguous,
+            "lost_to_slips": self.lost,
+            "failures": self.failures,
+            "watermark": self.watermark,
+            "last_pass_ms": self.last_pass_ms,
+        }
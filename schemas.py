@@ -1,8 +1,11 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from typing import List, Optional
 from enum import Enum
 
+from config import settings
+
 
 class OrderStatus(str, Enum):
     pending = "pending"
@@ -21,23 +24,34 @@ class TransactionStatus(str, Enum):
 # Request Schemas
 class GenerateQRRequest(BaseModel):
     order_id: str = Field(..., min_length=1, max_length=100)
-    amount: float = Field(..., gt=0)
+    amount: Decimal = Field(..., gt=0, max_digits=12, decimal_places=2)  # baht; parsed exactly, never as float
+    ttl_minutes: Optional[int] = Field(None, gt=0, le=settings.ORDER_TTL_MAX_MINUTES)  # default ORDER_PENDING_TTL_MINUTES
+
+
+class BulkGenerateQRRequest(BaseModel):
+    orders: List[GenerateQRRequest] = Field(..., min_length=1)
 
 
 class WebhookLineNotification(BaseModel):
     app: str  # e.g., "LINE"
     title: str  # e.g., "LINE BK"
-    text: str  # e.g., "เงินเข้า 100.50 บาท เวลา 12:00"
+    text: str = Field(..., max_length=500)  # e.g., "เงินเข้า 100.50 บาท เวลา 12:00"; Transaction.notification_text
     timestamp: int  # Unix timestamp
 
 
+class WebhookBatchRequest(BaseModel):
+    notifications: List[WebhookLineNotification] = Field(..., min_length=1)
+
+
 # Response Schemas
 class GenerateQRResponse(BaseModel):
     order_id: str
     amount: float
+    amount_satang: int  # exact amount; amount is for display
     qr_payload: str  # PromptPay payload string
     qr_raw_data: str  # EMVCo format
     created_at: datetime
+    expires_at: Optional[datetime] = None  # unpaid by then: the order expires
 
     class Config:
         from_attributes = True
@@ -47,9 +61,12 @@ class OrderResponse(BaseModel):
     id: int
     order_id: str
     amount: float
+    amount_satang: int
+    qr_payload: Optional[str] = None
     status: OrderStatus
     created_at: datetime
     updated_at: datetime
+    expires_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -59,6 +76,7 @@ class TransactionResponse(BaseModel):
     id: int
     ref_id: str
     amount: float
+    amount_satang: int
     bank_id: Optional[str]
     status: TransactionStatus
     matched_order_id: Optional[int]
@@ -69,20 +87,40 @@ class TransactionResponse(BaseModel):
         from_attributes = True
 
 
+class BulkGenerateQRResponse(BaseModel):
+    created: int  # orders inserted by this request
+    existing: int  # order_ids that already existed (returned unchanged)
+    orders: List[GenerateQRResponse]
+
+
 class WebhookResponse(BaseModel):
     success: bool
     message: str
-    transaction_id: Optional[int]
+    transaction_id: Optional[int] = None
+
+
+class WebhookBatchResponse(BaseModel):
+    recorded: int  # transactions inserted by this request
+    duplicates: int  # already recorded (earlier delivery or earlier in the batch)
+    unparsed: int  # no bank template recognised the text
+    failed: int = 0  # could not be recorded; the rest of the batch was
+    results: List[WebhookResponse]  # one per notification, in request order
 
 
 class UploadSlipResponse(BaseModel):
     success: bool
     message: str
-    ref_id: Optional[str]
-    bank_id: Optional[str]
-    matched_order_id: Optional[int]
-    order_status: Optional[OrderStatus]
-    verification_id: Optional[int]
+    ref_id: Optional[str] = None
+    bank_id: Optional[str] = None
+    matched_order_id: Optional[int] = None
+    order_status: Optional[OrderStatus] = None
+    verification_id: Optional[int] = None
+
+
+class BatchSlipResult(UploadSlipResponse):
+    """One NDJSON line of the batch upload stream"""
+    index: int  # position of the file in the request
+    filename: Optional[str] = None
 
 
 class SlipVerificationDetail(BaseModel):
@@ -90,6 +128,8 @@ class SlipVerificationDetail(BaseModel):
     qr_found: bool
     qr_amount: Optional[float]
     ocr_amount: Optional[float]
+    qr_amount_satang: Optional[int]
+    ocr_amount_satang: Optional[int]
     amounts_match: bool
     confidence: Optional[str]
     status: str  # pending / verified / rejected / manual_review
@@ -112,4 +152,4 @@ class AdminVerificationResponse(BaseModel):
     success: bool
     message: str
     verification_status: str
-    order_status: Optional[OrderStatus]
+    order_status: Optional[OrderStatus] = None
@@ -0,0 +1,92 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import SlipAnalysisResult
+
+logger = logging.getLogger(__name__)
+
+
+class SlipAnalysisCache:
+    """
+    Content-hash cache of comprehensive_slip_analysis results
+
+    A bounded in-process LRU sits in front of the slip_analysis_results
+    table, so byte-identical resubmissions skip OpenCV / Tesseract entirely.
+    """
+
+    def __init__(self, max_entries: int, persist: bool = True):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "SlipAnalysisCache":
+        return cls(
+            max_entries=settings.SLIP_CACHE_SIZE,
+            persist=settings.SLIP_CACHE_PERSIST,
+        )
+
+    def _remember(self, digest: str, analysis: Dict):
+        self._entries[digest] = analysis
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, db: Session, digest: str) -> Optional[Dict]:
+        """Cached analysis for digest, checking memory then the database"""
+        analysis = self._entries.get(digest)
+        if analysis is not None:
+            self._entries.move_to_end(digest)
+            self.memory_hits += 1
+            return analysis
+
+        if self.persist:
+            row = db.query(SlipAnalysisResult).filter(
+                SlipAnalysisResult.digest == digest
+            ).first()
+            if row:
+                self._remember(digest, row.analysis)
+                self.db_hits += 1
+                return row.analysis
+
+        self.misses += 1
+        return None
+
+    def put(self, db: Session, digest: str, analysis: Dict):
+        """Store an analysis in memory and (if enabled) stage it in the database session"""
+        self._remember(digest, analysis)
+        if not self.persist:
+            return
+
+        # Savepoint so a lost race only discards this row; the caller commits
+        savepoint = db.begin_nested()
+        try:
+            db.add(SlipAnalysisResult(
+                digest=digest,
+                analysis=analysis,
+                created_at=datetime.utcnow()
+            ))
+            savepoint.commit()
+        except IntegrityError:
+            # Concurrent upload of the same slip already stored it
+            savepoint.rollback()
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
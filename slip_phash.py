@@ -0,0 +1,241 @@
+import logging
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import SlipVerification, VerificationStatus
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64  # SlipImage.perceptual_hash is a 64-bit DCT hash
+# Verifications whose slip counts as already used; rejected and manual-review slips never do
+ACCEPTED_STATUSES = (VerificationStatus.verified, VerificationStatus.approved_by_admin)
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """Vectorised popcount of a uint64 array (SWAR; numpy < 2 has no bitwise_count)"""
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+class PerceptualHashIndex:
+    """
+    Multi-index hashing over 64-bit perceptual hashes
+
+    Each hash is split into `chunks` substrings. By the pigeonhole principle
+    any hash within Hamming distance r of the query matches the query in at
+    least one chunk to within r // chunks bits, so a search only probes the
+    chunk values a few bit flips away instead of scanning every hash.
+
+    Hashes live in a compacted segment plus a small dict-based delta for
+    recent inserts, merged into the segment every `compact_every` inserts.
+    The segment is a CSR layout: rows grouped by (chunk number, chunk value)
+    with a direct-addressed offsets array, so every probe is two array
+    reads and all probes of a query run as a handful of numpy operations.
+
+    refresh() keeps it to the hashes of accepted verifications, with the
+    slip amount of each; entries are never removed from the segment, a
+    verification that stops being accepted is just no longer matched.
+    """
+
+    def __init__(self, chunks: int = 4, compact_every: int = 20000, refresh_overlap: float = 5.0):
+        if chunks < 4:
+            raise ValueError("chunks must be >= 4 (chunk tables are direct-addressed)")
+        self.chunks = chunks
+        self.chunk_bits = -(-HASH_BITS // chunks)  # ceil: the last chunk may be narrower
+        self.compact_every = compact_every
+        self._mask = (1 << self.chunk_bits) - 1
+        self._mask_cache: Dict[int, List[int]] = {}
+
+        # Compacted segment
+        self._ids = np.empty(0, dtype=np.int64)
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._offsets = np.zeros(chunks * (1 << self.chunk_bits) + 1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)  # rows of _ids/_hashes grouped by bucket
+
+        # Delta: chunk number -> chunk value -> [(item id, full hash)]
+        self._delta: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in range(chunks)]
+        self._delta_items: List[Tuple[int, int]] = []
+
+        # Accepted verifications: SlipVerification.id -> qr_amount_satang
+        self._amounts: Dict[int, Optional[int]] = {}
+        self.refresh_overlap = refresh_overlap  # seconds re-read each refresh, for writes committed late
+        self._refreshed_at: Optional[datetime] = None
+
+    @classmethod
+    def from_settings(cls) -> "PerceptualHashIndex":
+        return cls(refresh_overlap=settings.PHASH_REFRESH_OVERLAP)
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._delta_items)
+
+    def _split(self, value: int) -> List[int]:
+        return [(value >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def _flip_masks(self, radius: int) -> List[int]:
+        """XOR masks of every chunk-width bit pattern with at most `radius` bits set"""
+        masks = self._mask_cache.get(radius)
+        if masks is None:
+            masks = [0]
+            for flips in range(1, radius + 1):
+                for positions in combinations(range(self.chunk_bits), flips):
+                    masks.append(sum(1 << position for position in positions))
+            self._mask_cache[radius] = masks
+        return masks
+
+    def add(self, item_id: int, value: int):
+        """Index one hash; item ids are expected to be added once"""
+        self._delta_items.append((item_id, value))
+        for table, chunk in zip(self._delta, self._split(value)):
+            table.setdefault(chunk, []).append((item_id, value))
+        if len(self._delta_items) >= self.compact_every:
+            self.compact()
+
+    def extend(self, items: List[Tuple[int, int]]):
+        """Index many (item id, hash) pairs, compacting once at the end"""
+        if len(self._delta_items) + len(items) < self.compact_every:
+            for item_id, value in items:
+                self.add(item_id, value)
+            return
+        # Headed for compaction anyway: skip building delta tables
+        self._delta_items.extend(items)
+        self.compact()
+
+    def compact(self):
+        """Merge the delta into the sorted segment"""
+        if not self._delta_items:
+            return
+        ids, hashes = zip(*self._delta_items)
+        self._ids = np.concatenate([self._ids, np.array(ids, dtype=np.int64)])
+        self._hashes = np.concatenate([self._hashes, np.array(hashes, dtype=np.uint64)])
+
+        buckets = np.concatenate([
+            (i << self.chunk_bits)
+            + ((self._hashes >> np.uint64(i * self.chunk_bits)) & np.uint64(self._mask)).astype(np.int64)
+            for i in range(self.chunks)
+        ])
+        order = np.argsort(buckets, kind="stable")
+        self._rows = (order % len(self._hashes)).astype(np.int32)
+        counts = np.bincount(buckets, minlength=len(self._offsets) - 1)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        self._delta = [{} for _ in range(self.chunks)]
+        self._delta_items = []
+
+    def _search_segment(self, value: int, radius: int, matches: Dict[int, int]):
+        if not len(self._rows):
+            return
+        masks = np.array(self._flip_masks(radius // self.chunks), dtype=np.int64)
+        chunks = np.array(self._split(value), dtype=np.int64)
+        bases = np.arange(self.chunks, dtype=np.int64) << self.chunk_bits
+        buckets = (bases[:, None] + (chunks[:, None] ^ masks[None, :])).ravel()
+
+        lo = self._offsets[buckets]
+        lengths = self._offsets[buckets + 1] - lo
+        total = int(lengths.sum())
+        if not total:
+            return
+
+        # Expand the [lo, lo + length) ranges into one index array without a Python loop
+        starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+        rows = self._rows[starts + np.arange(total)]
+
+        distances = _popcount64(self._hashes[rows] ^ np.uint64(value))
+        hits = distances <= radius
+        for item_id, distance in zip(self._ids[rows[hits]].tolist(), distances[hits].tolist()):
+            matches[item_id] = distance
+
+    def _search_delta(self, value: int, radius: int, matches: Dict[int, int]):
+        masks = self._flip_masks(radius // self.chunks)
+        for table, chunk in zip(self._delta, self._split(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if not bucket:
+                    continue
+                for item_id, stored in bucket:
+                    distance = (value ^ stored).bit_count()
+                    if distance <= radius:
+                        matches[item_id] = distance
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """
+        Items within Hamming distance `radius` of value
+
+        Returns:
+            [(item_id, distance)] sorted by distance
+        """
+        matches: Dict[int, int] = {}
+        self._search_segment(value, radius, matches)
+        self._search_delta(value, radius, matches)
+        return sorted(matches.items(), key=lambda match: match[1])
+
+    def refresh(self, db: Session):
+        """
+        Apply verifications accepted, or no longer accepted, since the last refresh
+
+        The first call loads every accepted verification; later ones read
+        the rows updated since the previous call, less refresh_overlap, so
+        a row another worker committed late is not skipped. Rows read twice
+        are applied once.
+        """
+        query = db.query(
+            SlipVerification.id, SlipVerification.perceptual_hash,
+            SlipVerification.qr_amount_satang, SlipVerification.status
+        ).filter(SlipVerification.perceptual_hash.isnot(None))
+        if self._refreshed_at is None:
+            query = query.filter(SlipVerification.status.in_(ACCEPTED_STATUSES))
+        else:
+            query = query.filter(  # idx_slip_updated
+                SlipVerification.updated_at >= self._refreshed_at - timedelta(seconds=self.refresh_overlap)
+            )
+        self._refreshed_at = datetime.utcnow()
+        rows = query.all()
+
+        added = []
+        for verification_id, perceptual_hash, amount_satang, status in rows:
+            if status in ACCEPTED_STATUSES:
+                if verification_id not in self._amounts:
+                    added.append((verification_id, hex_to_hash(perceptual_hash)))
+                self._amounts[verification_id] = amount_satang
+            else:
+                self._amounts.pop(verification_id, None)
+        self.extend(added)
+        if added:
+            logger.debug(f"Perceptual hash index: +{len(added)} slips ({len(self._amounts)} accepted)")
+
+    def find_near_duplicate(
+        self, db: Session, perceptual_hash: Optional[str], amount_satang: int
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Closest accepted verification of the same amount within PHASH_MATCH_DISTANCE
+
+        A secondary signal only: slips from one banking app share a layout,
+        so two different payments can hash within a few bits of each other.
+        The caller has already checked the slip's reference is new; a slip
+        that also shows the amount of an accepted slip and looks like it is
+        taken to be that slip with its QR code replaced.
+
+        Returns:
+            (verification_id, distance) or None
+        """
+        if not perceptual_hash:
+            return None
+        self.refresh(db)
+        for verification_id, distance in self.search(hex_to_hash(perceptual_hash), settings.PHASH_MATCH_DISTANCE):
+            if self._amounts.get(verification_id) == amount_satang:
+                return verification_id, distance
+        return None
@@ -0,0 +1,175 @@
+import re
+from typing import Dict, List, Optional
+
+from money import parse_satang
+
+# Fields a slip's OCR text is scanned for
+FIELDS = ("amount_satang", "reference", "date", "time", "sender_account", "receiver_account")
+
+THAI_MONTHS = r"ม\.?ค\.?|ก\.?พ\.?|มี\.?ค\.?|เม\.?ย\.?|พ\.?ค\.?|มิ\.?ย\.?|ก\.?ค\.?|ส\.?ค\.?|ก\.?ย\.?|ต\.?ค\.?|พ\.?ย\.?|ธ\.?ค\.?"
+ENGLISH_MONTHS = r"(?i:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?"
+
+# 1,500.00 / 1500.00 / 1500,00 (OCR'd decimal comma); a comma before three digits is a thousands separator
+AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d{2})?(?!\d)|\d+\.\d{2}(?!\d)|\d+,\d{2}(?![\d,])"
+UNIT = r"บาท|(?i:THB|Baht)|฿"
+
+AMOUNT_LABELS = {
+    "จำนวนเงิน": 3.0, "ยอดโอน": 3.0, "ยอดเงิน": 3.0, "จำนวน": 2.5, "เงินเข้า": 2.5,
+    "amount": 3.0, "total": 2.0,
+}
+REFERENCE_LABELS = {
+    "เลขที่รายการ": 3.0, "รหัสอ้างอิง": 3.0, "เลขอ้างอิง": 3.0, "หมายเลขอ้างอิง": 3.0,
+    "transaction": 3.0, "transfer": 2.5, "reference": 2.5, "ref": 2.0,
+}
+SENDER_LABELS = ("จาก", "from")
+
+# The first two characters of the labels below (Thai initials are common
+# letters, so one is not selective enough); keep in step when adding a label
+_LABEL_PREFIX = "ค่|คง|ยอ|จำ|จา|เง|เล|หม|รห|ไป|ถึ|[fbatrFBATR]"
+
+# One alternation over every field, split by a token's first character so
+# each position only tries the alternatives that can start there. Within a
+# branch the first alternative that matches wins: labelled forms come
+# before the bare values they contain, and fee / balance figures are
+# consumed so they never become amount candidates.
+_TOKENS = re.compile(
+    r"(?=[คยจเหรไถfbatrFBATR0-9xX*A-Z])(?:"  # any branch's first character, so others are skipped fast
+    r"(?=" + _LABEL_PREFIX + r")(?:"
+    r"(?P<skip>ค่าธรรมเนียม|ยอดคงเหลือ|คงเหลือ|(?i:fee|balance))\s*:?\s*(?:" + UNIT + r")?\s*(?:" + AMOUNT + r")"
+    r"|(?P<amount_label>จำนวนเงิน|ยอดโอน|ยอดเงิน|จำนวน|เงินเข้า|(?i:\bamount|\btotal))\s*[:.]?\s*(?:" + UNIT + r")?\s*"
+    r"(?P<labelled_amount>" + AMOUNT + r"|\d+(?=\s*(?:" + UNIT + r")))"
+    r"|(?P<reference_label>เลขที่รายการ|หมายเลขอ้างอิง|รหัสอ้างอิง|เลขอ้างอิง"
+    r"|(?i:\btransaction\s*(?:id|no\.?|ref\.?)|\btransfer\s*(?:id|ref\.?)|\breference(?:\s*(?:no\.?|id|number))?"
+    r"|\bref(?:\s*(?:no\.?|id))?)\.?)\s*[:.#]?\s*(?P<labelled_reference>[A-Za-z0-9]{6,40})\b"
+    r"|(?P<direction>จาก|ไปยัง|ถึง|(?i:\bfrom\b|\bto\b))"
+    r")"
+    # Numbers only start at their first digit; a month name is only tried before a letter
+    r"|(?<![\d,.])(?=\d)(?:"
+    r"(?P<date>\d{1,2}[/-]\d{1,2}[/-]\d{2,4}"
+    r"|\d{1,2}\s*(?=[ก-ฮA-Za-z])(?:" + THAI_MONTHS + r"|" + ENGLISH_MONTHS + r")\s*\d{2,4})"
+    r"|(?P<time>\d{1,2}:\d{2}(?::\d{2})?)(?P<time_suffix>\s*น\.)?"
+    r"|(?P<amount>" + AMOUNT + r")(?P<amount_unit>\s*(?:" + UNIT + r"))?"
+    r"|(?P<amount_int>\d+)(?=\s*(?:" + UNIT + r"))"
+    r"|(?P<bank_account>\d{3}-\d-\d{5}-\d)"
+    r")"
+    r"|(?=[xX*])(?P<account>(?:[xX*]{1,4}[-\s]?){1,3}[\dxX*][\dxX*-]{1,12}\d(?:-[\dxX*])?)"
+    r"|(?=[A-Z0-9])(?P<token>\b(?=[A-Z0-9]*[A-Z])(?=[A-Z0-9]*\d)[A-Z0-9]{12,30}\b)"
+    r")"
+)
+
+
+class Candidate:
+    """A value found for a field, with its plausibility score and position in the text (0 top - 1 bottom)"""
+
+    __slots__ = ("field", "value", "score", "position")
+
+    def __init__(self, field: str, value, score: float, position: float):
+        self.field = field
+        self.value = value
+        self.score = score
+        self.position = position
+
+    def __repr__(self):
+        return f"Candidate({self.field}={self.value!r}, score={self.score:.1f})"
+
+
+class SlipTextFields:
+    """Ranked candidates per field from one scan of a slip's OCR text"""
+
+    def __init__(self, candidates: Dict[str, List[Candidate]]):
+        self.candidates = candidates
+
+    def best(self, field: str):
+        ranked = self.candidates.get(field)
+        return ranked[0].value if ranked else None
+
+    def to_dict(self) -> Dict:
+        """Best value per field (None when absent)"""
+        return {field: self.best(field) for field in FIELDS}
+
+
+def parse_amount(value: str) -> int:
+    """Satang in an amount token"""
+    if "," in value and "." not in value and len(value) - value.index(",") == 3:
+        return parse_satang(value.replace(",", "."))  # 1500,00
+    return parse_satang(value)
+
+
+def _middle(position: float) -> float:
+    """Amounts sit below the header and parties, above the reference and footer"""
+    return 0.5 if 0.25 <= position <= 0.85 else 0.0
+
+
+def scan_slip_text(text: Optional[str]) -> SlipTextFields:
+    """
+    Scan OCR text once and rank candidates for every field
+
+    A single finditer over one combined regex classifies each token:
+    labelled and bare amounts, labelled and unlabelled references, dates,
+    times and masked account numbers (the first after "From/จาก", or the
+    first seen, is the sender; the next the receiver). Scores add the
+    label's strength, the token's shape (unit, two decimals, length) and
+    where on the slip it sits. Within a field, candidates are ordered by
+    score, then by order of appearance. Amounts are integer satang, parsed
+    from the token's digits rather than through float.
+    """
+    candidates: Dict[str, List[Candidate]] = {field: [] for field in FIELDS}
+    if not text:
+        return SlipTextFields(candidates)
+
+    length = len(text)
+    direction = None
+    accounts = 0
+
+    for match in _TOKENS.finditer(text):
+        position = match.start() / length
+        kind = match.lastgroup
+
+        if kind == "labelled_amount":
+            value = parse_amount(match.group("labelled_amount"))
+            if value > 0:
+                label = match.group("amount_label").lower()
+                score = AMOUNT_LABELS.get(label, 2.0) + 1.0 + _middle(position)
+                candidates["amount_satang"].append(Candidate("amount_satang", value, score, position))
+        elif kind in ("amount", "amount_unit"):
+            value = parse_amount(match.group("amount"))
+            if value > 0:
+                score = 1.0 + (1.5 if match.group("amount_unit") else 0.0) + _middle(position)
+                candidates["amount_satang"].append(Candidate("amount_satang", value, score, position))
+        elif kind == "amount_int":
+            value = int(match.group("amount_int")) * 100
+            if value > 0:
+                candidates["amount_satang"].append(Candidate("amount_satang", value, 1.5 + _middle(position), position))
+        elif kind == "labelled_reference":
+            value = match.group("labelled_reference")
+            label = match.group("reference_label").lower().split()[0].rstrip(".")
+            score = REFERENCE_LABELS.get(label, 2.0)
+            score += 1.0 if 10 <= len(value) <= 30 else 0.0
+            score += 0.5 if any(char.isdigit() for char in value) else -2.0
+            score += 0.5 if position >= 0.5 else 0.0
+            candidates["reference"].append(Candidate("reference", value, score, position))
+        elif kind == "token":
+            value = match.group("token")
+            candidates["reference"].append(Candidate("reference", value, 0.5 + (0.5 if position >= 0.5 else 0.0), position))
+        elif kind == "direction":
+            direction = "sender" if match.group("direction").lower() in SENDER_LABELS else "receiver"
+        elif kind in ("account", "bank_account"):
+            field = f"{direction}_account" if direction else ("sender_account" if accounts == 0 else "receiver_account")
+            score = 2.0 if direction else 1.0
+            candidates[field].append(Candidate(field, match.group(kind).strip(), score, position))
+            direction = None
+            accounts += 1
+        elif kind == "date":
+            value = match.group("date")
+            score = 1.0 + (0.5 if "/" not in value and "-" not in value else 0.0)  # month written out
+            score += 0.5 if position <= 0.34 else 0.0
+            candidates["date"].append(Candidate("date", value, score, position))
+        elif kind in ("time", "time_suffix"):
+            score = 1.0 + (0.5 if match.group("time_suffix") else 0.0) + (0.5 if position <= 0.34 else 0.0)
+            candidates["time"].append(Candidate("time", match.group("time"), score, position))
+        # "skip": fee / balance figures are not the transfer amount
+
+    for ranked in candidates.values():
+        if len(ranked) > 1:
+            ranked.sort(key=lambda candidate: -candidate.score)
+    return SlipTextFields(candidates)
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+from typing import BinaryIO, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+from fastapi import UploadFile
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Formats cv2.imdecode is built with; anything else is rejected from the header
+SLIP_IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "BMP", "TIFF")
+
+READ_CHUNK = 256 * 1024
+
+
+class SlipRejected(Exception):
+    """Raised when an upload is refused before any decode work is done"""
+    status_code = 400
+
+
+class SlipTooLarge(SlipRejected):
+    """Upload exceeds the byte cap, or its header declares too many pixels"""
+    status_code = 413
+
+
+class SlipUnreadable(SlipRejected):
+    """Upload is empty or not an image format the decoder supports"""
+    status_code = 415
+
+
+class SlipUpload:
+    """
+    An ingested slip: the encoded bytes plus what was learnt while reading them
+
+    `data` is a single bytearray filled straight from the spooled upload
+    file; numpy / cv2.imdecode wrap it with np.frombuffer, so the decode
+    path makes no further copies of the encoded image. The SHA-256 digest
+    is computed over the same buffer during the read.
+    """
+
+    def __init__(self, data: bytearray, digest: str, width: int, height: int, image_format: str):
+        self.data = data
+        self.digest = digest
+        self.width = width
+        self.height = height
+        self.image_format = image_format
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def probe_image_size(fp: BinaryIO) -> Tuple[int, int, str]:
+    """
+    Pixel dimensions and format from the image header, without decoding
+
+    PIL.Image.open only parses the header (up to the JPEG SOF / PNG IHDR
+    chunk); the pixel data is never touched.
+    """
+    try:
+        with Image.open(fp, formats=SLIP_IMAGE_FORMATS) as image:
+            width, height = image.size
+            return width, height, image.format
+    except Image.DecompressionBombError:
+        raise SlipTooLarge("Image dimensions exceed the decoder limit")
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise SlipUnreadable("File is not a supported image (JPEG, PNG, WebP, BMP, TIFF)")
+
+
+def ingest_slip_file(fp: BinaryIO, max_bytes: int, max_pixels: int) -> SlipUpload:
+    """
+    Validate and read a spooled slip upload
+
+    1. Size from the spooled file's end offset - rejected before reading
+    2. Pixel count from the image header - rejected before full decode
+    3. One readinto() pass into a preallocated buffer, hashing as it goes
+    """
+    fp.seek(0, 2)
+    size = fp.tell()
+    if size == 0:
+        raise SlipUnreadable("File is empty")
+    if size > max_bytes:
+        raise SlipTooLarge(f"File is {size} bytes, the limit is {max_bytes} bytes")
+
+    fp.seek(0)
+    width, height, image_format = probe_image_size(fp)
+    if width * height > max_pixels:
+        raise SlipTooLarge(f"Image is {width}x{height} pixels, the limit is {max_pixels} pixels")
+
+    fp.seek(0)
+    data = bytearray(size)
+    view = memoryview(data)
+    hasher = hashlib.sha256()
+    offset = 0
+    while offset < size:
+        read = fp.readinto(view[offset:offset + READ_CHUNK])
+        if not read:
+            break
+        hasher.update(view[offset:offset + read])
+        offset += read
+    view.release()
+    if offset < size:
+        del data[offset:]
+
+    return SlipUpload(data, hasher.hexdigest(), width, height, image_format)
+
+
+async def read_slip_upload(
+    file: UploadFile,
+    max_bytes: int = None,
+    max_pixels: int = None
+) -> SlipUpload:
+    """
+    Ingest an UploadFile with the configured byte and pixel caps
+
+    Starlette has already streamed the multipart body into a
+    SpooledTemporaryFile (memory up to 1 MB, then disk); the checks and the
+    read run in the threadpool because a rolled-over spool is real file I/O.
+    """
+    max_bytes = settings.SLIP_MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    max_pixels = settings.SLIP_MAX_PIXELS if max_pixels is None else max_pixels
+    upload = await run_in_threadpool(ingest_slip_file, file.file, max_bytes, max_pixels)
+    logger.info(
+        f"Ingested {file.filename}: {len(upload)} bytes, "
+        f"{upload.width}x{upload.height} {upload.image_format}"
+    )
+    return upload
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisQueueFull(Exception):
+    """Raised when the pool cannot accept another slip (backpressure)"""
+
+
+class AnalysisTimeout(Exception):
+    """Raised when a slip analysis does not finish within the task timeout"""
+
+
+def _warm_up():
+    """Worker initializer: import the OpenCV/pyzbar stack and load the OCR engines once per process"""
+    from qr_reader import get_ocr_backend
+    get_ocr_backend()
+
+
+def _analyze_slip(image_bytes: bytes, ocr_policy: str, ocr_sample_rate: float) -> Dict:
+    from qr_reader import SlipQRReader
+    return SlipQRReader.comprehensive_slip_analysis(image_bytes, ocr_policy, ocr_sample_rate)
+
+
+def _ocr_slip(image_bytes: bytes) -> Dict:
+    from qr_reader import SlipQRReader
+    return SlipQRReader.run_ocr(image_bytes)
+
+
+class _Generation:
+    """One ProcessPoolExecutor of the pool and the tasks it is still running for callers"""
+
+    __slots__ = ("executor", "running", "processes")
+
+    def __init__(self, executor: ProcessPoolExecutor):
+        self.executor = executor
+        self.running = 0  # submitted, not finished and not given up on
+        self.processes = []
+
+    def shutdown(self, cancel_futures: bool = False):
+        """Take no more tasks, without waiting; the worker processes are remembered for terminate()"""
+        # ProcessPoolExecutor forgets its processes on shutdown and cannot stop a running
+        # task (3.14 adds terminate_workers), hence its private process table
+        if self.executor._processes:
+            self.processes = list(self.executor._processes.values())
+        self.executor.shutdown(wait=False, cancel_futures=cancel_futures)
+
+    def terminate(self):
+        self.shutdown(cancel_futures=True)
+        for process in self.processes:
+            process.terminate()
+
+
+class SlipAnalysisPool:
+    """
+    Bounded process pool for CPU-bound slip analysis
+
+    Keeps OpenCV / pyzbar / Tesseract work off the event loop.
+    At most `workers + queue_size` slips are accepted at once; beyond that
+    `AnalysisQueueFull` is raised so the endpoint can answer 503.
+    Workers are recycled after roughly `max_tasks_per_worker` tasks each:
+    the executor is retired (in-flight tasks still finish) and a fresh one
+    takes new submissions. ProcessPoolExecutor's own max_tasks_per_child
+    can deadlock on Python 3.11, so it is not used.
+
+    A running task cannot be cancelled, so when one times out its slot is
+    released and its executor retired the same way; once the executor's
+    other tasks have finished, its worker processes are terminated, the
+    stuck one with them. A slip that never finishes costs one worker for at
+    most one more timeout, not for good.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        timeout: float,
+        max_tasks_per_worker: int = 0,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self._generation: Optional[_Generation] = None
+        self._generation_tasks = 0
+        self._stuck: Set[_Generation] = set()
+        self._abandoned: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._killed = 0
+
+    @classmethod
+    def from_settings(cls) -> "SlipAnalysisPool":
+        return cls(
+            workers=settings.SLIP_ANALYSIS_WORKERS,
+            queue_size=settings.SLIP_ANALYSIS_QUEUE_SIZE,
+            timeout=settings.SLIP_ANALYSIS_TIMEOUT,
+            max_tasks_per_worker=settings.SLIP_ANALYSIS_MAX_TASKS_PER_WORKER,
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def start(self):
+        if self._generation is None:
+            # spawn, not fork: workers must not inherit the app's DB connections
+            self._generation = _Generation(ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            ))
+            self._generation_tasks = 0
+            logger.info(
+                f"Slip analysis pool started: workers={self.workers}, "
+                f"queue={self.queue_size}, timeout={self.timeout}s"
+            )
+
+    def shutdown(self):
+        if self._generation is not None:
+            self._generation.shutdown(cancel_futures=True)
+            self._generation = None
+        for generation in list(self._stuck):
+            self._terminate(generation)
+
+    def _retire(self):
+        """Send new submissions to a fresh executor; the current one finishes what it has"""
+        retired, self._generation = self._generation, None
+        retired.shutdown()
+        self.start()
+
+    def _recycle_if_due(self):
+        if not self.max_tasks_per_worker:
+            return
+        if self._generation_tasks >= self.max_tasks_per_worker * self.workers:
+            self._retire()
+            logger.info("Slip analysis workers recycled")
+
+    def _terminate(self, generation: _Generation):
+        """Kill a stuck executor's worker processes"""
+        with self._lock:
+            if generation not in self._stuck:
+                return
+            self._stuck.discard(generation)
+            self._killed += 1
+        generation.terminate()
+        logger.warning(f"Slip analysis workers terminated after a timeout ({len(generation.processes)} processes)")
+
+    def _release(self, generation: _Generation, future: Future):
+        with self._lock:
+            if future in self._abandoned:  # its slot went when the caller timed out
+                self._abandoned.discard(future)
+                return
+            self._in_flight -= 1
+            self._completed += 1
+            generation.running -= 1
+            idle = generation.running == 0 and generation in self._stuck
+        if idle:
+            self._terminate(generation)
+
+    def _abandon(self, generation: _Generation, future: Future):
+        """The caller timed out: free the slot now and retire the executor the task is stuck in"""
+        with self._lock:
+            self._timed_out += 1
+            if future.done():  # finished (or was cancelled before starting) meanwhile; _release has it
+                return
+            self._abandoned.add(future)
+            self._in_flight -= 1
+            generation.running -= 1
+            self._stuck.add(generation)
+            idle = generation.running == 0
+        if generation is self._generation:
+            self._retire()
+        if idle:
+            self._terminate(generation)
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run `fn(*args)` in a worker process
+
+        Raises:
+            AnalysisQueueFull: pool and queue are saturated
+            AnalysisTimeout: task exceeded the configured timeout
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise AnalysisQueueFull(
+                    f"Slip analysis queue full ({self._in_flight}/{self.capacity})"
+                )
+            self._in_flight += 1
+
+        self.start()
+        self._recycle_if_due()
+        generation = self._generation
+        try:
+            future = generation.executor.submit(fn, *args)
+            self._generation_tasks += 1
+        except BrokenProcessPool:
+            with self._lock:
+                self._in_flight -= 1
+            logger.error("Slip analysis pool broken, restarting")
+            self.shutdown()
+            self.start()
+            raise
+
+        # The slot is held until the worker finishes, so backpressure reflects
+        # real load; a task the caller gives up on releases it at the timeout
+        with self._lock:
+            generation.running += 1
+        future.add_done_callback(lambda done: self._release(generation, done))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(generation, future)
+            raise AnalysisTimeout(f"Slip analysis exceeded {self.timeout}s")
+        except BrokenProcessPool:
+            logger.error("Slip analysis worker died, restarting pool")
+            if generation is self._generation:
+                self.shutdown()
+                self.start()
+            raise
+
+    async def analyze(self, image_bytes: bytes) -> Dict:
+        """Run SlipQRReader.comprehensive_slip_analysis in a worker process"""
+        return await self.run(
+            _analyze_slip, image_bytes, settings.OCR_POLICY, settings.OCR_SAMPLE_RATE
+        )
+
+    async def ocr(self, image_bytes: bytes) -> Dict:
+        """Run SlipQRReader.run_ocr in a worker process (deferred cross-checks)"""
+        return await self.run(_ocr_slip, image_bytes)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "stuck_executors_killed": self._killed,
+            }
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# The app modules create their engines on import, from DATABASE_URL; the tests use engines of their own
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/tests.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,169 @@
+import random
+
+import pytest
+
+import emvco
+from payment_service import PromptPayQRGenerator
+
+
+def tlv(tag: str, value: str) -> str:
+    return f"{tag}{len(value):02d}{value}"
+
+
+def promptpay_payload(rng: random.Random) -> str:
+    if rng.random() < 0.7:
+        return PromptPayQRGenerator.generate_qr_payload(
+            f"08{rng.randrange(10 ** 8):08d}", rng.randrange(100, 5000001)
+        )
+    # Bill payment with references and additional data
+    merchant = tlv("00", "A000000677010112") + tlv("01", f"{rng.randrange(10 ** 15):015d}") \
+        + tlv("02", f"INV{rng.randrange(10 ** 8)}") + tlv("03", "REF2")
+    additional = tlv("05", f"ORDER-{rng.randrange(10 ** 6)}") + tlv("07", "T01")
+    body = tlv("00", "01") + tlv("01", "12") + tlv("30", merchant) + tlv("53", "764") \
+        + tlv("54", f"{rng.uniform(1, 50000):.2f}") + tlv("58", "TH") + tlv("62", additional)
+    return emvco.append_crc(body)
+
+
+def slip_verification_payload(rng: random.Random) -> str:
+    inner = tlv("00", "000001") + tlv("01", f"{rng.randrange(1000):03d}") \
+        + tlv("02", f"{rng.randrange(10 ** 20):020d}ABCDE")
+    return emvco.append_crc(tlv("00", inner) + tlv("51", "TH"), tag="91")
+
+
+def make_corpus(count: int, seed: int = 0):
+    """PromptPay credit transfer and bill payment payloads, and bank slip-verification payloads"""
+    rng = random.Random(seed)
+    return [
+        slip_verification_payload(rng) if rng.random() < 0.3 else promptpay_payload(rng)
+        for _ in range(count)
+    ]
+
+
+def mutate(payload: str, rng: random.Random) -> str:
+    """Truncation, a flipped, inserted or deleted character, or a corrupted length field"""
+    kind = rng.randrange(5)
+    i = rng.randrange(len(payload))
+    if kind == 0:
+        return payload[:i]
+    if kind == 1:
+        return payload[:i] + rng.choice("0123456789ABZ.-") + payload[i + 1:]
+    if kind == 2:
+        return payload[:i] + rng.choice("0123456789X") + payload[i:]
+    if kind == 3:
+        return payload[:i] + payload[i + 1:]
+    spans = list(emvco.parse_spans(payload).values())
+    start, _ = rng.choice(spans)
+    return payload[:start - 2] + f"{rng.randrange(100):02d}" + payload[start:]
+
+
+def walk(node: emvco.TLVNode, depth: int = 0):
+    """Touch every value and try every object as a template, two levels deep"""
+    for tag in node.tags():
+        node.get(tag)
+        child = node.template(tag)
+        if child is not None and depth < 1:
+            walk(child, depth + 1)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return make_corpus(500)
+
+
+def test_payloads_round_trip(corpus):
+    for payload in corpus:
+        assert emvco.verify_crc(payload)
+        node = emvco.parse_payload(payload)
+        assert "".join(tlv(tag, node.get(tag)) for tag in node.tags()) == payload
+        if node.get(emvco.TAG_PROMPTPAY) is not None:
+            assert node.find(emvco.TAG_PROMPTPAY, "00") == "A000000677010112"
+
+    (node,) = emvco.parse_many([slip_verification_payload(random.Random(7))])
+    assert node.find(emvco.TAG_SLIP_VERIFICATION, "00") == "000001"
+    assert len(node.find(emvco.TAG_SLIP_VERIFICATION, "02")) == 25
+
+
+def test_crc_mismatch_is_rejected(corpus):
+    payload = corpus[0]
+    # A changed value, and a wrong declared CRC
+    amount, _ = emvco.parse_spans(payload)[emvco.TAG_AMOUNT]
+    altered = payload[:amount] + ("1" if payload[amount] != "1" else "2") + payload[amount + 1:]
+    wrong_crc = payload[:-4] + emvco.format_crc(int(payload[-4:], 16) ^ 1)
+    for bad in (altered, wrong_crc):
+        assert not emvco.verify_crc(bad)
+        assert emvco.parse_many([bad]) == [None]
+        assert emvco.parse_many([bad], verify=False)[0] is not None
+
+    # No CRC data object at all
+    assert emvco.split_crc(payload[:-8]) is None
+    assert not emvco.verify_crc(payload[:-8])
+    assert emvco.split_crc(payload) == payload[-4:]
+
+
+def test_truncated_payloads(corpus):
+    payload = corpus[0]
+    with pytest.raises(emvco.TLVError, match="Truncated"):
+        emvco.parse_payload(payload[:3])
+    with pytest.raises(emvco.TLVError, match="runs past"):
+        emvco.parse_payload(payload[:-2])
+
+    for cut in range(len(payload)):
+        prefix = payload[:cut]
+        assert not emvco.verify_crc(prefix)
+        try:
+            node = emvco.parse_payload(prefix)
+        except emvco.TLVError:
+            continue
+        # Cut on an object boundary: the objects before it, unchanged
+        assert "".join(tlv(tag, node.get(tag)) for tag in node.tags()) == prefix
+
+
+def test_bad_length_fields():
+    with pytest.raises(emvco.TLVError, match="Non-numeric"):
+        emvco.parse_payload("00020101A2")
+    with pytest.raises(emvco.TLVError, match="runs past"):
+        emvco.parse_payload("000201" + "5410" + "12.50")
+
+    # A malformed nested template is absent, not an error
+    node = emvco.parse_payload(tlv("29", "0016A0000006770101120199") + tlv("53", "764"))
+    assert node.template("29") is None
+    assert node.find("29", "00") is None
+    assert node.get("53") == "764"
+
+    # A repeated ID: the first occurrence wins
+    assert emvco.parse_payload("5402105402205303764").get("54") == "10"
+
+
+def test_mutated_payloads_parse_or_raise_tlverror(corpus):
+    rng = random.Random(1)
+    outcomes = {"parsed": 0, "rejected": 0}
+    for _ in range(5000):
+        payload = mutate(rng.choice(corpus), rng)
+        try:
+            node = emvco.parse_payload(payload)
+        except emvco.TLVError:
+            outcomes["rejected"] += 1
+            continue
+        spans = sorted(node.spans.values())
+        assert all(4 <= start <= end <= len(payload) for start, end in spans)
+        ends = [0] + [end for _, end in spans]
+        if all(start - 4 == ends[k] for k, (start, _) in enumerate(spans)) and ends[-1] == len(payload):
+            # No repeated IDs were dropped: the spans tile and re-encode the payload
+            rebuilt = "".join(tlv(payload[start - 4:start - 2], payload[start:end]) for start, end in spans)
+            assert rebuilt == payload
+        walk(node)
+        outcomes["parsed"] += 1
+
+    assert outcomes["parsed"] and outcomes["rejected"]
+
+
+def test_mutated_payloads_never_break_slip_parsing(corpus):
+    try:
+        import qr_reader
+    except ImportError as e:  # pyzbar without the zbar shared library
+        pytest.skip(str(e))
+    rng = random.Random(2)
+    for _ in range(2000):
+        payload = mutate(rng.choice(corpus), rng)
+        parsed = qr_reader.SlipQRReader.parse_promptpay_qr(payload)
+        assert parsed["crc_valid"] == emvco.verify_crc(payload)
@@ -0,0 +1,118 @@
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+import baseline_schema
+from database import Base
+from migrations import MIGRATIONS, run_migrations
+from models import AmountSlot, Order, OrderStatus, SchemaMigration, SlipVerification, Transaction
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request, tmp_path):
+    """An empty database: a SQLite file, or TEST_POSTGRES_URL with its public schema dropped"""
+    if request.param == "sqlite":
+        engine = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    else:
+        url = os.getenv("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL not set (a database the tests may wipe)")
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text("DROP SCHEMA public CASCADE"))
+            connection.execute(text("CREATE SCHEMA public"))
+    yield engine
+    engine.dispose()
+
+
+def schema_differences(engine) -> List[str]:
+    """Tables, columns, nullability, server defaults and indexes models.py declares that the database does not match"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    differences = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            differences.append(f"missing table {table.name}")
+            continue
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                differences.append(f"missing column {table.name}.{column.name}")
+            elif not column.primary_key and columns[column.name]["nullable"] != column.nullable:
+                differences.append(f"{table.name}.{column.name} nullable is {columns[column.name]['nullable']}")
+            elif not column.primary_key and (columns[column.name]["default"] is None) != (column.server_default is None):
+                differences.append(f"{table.name}.{column.name} default is {columns[column.name]['default']}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        indexes |= {constraint["name"] for constraint in inspector.get_unique_constraints(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                differences.append(f"missing index {index.name}")
+    return differences
+
+
+def test_migrations_create_the_models_schema(engine):
+    applied = run_migrations(engine)
+
+    assert applied == [migration.version for migration in MIGRATIONS]
+    assert schema_differences(engine) == []
+    assert run_migrations(engine) == []
+
+
+def test_baseline_database_upgrades(engine):
+    created_at = datetime.utcnow() - timedelta(minutes=5)
+    baseline_schema.create_baseline(engine)
+    with engine.begin() as connection:
+        def insert(table, **values):
+            return connection.execute(table.insert().values(**values).returning(table.c.id)).scalar()
+
+        insert(baseline_schema.orders, order_id="ORD-1", amount=100.37, status="pending", created_at=created_at)
+        paid = insert(baseline_schema.orders, order_id="ORD-2", amount=250.0, status="completed", created_at=created_at)
+        transaction = insert(
+            baseline_schema.transactions, ref_id="REF-1", amount=250.0, status="verified",
+            matched_order_id=paid, created_at=created_at
+        )
+        verification = insert(
+            baseline_schema.slip_verifications, transaction_id=transaction, qr_found=True, qr_amount=250.0,
+            order_amount=250.0, amount_difference=0.0, status="verified", created_at=created_at,
+            updated_at=created_at
+        )
+
+    run_migrations(engine)
+
+    assert schema_differences(engine) == []
+    with Session(engine) as db:
+        pending, completed = db.execute(select(Order).order_by(Order.id)).scalars().all()
+        assert (pending.amount_satang, completed.amount_satang) == (10037, 25000)
+        assert pending.expires_at is not None and completed.expires_at is None
+        assert pending.qr_payload is None
+        assert db.get(Transaction, transaction).amount_satang == 25000
+        slip = db.get(SlipVerification, verification)
+        assert (slip.qr_amount_satang, slip.ocr_status) == (25000, "done")
+
+        # Columns and tables added since the baseline are usable through the models
+        db.add(SlipVerification(transaction_id=None, qr_found=True, perceptual_hash="00ff00ff00ff00ff",
+                                duplicate_of_id=verification, ocr_status="deferred"))
+        db.add(AmountSlot(amount_satang=3_000_000_047, order_id="ORD-3", created_at=datetime.utcnow()))
+        db.add(Order(order_id="ORD-3", amount_satang=3_000_000_047, status=OrderStatus.pending))
+        db.commit()
+
+    # Notifications are stamped by the database as they are inserted
+    with engine.begin() as connection:
+        received_at = connection.execute(Transaction.__table__.insert().values(
+            ref_id="REF-2", amount_satang=100, status="pending_slip"
+        ).returning(Transaction.created_at)).scalar()
+    assert abs(received_at - datetime.utcnow()) < timedelta(minutes=1)
+
+
+def test_interrupted_migrations_reapply(engine):
+    # Every migration must be safe to re-run when it finished but was not recorded
+    run_migrations(engine)
+    with engine.begin() as connection:
+        connection.execute(SchemaMigration.__table__.delete())
+
+    assert len(run_migrations(engine)) == len(MIGRATIONS)
+    assert schema_differences(engine) == []
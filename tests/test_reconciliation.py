@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from amount_slots import AmountSlotAllocator
+from database import Base
+from models import Order, OrderStatus, ReconciliationWatermark, Transaction, TransactionStatus
+from reconciliation import WATERMARK, NotificationReconciler, create_watermark
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/reconcile.db")
+    Base.metadata.create_all(bind=engine)
+    create_watermark(engine)
+    with Session(engine) as db:
+        yield db
+    engine.dispose()
+
+
+def notification(db: Session, ref_id: str, amount_satang: int, **values) -> Transaction:
+    transaction = Transaction(ref_id=ref_id, amount_satang=amount_satang, status=TransactionStatus.pending_slip, **values)
+    db.add(transaction)
+    db.flush()
+    return transaction
+
+
+def test_pairs_only_fitting_unrivalled_notifications():
+    reconciler = NotificationReconciler(None, None, window_minutes=60)
+    t = datetime(2026, 10, 17, 12, 0)
+    orders = [(1, 100, t), (2, 200, t), (3, 200, t)]
+    notifications = [
+        (10, 100, t + timedelta(minutes=1)),
+        (11, 100, t - timedelta(minutes=5)),  # before the order: no rival for 10
+        (12, 200, t + timedelta(minutes=1)),  # two orders of its amount
+        (13, 300, t + timedelta(minutes=1)),  # no order
+    ]
+
+    assert reconciler.pair(notifications, orders) == ([(10, 1)], 1)
+
+
+def test_notification_committed_behind_the_watermark_is_reconciled(db):
+    reconciler = NotificationReconciler(AmountSlotAllocator(), None, settle_seconds=0, rescan_seconds=300)
+    order = Order(order_id="ORD-1", amount_satang=10037, status=OrderStatus.pending,
+                  created_at=datetime.utcnow() - timedelta(minutes=1))
+    db.add(order)
+    notification(db, "N-2", 999, id=2)
+    db.commit()
+    assert reconciler.reconcile(db).scanned == 1
+    db.commit()
+    assert db.get(ReconciliationWatermark, WATERMARK).last_id == 2
+
+    # Id 1 commits after the watermark has passed it
+    notification(db, "N-1", 10037, id=1)
+    db.commit()
+    assert reconciler.reconcile(db, rescan=False).matched == 0
+    db.rollback()
+
+    batch = reconciler.reconcile(db)
+    db.commit()
+
+    assert (batch.scanned, batch.rescanned, batch.matched) == (0, 2, 1)
+    assert db.get(Order, order.id).status == OrderStatus.completed
+    assert db.get(Transaction, 1).matched_order_id == order.id
+    assert db.get(ReconciliationWatermark, WATERMARK).last_id == 2
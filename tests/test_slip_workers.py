@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+import pytest
+
+from slip_workers import AnalysisTimeout, SlipAnalysisPool
+
+
+@pytest.fixture
+def pool():
+    try:
+        import qr_reader  # noqa: F401  (the workers' warm-up imports it)
+    except ImportError as e:  # pyzbar without the zbar shared library
+        pytest.skip(str(e))
+    pool = SlipAnalysisPool(workers=1, queue_size=0, timeout=60)
+    yield pool
+    pool.shutdown()
+
+
+def test_timed_out_task_frees_its_slot_and_worker(pool):
+    async def scenario():
+        assert await pool.run(pow, 2, 3) == 8  # workers started and warmed up
+        stuck = pool._generation
+        pool.timeout = 1
+        with pytest.raises(AnalysisTimeout):
+            await pool.run(time.sleep, 600)
+        pool.timeout = 60
+        return stuck, pool.stats(), await pool.run(pow, 2, 10)
+
+    stuck, stats, result = asyncio.run(scenario())
+
+    # The slot came back at the timeout, and the next slip ran in a fresh executor
+    assert (stats["in_flight"], stats["timed_out"], stats["stuck_executors_killed"]) == (0, 1, 1)
+    assert result == 1024
+    assert pool._generation is not stuck
+    for process in stuck.processes:
+        process.join(10)
+        assert not process.is_alive()
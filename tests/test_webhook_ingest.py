@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import Base
+from models import Transaction
+from notification_parser import NotificationTemplateRegistry
+from webhook_ingest import NotificationWriter, parse_notification
+
+TOO_LARGE = 2 ** 63  # one past BIGINT; SQLite cannot bind it
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    path = tmp_path / "webhook.db"
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def row(timestamp: int, text: str = "เงินเข้า 100.50 บาท"):
+    return parse_notification(text, timestamp).row
+
+
+def test_amounts_too_long_for_bigint_are_not_parsed():
+    registry = NotificationTemplateRegistry()
+
+    assert registry.parse("เงินเข้า 99999999999999999999 บาท") is None
+    assert registry.parse("Money in THB 99999999999999999999") is None
+    assert registry.parse("เงินเข้า 999,999,999,999,999.99 บาท").amount_satang == 99_999_999_999_999_999
+    assert registry.parse("เงินเข้า 1,500.50 บาท เวลา 12:00").amount_satang == 150050
+
+
+def test_a_failing_row_does_not_fail_its_group(session_factory):
+    async def scenario():
+        writer = NotificationWriter(session_factory, max_delay_ms=50)
+        bad = row(2)
+        bad["amount_satang"] = TOO_LARGE
+        results = await asyncio.gather(
+            writer.submit(row(1)), writer.submit(bad), writer.submit(row(3)), writer.submit(row(1)),
+            return_exceptions=True
+        )
+        async with session_factory() as db:
+            stored = (await db.execute(select(func.count()).select_from(Transaction))).scalar()
+        return writer, results, stored
+
+    writer, (first, failed, third, repeat), stored = asyncio.run(scenario())
+
+    assert isinstance(failed, Exception)
+    assert first[1] and third[1]
+    assert repeat == (first[0], False)
+    assert stored == 2
+    assert (writer.notifications, writer.failures, writer.duplicates) == (3, 1, 1)
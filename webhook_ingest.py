@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Transaction, TransactionStatus
+from notification_parser import ParsedNotification, get_notification_registry
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT: 6 columns each stays under SQLite's 32766 bind parameters
+INSERT_CHUNK = 1000
+
+
+class NotificationRow:
+    """A bank notification parsed into the transactions row it records"""
+
+    __slots__ = ("notification", "row")
+
+    def __init__(self, notification: ParsedNotification, row: Dict):
+        self.notification = notification
+        self.row = row
+
+    @property
+    def ref_id(self) -> str:
+        return self.row["ref_id"]
+
+
+def parse_notification(text: str, timestamp: int, now: Optional[datetime] = None) -> Optional[NotificationRow]:
+    """The transactions row for one notification, or None when no bank template recognises its text"""
+    notification = get_notification_registry().parse(text)
+    if notification is None:
+        return None
+    now = now or datetime.utcnow()
+    return NotificationRow(notification, {
+        # In real scenario, this would come from the bank notification
+        "ref_id": f"{timestamp}_{notification.amount_satang}",
+        "amount_satang": notification.amount_satang,
+        "bank_id": None,  # Will be extracted from slip QR
+        "status": TransactionStatus.pending_slip,
+        "notification_text": text,
+        "updated_at": now,  # created_at: the database's insert time
+    })
+
+
+async def record_notifications(db: AsyncSession, rows: List[Dict]) -> List[Tuple[int, bool]]:
+    """
+    Insert transactions rows, skipping ref_ids already recorded; the caller commits
+
+    INSERT ... ON CONFLICT (ref_id) DO NOTHING RETURNING, so new rows cost
+    one statement per INSERT_CHUNK and no lookup. Only when some ref_ids
+    were already there is one SELECT issued, for their transaction ids.
+
+    Returns:
+        (transaction id, inserted by this call) per row, in order; a ref_id
+        repeated within rows is inserted once, later copies are duplicates
+    """
+    first: Dict[str, Dict] = {}
+    for row in rows:
+        first.setdefault(row["ref_id"], row)
+    unique = list(first.values())
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    inserted: Dict[str, int] = {}
+    for start in range(0, len(unique), INSERT_CHUNK):
+        statement = dialect.insert(Transaction).values(unique[start:start + INSERT_CHUNK]).on_conflict_do_nothing(
+            index_elements=[Transaction.ref_id]
+        ).returning(Transaction.ref_id, Transaction.id)
+        inserted.update((await db.execute(statement)).all())
+
+    existing: Dict[str, int] = {}
+    already = [row["ref_id"] for row in unique if row["ref_id"] not in inserted]
+    if already:
+        existing = dict((await db.execute(
+            select(Transaction.ref_id, Transaction.id).where(Transaction.ref_id.in_(already))
+        )).all())
+
+    results = []
+    for row in rows:
+        ref_id = row["ref_id"]
+        if ref_id in inserted:
+            results.append((inserted.pop(ref_id), True))
+            existing[ref_id] = results[-1][0]
+        else:
+            results.append((existing[ref_id], False))
+    return results
+
+
+async def record_each(db: AsyncSession, rows: List[Dict]) -> List[Union[Tuple[int, bool], Exception]]:
+    """
+    record_notifications one row at a time, each committed on its own
+
+    The fallback when a group insert fails: one bad row (an amount out of
+    range, a text too long for the column) then only fails itself, and
+    the rows beside it are still recorded.
+
+    Returns:
+        per row, in order, its record_notifications result or the exception
+        that rolled it back
+    """
+    results: List[Union[Tuple[int, bool], Exception]] = []
+    for row in rows:
+        try:
+            results.extend(await record_notifications(db, [row]))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            results.append(e)
+    return results
+
+
+class NotificationWriter:
+    """
+    Group commit for notifications arriving one request at a time
+
+    A notification waits up to max_delay_ms for others; together they are
+    written with one record_notifications call and one commit in a session
+    of their own, and each request gets its own row's result. A batch that
+    reaches max_batch is written at once. When the group fails it is
+    written again row by row (record_each), so only the requests whose
+    rows fail get the error. Batches are written concurrently
+    with the next one filling, each on its own connection.
+    """
+
+    def __init__(self, session_factory, max_delay_ms: float = 5.0, max_batch: int = 200):
+        self.session_factory = session_factory
+        self.max_delay = max_delay_ms / 1000
+        self.max_batch = max_batch
+        self._buffer: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes = set()
+        self.notifications = 0
+        self.commits = 0
+        self.duplicates = 0
+        self.failures = 0
+
+    @classmethod
+    def from_settings(cls, session_factory) -> "NotificationWriter":
+        return cls(
+            session_factory,
+            max_delay_ms=settings.WEBHOOK_GROUP_COMMIT_MS,
+            max_batch=settings.WEBHOOK_GROUP_COMMIT_MAX,
+        )
+
+    async def submit(self, row: Dict) -> Tuple[int, bool]:
+        """(transaction id, newly inserted) once the row's group has committed"""
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((row, future))
+        if len(self._buffer) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if batch:
+            write = asyncio.create_task(self._write(batch))
+            self._writes.add(write)
+            write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        try:
+            async with self.session_factory() as db:
+                results = await record_notifications(db, rows)
+                await db.commit()
+            self.commits += 1
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} notifications failed, writing them one by one: {str(e)}")
+            try:
+                async with self.session_factory() as db:
+                    results = await record_each(db, rows)
+            except Exception as e:  # no session at all: every request gets the error
+                results = [e] * len(rows)
+            self.commits += sum(not isinstance(result, Exception) for result in results)
+
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                self.failures += 1
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            self.notifications += 1
+            self.duplicates += not result[1]
+            if not future.done():  # the request may have gone away
+                future.set_result(result)
+
+    async def close(self):
+        """Write what is buffered and wait for writes in flight (app shutdown)"""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "notifications": self.notifications,
+            "commits": self.commits,
+            "per_commit": round(self.notifications / self.commits, 1) if self.commits else 0.0,
+            "duplicates": self.duplicates,
+            "failures": self.failures,
+            "buffered": len(self._buffer),
+        }